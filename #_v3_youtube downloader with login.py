@@ -1,7 +1,14 @@
 import os
 import re
 import pytube
-import youtube_dl
+import http_transport
+import json_extract
+import login_fallback
+import otf_download
+from playlist_pipeline import PlaylistPipeline
+from playlist_sync import PlaylistSync
+import response_cache
+import stream_size
 
 def extract_video_id(video_url):
     # Check if the URL contains a playlist
@@ -45,14 +52,8 @@ def download_youtube_video(video_url, download_directory, resolution):
         username = input("Enter your YouTube username: ")
         password = input("Enter your YouTube password: ")
 
-        # Use youtube-dl to download the video
-        ydl_opts = {
-            'username': username,
-            'password': password,
-        }
-        with youtube_dl.YoutubeDL(ydl_opts) as ydl:
-            # Download the video
-            ydl.download([video_url])
+        # Use youtube-dl to download the video; it is only imported here
+        login_fallback.download(video_url, username, password)
 
     except pytube.exceptions.VideoUnavailable as e:
         print(f"The video is unavailable: {video_url}")
@@ -70,23 +71,41 @@ def download_youtube_playlist(playlist_url, download_directory, resolution):
     """
     try:
         playlist_id = extract_video_id(playlist_url)
-        playlist = pytube.Playlist(playlist_id)
+        playlist = PlaylistSync(playlist_id)
         playlist_name = re.sub(r'\W+', '-', playlist.title)
         playlist_directory = os.path.join(download_directory, playlist_name)
 
         if not os.path.exists(playlist_directory):
             os.mkdir(playlist_directory)
 
-        for index, video_url in enumerate(playlist.video_urls, start=1):
-            try:
-                download_youtube_video(video_url, playlist_directory, resolution)
-            except Exception as e:
-                print(f"An error occurred while downloading a video in the playlist: {e}")
+        def select_stream(streams):
+            video_streams = streams.filter(res=resolution, progressive=True)
+            if not video_streams:
+                return streams.get_highest_resolution()
+            return video_streams.first()
+
+        # Resolve and download several videos at the same time.
+        pipeline = PlaylistPipeline(select_stream=select_stream,
+                                    filename=lambda index, video, video_stream: video_stream.default_filename)
+        for result in pipeline.run(playlist.video_urls(), playlist_directory):
+            if isinstance(result.error, pytube.exceptions.AgeRestrictedError):
+                # The login fallback prompts for credentials, so run it one video at a time.
+                download_youtube_video(result.video_url, playlist_directory, resolution)
+            elif result.error:
+                print(f"An error occurred while downloading a video in the playlist: {result.error}")
 
     except Exception as e:
         print(f"An error occurred while downloading the playlist: {e}")
 
 if __name__ == "__main__":
+    # Reuse keep-alive connections for every pytube request.
+    http_transport.install()
+    json_extract.install()
+    stream_size.install()
+    otf_download.install()
+    # Retries and re-runs reuse recent watch pages and player responses.
+    response_cache.install()
+
     option = input(
         "Do you want to download a single video or a playlist? Enter 'video' or 'playlist': ").strip().lower()
 
@@ -0,0 +1,266 @@
+"""Fetch the video and audio tracks of an adaptive format and mux them on the fly.
+
+ffmpeg reads both tracks from named pipes while two feeder threads fill them
+with ranged (or OTF) reads, so only the merged file touches the disk. On
+Windows, which has no ``os.mkfifo``, the tracks go to temp files first.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from otf_download import OTFDownloader
+from segmented_download import SegmentedDownloader
+
+FFMPEG = "ffmpeg"
+STDERR_TAIL = 2000
+# Per track: ranges fetched at once, each held in memory until it is piped.
+DEFAULT_CONNECTIONS = 4
+DEFAULT_SEGMENT_SIZE = 2 * 1024 * 1024
+# Containers a video track is muxed in, with an audio track of the same one.
+MUX_SUBTYPES = ("mp4", "webm")
+
+
+class MuxError(Exception):
+    """Raised when ffmpeg fails or one of the tracks can not be fetched."""
+
+
+def ffmpeg_available(ffmpeg=FFMPEG):
+    return shutil.which(ffmpeg) is not None
+
+
+def _height(stream):
+    return int(stream.resolution.rstrip("p")) if stream.resolution else 0
+
+
+def select_adaptive(streams, resolution=None):
+    """Pick the best video-only track up to ``resolution`` and the best audio for it.
+
+    MP4 video goes with MP4 audio and WebM with WebM, preferring MP4 at the
+    same resolution; above 1080p YouTube usually only has WebM.
+
+    Args:
+        streams: The ``StreamQuery`` of a video.
+        resolution: A label such as ``"1080p"``; None picks the highest.
+
+    Returns:
+        ``(video_stream, audio_stream)``, either of them None if missing.
+    """
+    audio = {subtype: streams.filter(only_audio=True, subtype=subtype).order_by("abr").desc().first()
+             for subtype in MUX_SUBTYPES}
+    videos = sorted((video for video in streams.filter(adaptive=True, only_video=True)
+                     if audio.get(video.subtype) is not None),
+                    key=lambda video: (_height(video), video.subtype == "mp4"), reverse=True)
+    if not videos:
+        return None, audio["mp4"] or audio["webm"]
+    if resolution is not None:
+        limit = int(resolution.rstrip("p"))
+        videos = [video for video in videos if _height(video) <= limit] or videos[-1:]
+    return videos[0], audio[videos[0].subtype]
+
+
+def track_chunks(stream, throttle=None, should_stop=None, connections=DEFAULT_CONNECTIONS,
+                 segment_size=DEFAULT_SEGMENT_SIZE):
+    """The bytes of a track in order: parallel ranges, or prefetched OTF segments.
+
+    ``throttle`` is called with the size of every read before it is made.
+    """
+    if stream.is_otf:
+        return OTFDownloader(should_stop=should_stop, throttle=throttle).segments(stream.url)
+    downloader = SegmentedDownloader(connections=connections, segment_size=segment_size,
+                                     should_stop=should_stop)
+    return downloader.stream(stream.url, stream.filesize if stream._filesize else None, throttle)
+
+
+class AdaptiveMuxer:
+    def __init__(self, ffmpeg=FFMPEG, use_fifo=None, on_progress=None, should_stop=None,
+                 scheduler=None, weight=1, connections=DEFAULT_CONNECTIONS,
+                 segment_size=DEFAULT_SEGMENT_SIZE):
+        """Configure the muxer.
+
+        Args:
+            ffmpeg: The ffmpeg executable.
+            use_fifo: Stream through named pipes; defaults to True where
+                ``os.mkfifo`` exists.
+            on_progress: Called with the size of every chunk of either track.
+            should_stop: Returns True when the download should stop early.
+            scheduler: A ``bandwidth.BandwidthScheduler`` both tracks draw from.
+            weight: Each track's share of the scheduler against other jobs.
+            connections: Ranges of each track fetched at the same time.
+            segment_size: The size of those ranges; each is held in memory
+                until it is written to the pipe.
+        """
+        self.ffmpeg = ffmpeg
+        self.use_fifo = hasattr(os, "mkfifo") if use_fifo is None else use_fifo
+        self.on_progress = on_progress
+        self.should_stop = should_stop or (lambda: False)
+        self.scheduler = scheduler
+        self.weight = weight
+        self.connections = connections
+        self.segment_size = segment_size
+
+    def download(self, video_stream, audio_stream, output_path):
+        """Write the merged file to ``output_path``; returns False if stopped early.
+
+        A stopped or failed download leaves no output file behind.
+        """
+        with tempfile.TemporaryDirectory(prefix="mux-") as work_dir:
+            video_path = os.path.join(work_dir, "video." + video_stream.subtype)
+            audio_path = os.path.join(work_dir, "audio." + audio_stream.subtype)
+            try:
+                if self.use_fifo:
+                    os.mkfifo(video_path)
+                    os.mkfifo(audio_path)
+                    completed = self._mux_streaming(video_stream, audio_stream,
+                                                    video_path, audio_path, output_path)
+                else:
+                    completed = self._mux_from_files(video_stream, audio_stream,
+                                                     video_path, audio_path, output_path)
+            except BaseException:
+                self._remove(output_path)
+                raise
+        if not completed:
+            self._remove(output_path)
+        return completed
+
+    def _mux_streaming(self, video_stream, audio_stream, video_path, audio_path, output_path):
+        with tempfile.TemporaryFile() as stderr:
+            process = self._start_ffmpeg(video_path, audio_path, output_path, stderr)
+            feeders = [_Feeder(stream, path, self) for stream, path in
+                       ((video_stream, video_path), (audio_stream, audio_path))]
+            for feeder in feeders:
+                feeder.start()
+            try:
+                while any(feeder.is_alive() for feeder in feeders):
+                    for feeder in feeders:
+                        feeder.join(0.1)
+                    failed = any(feeder.error or feeder.stopped for feeder in feeders)
+                    if failed:
+                        # Tear ffmpeg down so it can't finish a truncated file.
+                        process.kill()
+                    if failed or process.poll() is not None:
+                        # Unblock any writer still waiting on its pipe.
+                        for feeder in feeders:
+                            feeder.release()
+                if any(feeder.error or feeder.stopped for feeder in feeders):
+                    process.kill()
+                returncode = process.wait()
+            finally:
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+                for feeder in feeders:
+                    feeder.release()
+                    feeder.join()
+
+            errors = [feeder.error for feeder in feeders if feeder.error]
+            if any(feeder.stopped for feeder in feeders) and not errors:
+                return False
+            if errors:
+                raise MuxError(f"Fetching a track failed: {errors[0]}") from errors[0]
+            self._check(returncode, stderr)
+        return True
+
+    def _mux_from_files(self, video_stream, audio_stream, video_path, audio_path, output_path):
+        feeders = [_Feeder(stream, path, self) for stream, path in
+                   ((video_stream, video_path), (audio_stream, audio_path))]
+        for feeder in feeders:
+            feeder.start()
+        for feeder in feeders:
+            feeder.join()
+        errors = [feeder.error for feeder in feeders if feeder.error]
+        if errors:
+            raise MuxError(f"Fetching a track failed: {errors[0]}") from errors[0]
+        if any(feeder.stopped for feeder in feeders):
+            return False
+        with tempfile.TemporaryFile() as stderr:
+            process = self._start_ffmpeg(video_path, audio_path, output_path, stderr)
+            self._check(process.wait(), stderr)
+        return True
+
+    def _start_ffmpeg(self, video_path, audio_path, output_path, stderr):
+        command = [self.ffmpeg, "-nostdin", "-loglevel", "error", "-y",
+                   "-i", video_path, "-i", audio_path,
+                   "-map", "0:v:0", "-map", "1:a:0", "-c", "copy", output_path]
+        # stderr goes to a file, a full pipe would stall ffmpeg mid-mux.
+        return subprocess.Popen(command, stdin=subprocess.DEVNULL,  # nosec
+                                stdout=subprocess.DEVNULL, stderr=stderr)
+
+    def _check(self, returncode, stderr):
+        if returncode != 0:
+            stderr.seek(0)
+            message = stderr.read().decode("utf-8", "replace")[-STDERR_TAIL:]
+            raise MuxError(f"ffmpeg exited with {returncode}: {message}")
+
+    def _remove(self, path):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class _Feeder(threading.Thread):
+    """Copies one track into its pipe or temp file."""
+
+    def __init__(self, stream, path, muxer):
+        super().__init__(daemon=True)
+        self.stream = stream
+        self.path = path
+        self.muxer = muxer
+        self.error = None
+        self.stopped = False
+        self._released = False
+
+    def run(self):
+        muxer = self.muxer
+        bandwidth = muxer.scheduler.job(f"{self.path}:{id(self)}", muxer.weight) if muxer.scheduler else None
+        throttle = (lambda n: self._throttle(bandwidth, n)) if bandwidth else None
+        chunks = track_chunks(self.stream, throttle, lambda: self._released or muxer.should_stop(),
+                              muxer.connections, muxer.segment_size)
+        try:
+            with open(self.path, "wb") as f:
+                for chunk in chunks:
+                    if self._released:
+                        return
+                    if muxer.should_stop():
+                        self.stopped = True
+                        return
+                    f.write(chunk)
+                    if muxer.on_progress:
+                        muxer.on_progress(len(chunk))
+            # The track ends early when it is stopped.
+            if muxer.should_stop() and not self._released:
+                self.stopped = True
+        except BrokenPipeError as e:
+            if not self._released:
+                self.error = e
+        except Exception as e:
+            self.error = e
+        finally:
+            chunks.close()
+            if bandwidth:
+                bandwidth.close()
+
+    def _throttle(self, bandwidth, n):
+        # Charged before each read. Like ``BandwidthJob.acquire``, but gives up
+        # once the mux is torn down or stopped, so a paused feeder doesn't
+        # hold up the cleanup.
+        while not self._released and not self.muxer.should_stop():
+            delay = bandwidth.reserve(n)
+            if not delay:
+                return
+            time.sleep(delay)
+
+    def release(self):
+        # A writer blocks in open() until a reader opens the FIFO. Opening
+        # (and closing) the read end lets it through after ffmpeg is gone,
+        # and its next write fails with a broken pipe.
+        if self._released or not self.is_alive():
+            self._released = True
+            return
+        self._released = True
+        try:
+            fd = os.open(self.path, os.O_RDONLY | getattr(os, "O_NONBLOCK", 0))
+        except OSError:
+            return
+        os.close(fd)
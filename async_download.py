@@ -0,0 +1,421 @@
+"""asyncio download engine on top of aiohttp.
+
+``AsyncDownloadManager`` runs ranged and OTF transfers as tasks on one event
+loop and one connection pool, with the same resume state as
+``segmented_download``. Checkpoint fsyncs run on a worker thread.
+``SyncDownloadManager`` runs the loop on a background thread for the
+blocking scripts.
+"""
+import asyncio
+import io
+import json
+import os
+import threading
+from collections import deque
+from urllib.error import HTTPError
+
+import aiohttp
+from pytube import request
+from pytube.exceptions import MaxRetriesExceeded
+
+from http_transport import BASE_HEADERS
+from manifest_cache import is_forbidden
+from otf_download import DEFAULT_PREFETCH, OTFDownloadError
+from segmented_download import (DEFAULT_CONNECTIONS, DEFAULT_SEGMENT_SIZE, SegmentedDownloadError,
+                                PartsFile, preallocate, split_ranges)
+from stream_size import SEGMENT_COUNT_PATTERN, segment_url, size_from_headers
+import tracing
+from transfer import MIN_BLOCK_SIZE, write_all
+
+DEFAULT_CONNECTIONS_PER_HOST = 64
+DEFAULT_MAX_TRANSFERS = 256
+RETRIABLE_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, OSError)
+# OTF checkpoints are stored with this ``segment_size``; ranged ones never use 0.
+OTF_LAYOUT = 0
+OTF_CHECKPOINT_SEGMENTS = 8
+
+
+class AsyncClient:
+    def __init__(self, connections_per_host=DEFAULT_CONNECTIONS_PER_HOST, timeout=30):
+        """Create the client; the session is opened on first use inside the loop.
+
+        Args:
+            connections_per_host: The most connections kept open to one host;
+                further requests wait for a free connection.
+            timeout: Seconds to wait for a connection or for the next bytes.
+        """
+        self.connections_per_host = connections_per_host
+        self.timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=0, limit_per_host=self.connections_per_host)
+            self._session = aiohttp.ClientSession(connector=connector, headers=BASE_HEADERS,
+                                                  timeout=self.timeout)
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def request(self, method, url, headers=None, data=None):
+        """Open a response; the caller reads and releases it.
+
+        Error statuses raise ``urllib.error.HTTPError`` like ``urlopen`` does.
+        """
+        if data and not isinstance(data, bytes):
+            data = bytes(json.dumps(data), encoding="utf-8")
+        if not url.lower().startswith("http"):
+            raise ValueError("Invalid URL")
+        response = await self.session.request(method, url, headers=headers, data=data or None)
+        tracing.count("http_requests", host=tracing.host_kind(url), method=method,
+                      status=response.status)
+        if response.status >= 400:
+            body = await response.read()
+            response.release()
+            raise HTTPError(url, response.status, response.reason, response.headers, io.BytesIO(body))
+        return response
+
+    async def get(self, url, extra_headers=None):
+        """Async ``pytube.request.get``."""
+        async with await self.request("GET", url, headers=extra_headers) as response:
+            return (await response.read()).decode("utf-8")
+
+    async def post(self, url, extra_headers=None, data=None):
+        """Async ``pytube.request.post``."""
+        headers = dict(extra_headers or {})
+        headers["Content-Type"] = "application/json"
+        async with await self.request("POST", url, headers=headers, data=data or {}) as response:
+            return (await response.read()).decode("utf-8")
+
+    async def filesize(self, url):
+        """Size of a ranged stream from a single one byte request."""
+        async with await self.request("GET", url, headers={"Range": "bytes=0-0"}) as response:
+            return size_from_headers(response.headers, response.status)
+
+    async def stream(self, url, max_retries=0):
+        """Async ``pytube.request.stream``: 9 MB range windows, sized by the first."""
+        file_size = None
+        downloaded = 0
+        while file_size is None or downloaded < file_size:
+            stop_pos = downloaded + request.default_range_size - 1
+            if file_size is not None:
+                stop_pos = min(stop_pos, file_size - 1)
+            response = await self._open_window(url, downloaded, stop_pos, max_retries)
+            async with response:
+                if file_size is None:
+                    file_size = size_from_headers(response.headers, response.status) or 0
+                window_start = downloaded
+                async for chunk in response.content.iter_chunked(MIN_BLOCK_SIZE):
+                    downloaded += len(chunk)
+                    yield chunk
+            if downloaded == window_start:
+                return
+
+    async def _open_window(self, url, start, stop, max_retries):
+        for _ in range(1 + max_retries):
+            try:
+                return await self.request("GET", url, headers={"Range": f"bytes={start}-{stop}"})
+            except (asyncio.TimeoutError, aiohttp.ClientPayloadError):
+                tracing.count("retries", kind="window")
+        raise MaxRetriesExceeded()
+
+
+class AsyncDownloadManager:
+    def __init__(self, client=None, connections=DEFAULT_CONNECTIONS, segment_size=DEFAULT_SEGMENT_SIZE,
+                 max_transfers=DEFAULT_MAX_TRANSFERS, prefetch=DEFAULT_PREFETCH,
+                 block_size=MIN_BLOCK_SIZE, max_retries=3, state_store=None, scheduler=None):
+        """Configure the engine.
+
+        Args:
+            client: The ``AsyncClient`` to fetch with.
+            connections: Ranges of one file fetched at the same time.
+            segment_size: The size of one resumable range in bytes.
+            max_transfers: Range and segment requests running at once over
+                all files.
+            prefetch: OTF segments fetched ahead of the one being written.
+            block_size: Bytes handed to the file per write.
+            max_retries: Attempts per range or segment before giving up.
+            state_store: Where the resume state is kept, ``.parts`` files by
+                default.
+            scheduler: A ``bandwidth.BandwidthScheduler`` every transfer
+                draws its bytes from; each file is one job named by its path.
+        """
+        self.client = client or AsyncClient()
+        self.connections = connections
+        self.segment_size = segment_size
+        self.prefetch = prefetch
+        self.block_size = block_size
+        self.max_retries = max_retries
+        self.state_store = state_store or PartsFile()
+        self.scheduler = scheduler
+        self._transfers = asyncio.Semaphore(max_transfers)
+
+    async def download(self, url, path, total_size=None, on_progress=None, should_stop=None,
+                       weight=1):
+        """Fetch a ranged stream to ``path``; returns False if stopped early.
+
+        The partial file and its resume state are kept when stopped or
+        failed, so calling ``download`` again resumes it.
+        """
+        should_stop = should_stop or (lambda: False)
+        if not total_size:
+            total_size = await self.client.filesize(url)
+
+        written = self.state_store.load(path, total_size, self.segment_size)
+        if not preallocate(path, total_size):
+            written = {}
+        pending = [(start, end) for start, end in split_ranges(total_size, self.segment_size)
+                   if written.get(start, 0) < end - start + 1]
+        already_done = sum(written.values())
+        if on_progress and already_done:
+            on_progress(already_done)
+
+        slots = asyncio.Semaphore(self.connections)
+        bandwidth = self._bandwidth_job(path, weight)
+        with open(path, "r+b", buffering=0) as f:
+            tasks = [asyncio.ensure_future(self._fetch_range(url, f, start, end, written, slots,
+                                                             bandwidth, on_progress, should_stop))
+                     for start, end in pending]
+            try:
+                for task in asyncio.as_completed(tasks):
+                    await task
+                    await self._save_state(f, path, total_size, written)
+            except BaseException:
+                # Stop the other ranges, they resume on the next call.
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+            finally:
+                await self._save_state(f, path, total_size, written)
+                if bandwidth:
+                    bandwidth.close()
+
+        if sum(written.values()) < total_size:
+            return False
+        self.state_store.clear(path)
+        return True
+
+    async def download_segments(self, url, path, on_progress=None, should_stop=None, weight=1,
+                                on_total=None):
+        """Fetch an OTF stream to ``path`` in order; returns False if stopped early.
+
+        ``on_total`` is called with the expected size once the first segment
+        arrived (from the header's ``Segment-Count``), and with the exact
+        size at the end; no segment is probed for it.
+        """
+        should_stop = should_stop or (lambda: False)
+        bandwidth = self._bandwidth_job(path, weight)
+        try:
+            return await self._download_segments(url, path, bandwidth, on_progress, should_stop,
+                                                 on_total)
+        finally:
+            if bandwidth:
+                bandwidth.close()
+
+    async def _download_segments(self, url, path, bandwidth, on_progress, should_stop, on_total):
+        header = await self._fetch_segment(segment_url(url, 0), bandwidth)
+        match = SEGMENT_COUNT_PATTERN.search(header)
+        if not match:
+            raise OTFDownloadError(f"No Segment-Count in the header of {url}")
+        count = int(match.group(1))
+
+        # ``{next segment: file size before it}`` of an earlier, interrupted call.
+        next_sq, offset = next(iter(self.state_store.load(path, count, OTF_LAYOUT).items()),
+                               (1, None))
+        if offset is None or not os.path.exists(path) or os.path.getsize(path) < offset:
+            next_sq, offset = 1, None
+        pending = deque()
+        try:
+            with open(path, "r+b" if offset is not None else "wb", buffering=0) as f:
+                if offset is None:
+                    self._write(f, header, on_progress)
+                else:
+                    # Drop a segment that was only partly written.
+                    f.truncate(offset)
+                    f.seek(offset)
+                    if on_progress:
+                        on_progress(offset)
+                written_sq = next_sq - 1
+                estimated = False
+                try:
+                    while next_sq <= count or pending:
+                        while next_sq <= count and len(pending) < self.prefetch:
+                            pending.append(asyncio.ensure_future(
+                                self._fetch_segment(segment_url(url, next_sq), bandwidth)))
+                            next_sq += 1
+                        if should_stop():
+                            return False
+                        segment = await pending.popleft()
+                        self._write(f, segment, on_progress)
+                        written_sq += 1
+                        if on_total and not estimated:
+                            on_total(f.tell() + (count - written_sq) * len(segment))
+                            estimated = True
+                        if written_sq % OTF_CHECKPOINT_SEGMENTS == 0:
+                            await self._save_segments(f, path, count, written_sq)
+                finally:
+                    if written_sq < count:
+                        await self._save_segments(f, path, count, written_sq)
+        finally:
+            for task in pending:
+                task.cancel()
+        self.state_store.clear(path)
+        if on_total:
+            on_total(os.path.getsize(path))
+        return True
+
+    async def download_stream(self, stream, path, on_progress=None, should_stop=None, weight=1):
+        """Fetch a ``pytube.Stream`` with whichever transfer it needs."""
+        if stream.is_otf:
+            return await self.download_segments(stream.url, path, on_progress, should_stop, weight)
+        return await self.download(stream.url, path, stream._filesize, on_progress, should_stop,
+                                   weight)
+
+    def _bandwidth_job(self, path, weight):
+        return self.scheduler.job(path, weight) if self.scheduler else None
+
+    async def _fetch_range(self, url, f, start, end, written, slots, bandwidth,
+                           on_progress, should_stop):
+        tries = 0
+        async with slots, self._transfers:
+            while True:
+                offset = start + written.get(start, 0)
+                if offset > end or should_stop():
+                    return
+                try:
+                    response = await self.client.request("GET", url,
+                                                         headers={"Range": f"bytes={offset}-{end}"})
+                    async with response:
+                        if response.status != 206 and offset > 0:
+                            raise SegmentedDownloadError(f"Server ignored range request for {url}")
+                        while True:
+                            # A paused job parks here with its connection still open.
+                            if bandwidth:
+                                await bandwidth.acquire_async(self.block_size)
+                            block = await response.content.read(self.block_size)
+                            if not block:
+                                break
+                            position = start + written.get(start, 0)
+                            block = block[:end - position + 1]
+                            # No await between seek and write, so ranges can share ``f``.
+                            f.seek(position)
+                            self._write(f, block, on_progress)
+                            written[start] = written.get(start, 0) + len(block)
+                            if should_stop() or position + len(block) > end:
+                                break
+                    if should_stop():
+                        return
+                    if start + written.get(start, 0) <= end:
+                        raise SegmentedDownloadError(f"Connection closed early at byte {offset}")
+                    return
+                except (*RETRIABLE_ERRORS, SegmentedDownloadError) as e:
+                    if is_forbidden(e):
+                        raise SegmentedDownloadError(f"Range {start}-{end} failed: {e}") from e
+                    tries += 1
+                    tracing.count("retries", kind="range")
+                    if tries > self.max_retries:
+                        raise SegmentedDownloadError(f"Range {start}-{end} failed: {e}") from e
+
+    async def _fetch_segment(self, url, bandwidth=None):
+        tries = 0
+        async with self._transfers:
+            while True:
+                try:
+                    async with await self.client.request("GET", url) as response:
+                        if not bandwidth:
+                            return await response.read()
+                        segment = bytearray()
+                        while True:
+                            # Charged before each read, like a range's blocks.
+                            await bandwidth.acquire_async(self.block_size)
+                            block = await response.content.read(self.block_size)
+                            if not block:
+                                return bytes(segment)
+                            segment += block
+                except RETRIABLE_ERRORS as e:
+                    if is_forbidden(e):
+                        raise OTFDownloadError(f"Segment {url} failed: {e}") from e
+                    tries += 1
+                    tracing.count("retries", kind="segment")
+                    if tries > self.max_retries:
+                        raise OTFDownloadError(f"Segment {url} failed: {e}") from e
+
+    async def _save_state(self, f, path, total_size, written):
+        # The counts are taken on the loop, so they only cover bytes written
+        # before the fsync. Flushing and the state store's (SQLite) write run
+        # on a worker thread; the loop keeps serving the other transfers.
+        await asyncio.to_thread(self._checkpoint, f, path, total_size, dict(written))
+
+    async def _save_segments(self, f, path, count, written_sq):
+        await asyncio.to_thread(self._checkpoint, f, path, count, {written_sq + 1: f.tell()},
+                                OTF_LAYOUT)
+
+    def _checkpoint(self, f, path, total_size, written, segment_size=None):
+        # Record only counts whose bytes are already on the disk.
+        os.fsync(f.fileno())
+        if segment_size is None:
+            segment_size = self.segment_size
+        self.state_store.save(path, total_size, segment_size, written)
+
+    def _write(self, f, block, on_progress):
+        write_all(f, block)
+        if on_progress:
+            on_progress(len(block))
+
+
+class SyncDownloadManager:
+    """Blocking facade over an ``AsyncDownloadManager``.
+
+    The event loop runs on one daemon thread. Calls from any number of
+    threads become tasks on that loop, so their transfers share one
+    connection pool and one ``max_transfers`` limit. Callbacks run on the
+    loop thread.
+    """
+
+    def __init__(self, manager=None):
+        self.manager = manager or AsyncDownloadManager()
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def download(self, url, path, total_size=None, on_progress=None, should_stop=None, weight=1):
+        return self._run(self.manager.download(url, path, total_size, on_progress, should_stop,
+                                               weight))
+
+    def download_segments(self, url, path, on_progress=None, should_stop=None, weight=1,
+                          on_total=None):
+        return self._run(self.manager.download_segments(url, path, on_progress, should_stop, weight,
+                                                        on_total))
+
+    def download_stream(self, stream, path, on_progress=None, should_stop=None, weight=1):
+        return self._run(self.manager.download_stream(stream, path, on_progress, should_stop, weight))
+
+    def close(self):
+        with self._lock:
+            if self._loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self.manager.client.close(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = self._thread = None
+
+    def _run(self, coroutine):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever,
+                                                name="async-download", daemon=True)
+                self._thread.start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
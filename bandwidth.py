@@ -0,0 +1,160 @@
+"""Shared bandwidth cap for every running transfer.
+
+All transfers draw from one token bucket, in proportion to their weight
+(start-time fair queuing). Time windows can change the rate, and pausing a
+job parks it before its next read without closing its connection.
+"""
+import asyncio
+import datetime
+import threading
+import time
+
+PAUSE_POLL = 0.25
+CONTENDED_WAIT = 0.005
+
+
+def parse_schedule(schedule):
+    """Turn ``[("08:00", "23:00", rate), ...]`` into ``datetime.time`` windows."""
+    return [(datetime.time.fromisoformat(start), datetime.time.fromisoformat(end), rate)
+            for start, end, rate in schedule]
+
+
+class BandwidthJob:
+    """One transfer's share of a ``BandwidthScheduler``."""
+
+    def __init__(self, scheduler, name, weight, vtime):
+        self.scheduler = scheduler
+        self.name = name
+        self.weight = weight
+        self.vtime = vtime
+        self.paused = False
+        self.waiting = False
+
+    def reserve(self, n):
+        return self.scheduler.reserve(self, n)
+
+    def acquire(self, n):
+        """Block until ``n`` bytes may be read."""
+        while True:
+            delay = self.reserve(n)
+            if not delay:
+                return
+            with self.scheduler._cond:
+                self.scheduler._cond.wait(delay)
+
+    async def acquire_async(self, n):
+        while True:
+            delay = self.reserve(n)
+            if not delay:
+                return
+            await asyncio.sleep(delay)
+
+    def pause(self):
+        self.scheduler.pause(self.name)
+
+    def resume(self):
+        self.scheduler.resume(self.name)
+
+    def close(self):
+        self.scheduler.remove(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class BandwidthScheduler:
+    def __init__(self, rate=None, burst=None, schedule=()):
+        """Configure the cap.
+
+        Args:
+            rate: Bytes per second shared by all transfers, None for no cap.
+            burst: The most tokens that can pile up, one second's worth of
+                the current rate by default.
+            schedule: ``(start, end, rate)`` windows such as
+                ``("08:00", "23:00", 2 * 1024 * 1024)``; outside of every
+                window ``rate`` applies. Windows may wrap past midnight.
+                A rate of 0 holds every transfer until the rate changes.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.schedule = parse_schedule(schedule)
+        self.paused = False
+        self._cond = threading.Condition()
+        self._jobs = {}
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+
+    def current_rate(self, now=None):
+        now = now or datetime.datetime.now().time()
+        for start, end, rate in self.schedule:
+            if start <= now < end or (end < start and (now >= start or now < end)):
+                return rate
+        return self.rate
+
+    def job(self, name, weight=1):
+        """Register a transfer; it starts level with the jobs already running."""
+        with self._cond:
+            vtime = min((job.vtime for job in self._jobs.values()), default=0.0)
+            job = BandwidthJob(self, name, weight, vtime)
+            self._jobs[name] = job
+            return job
+
+    def remove(self, job):
+        with self._cond:
+            if self._jobs.get(job.name) is job:
+                del self._jobs[job.name]
+            self._cond.notify_all()
+
+    def pause(self, name=None):
+        """Park one job, or every job when ``name`` is None."""
+        with self._cond:
+            if name is None:
+                self.paused = True
+            elif name in self._jobs:
+                self._jobs[name].paused = True
+
+    def resume(self, name=None):
+        with self._cond:
+            if name is None:
+                self.paused = False
+            elif name in self._jobs:
+                self._jobs[name].paused = False
+            self._cond.notify_all()
+
+    def reserve(self, job, n):
+        """Take ``n`` tokens for ``job`` if it may read now.
+
+        Returns 0 when the bytes were granted, otherwise the seconds to wait
+        before asking again.
+        """
+        with self._cond:
+            rate = self.current_rate()
+            # A rate of 0 (e.g. a "no downloads" window) parks transfers like a pause.
+            if self.paused or job.paused or rate == 0:
+                return PAUSE_POLL
+            if rate is None:
+                job.vtime += n / job.weight
+                return 0
+
+            now = time.monotonic()
+            burst = self.burst or rate
+            self._tokens = min(burst, self._tokens + (now - self._updated) * rate)
+            self._updated = now
+
+            job.waiting = True
+            if any(other.waiting and not other.paused and other.vtime < job.vtime
+                   for other in self._jobs.values() if other is not job):
+                # A job that is behind its share goes first.
+                return max(CONTENDED_WAIT, min(n, burst) / rate / 4)
+            need = min(n, burst)
+            if self._tokens < need:
+                return (need - self._tokens) / rate
+            # Large reads may overdraw; the debt is paid back before the next grant.
+            self._tokens -= n
+            job.vtime += n / job.weight
+            job.waiting = False
+            self._cond.notify_all()
+            return 0
@@ -0,0 +1,246 @@
+"""Concurrent stream resolution for many videos at once.
+
+``BatchResolver`` calls ``InnerTube.player`` on a thread pool with one
+shared client, fetches a watch page only when a stream needs signing, and
+returns each video with a ready ``IndexedStreamQuery``.
+"""
+import copy
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from pytube import Caption, CaptionQuery, extract, request
+from pytube import exceptions
+from pytube.innertube import InnerTube
+from pytube.monostate import Monostate
+
+import resolver
+import response_cache
+from compact_streams import CompactStream, IndexedStreamQuery
+from manifest_cache import default_cache as default_manifest_cache
+from player_cache import default_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 16
+# How long the player script URL of a watch page is reused; YouTube rotates players.
+JS_URL_TTL = 30 * 60
+# ``playabilityStatus`` reasons, as ``YouTube.check_availability`` matches them.
+AGE_GATE_REASON = "Sign in to confirm your age"
+PRIVATE_REASON = "This is a private video. Please sign in to verify that you may see it."
+MEMBERS_ONLY_REASON = ("Join this channel to get access to members-only content "
+                       "like this video, and other exclusive perks.")
+RECORDING_REASON = "This live stream recording is not available."
+
+
+def playability_error(video_id, vid_info):
+    """The pytube exception for a player response without streams."""
+    playability = vid_info.get("playabilityStatus", {})
+    status = playability.get("status")
+    reason = playability.get("reason") or ""
+    if status == "LIVE_STREAM" or "liveStreamability" in playability:
+        return exceptions.LiveStreamError(video_id)
+    if status in ("AGE_CHECK_REQUIRED", "AGE_VERIFICATION_REQUIRED") or reason.startswith(AGE_GATE_REASON):
+        return exceptions.AgeRestrictedError(video_id)
+    if status == "LOGIN_REQUIRED" and reason == PRIVATE_REASON:
+        return exceptions.VideoPrivate(video_id)
+    if status == "UNPLAYABLE" and reason == MEMBERS_ONLY_REASON:
+        return exceptions.MembersOnly(video_id)
+    if status == "UNPLAYABLE" and reason == RECORDING_REASON:
+        return exceptions.RecordingUnavailable(video_id)
+    return exceptions.VideoUnavailable(video_id)
+
+
+def video_id_of(video_url):
+    """Accept both watch URLs and bare 11 character video IDs."""
+    if "/" not in video_url and "=" not in video_url:
+        return video_url
+    return extract.video_id(video_url)
+
+
+class ResolvedVideo:
+    """Player response and streams of one video; ``error`` is set if it failed."""
+
+    def __init__(self, video_id):
+        self.video_id = video_id
+        self.watch_url = f"https://youtube.com/watch?v={video_id}"
+        self.vid_info = None
+        self.streams = None
+        self.error = None
+
+    @property
+    def title(self):
+        return self.vid_info["videoDetails"]["title"]
+
+    @property
+    def length(self):
+        return int(self.vid_info["videoDetails"].get("lengthSeconds", 0))
+
+    @property
+    def captions(self):
+        """Same as ``YouTube.captions``."""
+        tracks = (self.vid_info.get("captions", {})
+                  .get("playerCaptionsTracklistRenderer", {})
+                  .get("captionTracks", []))
+        return CaptionQuery([Caption(track) for track in tracks])
+
+    def __repr__(self):
+        status = f"error={self.error!r}" if self.error else f"{len(self.streams or [])} streams"
+        return f"<ResolvedVideo {self.video_id}: {status}>"
+
+
+class BatchResolver:
+    def __init__(self, workers=DEFAULT_WORKERS, client="ANDROID_MUSIC", use_oauth=False,
+                 allow_oauth_cache=True, player_cache=default_cache,
+                 manifest_cache=default_manifest_cache,
+                 on_progress_callback=None, on_complete_callback=None):
+        self.workers = workers
+        # Bounds the requests of resolve_one and resolve_player, whichever
+        # threads they are called from.
+        self._slots = threading.BoundedSemaphore(workers)
+        self.client = client
+        self.innertube = InnerTube(client=client, use_oauth=use_oauth, allow_cache=allow_oauth_cache)
+        self.embed_innertube = InnerTube(client="ANDROID_EMBED", use_oauth=use_oauth,
+                                         allow_cache=allow_oauth_cache)
+        self.player_cache = player_cache
+        self.manifest_cache = manifest_cache
+        self.on_progress_callback = on_progress_callback
+        self.on_complete_callback = on_complete_callback
+        self._js_url = None
+        self._js_url_expires = 0
+        self._js_url_lock = threading.Lock()
+
+    def resolve(self, video_urls):
+        """Resolve every URL or video ID concurrently, in input order."""
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(self._resolve_safely, video_urls))
+
+    def resolve_one(self, video_url):
+        """Resolve a single URL or ID; raises the pytube error on failure."""
+        video_id = video_id_of(video_url)
+        cached = self.manifest_cache.get(video_id, self.client) if self.manifest_cache else None
+        if cached is not None:
+            # Only ``videoDetails`` and ``captions`` of ``vid_info`` are kept.
+            video = ResolvedVideo(video_id)
+            video.vid_info = cached.vid_info
+            stream_manifest = cached.streams
+        else:
+            video = self.resolve_player(video_url)
+            with self._slots:
+                stream_manifest = self._signed_manifest(video)
+            if self.manifest_cache:
+                self.manifest_cache.put(video_id, self.client, stream_manifest, video.vid_info)
+
+        monostate = Monostate(on_progress=self.on_progress_callback,
+                              on_complete=self.on_complete_callback,
+                              title=video.title, duration=video.length)
+        video.streams = IndexedStreamQuery([CompactStream(stream=stream, monostate=monostate)
+                                            for stream in stream_manifest])
+        return video
+
+    def refresh(self, video_url):
+        """Resolve again, bypassing the caches, e.g. after a stream URL was refused."""
+        if self.manifest_cache:
+            self.manifest_cache.invalidate(video_id_of(video_url), self.client)
+        with response_cache.fresh():
+            return self.resolve_one(video_url)
+
+    def resolve_player(self, video_url, require_streams=True):
+        """Only fetch the player response (title, captions), without the streams.
+
+        Args:
+            video_url: A watch URL or video ID.
+            require_streams: Raise like ``resolve_one`` for videos that can't
+                be played. When False, the response of an unplayable (e.g.
+                age restricted) video is returned as long as it has the
+                video's details, which is all captions need.
+        """
+        video = ResolvedVideo(video_id_of(video_url))
+        with self._slots:
+            video.vid_info = self._player(video.video_id, require_streams)
+        return video
+
+    def _signed_manifest(self, video):
+        # Descramble a copy so a failed attempt leaves the player response untouched.
+        stream_manifest = extract.apply_descrambler(copy.deepcopy(video.vid_info["streamingData"]))
+        if any(resolver.needs_signature(stream) for stream in stream_manifest):
+            js_url = self._player_js_url(video.watch_url)
+            try:
+                self._sign(stream_manifest, video, js_url)
+            except exceptions.ExtractError:
+                # Same as ``YouTube._signed_manifest``: the player may have
+                # changed, look it up and parse it again.
+                logger.debug("cached cipher failed for %s, refreshing", js_url)
+                self.player_cache.invalidate(js_url)
+                js_url = self._player_js_url(video.watch_url, stale=js_url)
+                stream_manifest = extract.apply_descrambler(
+                    copy.deepcopy(video.vid_info["streamingData"]))
+                self._sign(stream_manifest, video, js_url)
+        return stream_manifest
+
+    def _sign(self, stream_manifest, video, js_url):
+        # Looked up on the module so ``tracing.install`` can wrap it.
+        resolver.apply_signature(stream_manifest, video.vid_info,
+                                 self.player_cache.get_cipher(js_url),
+                                 self.player_cache.get_n_transform(js_url),
+                                 self.player_cache.get_signature_transform(js_url))
+
+    def _resolve_safely(self, video_url):
+        try:
+            return self.resolve_one(video_url)
+        except Exception as e:
+            video = ResolvedVideo(video_id_of(video_url))
+            video.error = e
+            return video
+
+    def _player(self, video_id, require_streams=True):
+        vid_info = self.innertube.player(video_id)
+        if "streamingData" not in vid_info:
+            # Same fallback as YouTube.bypass_age_gate.
+            embed_info = self.embed_innertube.player(video_id)
+            if not require_streams:
+                return self._details(video_id, vid_info, embed_info)
+            if "streamingData" not in embed_info:
+                raise self._unavailable(video_id, vid_info, embed_info)
+            vid_info = embed_info
+        if vid_info.get("videoDetails", {}).get("isLive"):
+            raise exceptions.LiveStreamError(video_id)
+        return vid_info
+
+    def _details(self, video_id, vid_info, embed_info):
+        # Unplayable responses may still carry the details and caption tracks.
+        with_details = [response for response in (embed_info, vid_info) if "videoDetails" in response]
+        if with_details:
+            return next((response for response in with_details if "captions" in response),
+                        with_details[0])
+        raise self._unavailable(video_id, vid_info, embed_info)
+
+    def _unavailable(self, video_id, vid_info, embed_info):
+        # The client's own response says why; the embedded player's only
+        # adds that an UNPLAYABLE video is age restricted, as in
+        # YouTube.bypass_age_gate.
+        error = playability_error(video_id, vid_info)
+        if (type(error) is exceptions.VideoUnavailable
+                and embed_info.get("playabilityStatus", {}).get("status") == "UNPLAYABLE"):
+            return exceptions.AgeRestrictedError(video_id)
+        return error
+
+    def _player_js_url(self, watch_url, stale=None):
+        """The player script URL, looked up once per ``JS_URL_TTL`` for the batch.
+
+        Args:
+            watch_url: A watch page to look it up on.
+            stale: A URL known not to work; it is looked up again if it is
+                still the current one.
+        """
+        # Every video of a batch is served by the same player.
+        with self._js_url_lock:
+            if (self._js_url is None or self._js_url == stale
+                    or self._js_url_expires <= time.time()):
+                # A stale URL may come from a stored watch page; fetch a new one.
+                with response_cache.fresh() if stale is not None else nullcontext():
+                    self._js_url = extract.js_url(request.get(watch_url))
+                self._js_url_expires = time.time() + JS_URL_TTL
+            return self._js_url
@@ -0,0 +1,548 @@
+"""Offline throughput benchmarks against a local googlevideo stand-in.
+
+``GoogleVideoStub`` serves a watch page, player response, player script and
+media (``Range``, ``range=``, ``sq=`` segments, ``redirect=1``) well enough
+for pytube, and can throttle, delay or cut off responses. Each benchmark
+runs in a fresh process with its own ``HOME``.
+
+Usage::
+
+    python benchmark.py                          # all benchmarks
+    python benchmark.py request.stream --size 128 --throttle 4 --latency 0.05
+    python benchmark.py --fail-rate 0.02         # cut off 2% of responses
+    python benchmark.py --stock                  # unpatched pytube, for comparison
+    python benchmark.py --startup                # import time of the scripts
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import parse
+
+MB = 1024 * 1024
+VIDEO_ID = "bEnChMaRk00"
+PATTERN = random.Random(0).randbytes(MB)
+CHUNK_SIZE = 64 * 1024
+BENCHMARKS = ("request.stream", "request.seq_stream", "Stream.download", "DownloadManager.download")
+
+# Script, and the modules it must not import before it is used.
+GUI_DEFERRED = ("aiohttp", "pytube", "requests", "urllib3", "youtube_dl")
+STARTUP_SCRIPTS = (
+    ("v6.py", GUI_DEFERRED),
+    ("v5_single_video_playlist_gui_download.py", GUI_DEFERRED),
+    ("yt_video_dl_v4_with_HUI_v4.py", GUI_DEFERRED),
+    ("#_v3_youtube downloader with login.py", ("aiohttp", "requests", "youtube_dl")),
+)
+IMPORT_BUDGET_MS = 150
+PLAYER_JS_PATH = "/s/player/bEnChMaRk/player_ias.vflset/en_US/base.js"
+# Just enough of a player script for ``pytube.cipher.Cipher`` to parse, which
+# stock pytube does even when every URL is already signed.
+PLAYER_JS = """var Bz={rv:function(a){a.reverse()}, sp:function(a,b){a.splice(0,b)}};
+Qz=function(a){a=a.split("");Bz.rv(a,1);Bz.sp(a,2);return a.join("")};
+var Np=[Nz];
+Nz=function(a){var b=a.split(""),c=[function(d){d.reverse()},null,b];try{c[0](c[2])}catch(e){return"x"+a}return b.join("")};
+g.n=function(a){a.C&&(b=a.get("n"))&&(b=Np[0](b),a.set("n",b))};
+g.s=function(a,b,c,d){c&&d.set(b,encodeURIComponent(Qz(a.s)))};
+"""
+STARTUP_RUNS = 5
+
+
+def media_chunks(start, end):
+    """Deterministic media bytes ``start..end`` (inclusive) in chunks."""
+    position = start
+    while position <= end:
+        offset = position % len(PATTERN)
+        length = min(CHUNK_SIZE, len(PATTERN) - offset, end - position + 1)
+        yield PATTERN[offset:offset + length]
+        position += length
+
+
+def make_player_response(base_url, size, segment_count, segment_size):
+    """A player response with one progressive and one OTF stream on ``base_url``."""
+    playback = f"{base_url}/videoplayback?id={VIDEO_ID}&expire={int(time.time()) + 6 * 3600}"
+    return {
+        "playabilityStatus": {"status": "OK"},
+        "videoDetails": {"videoId": VIDEO_ID, "title": "Benchmark video", "lengthSeconds": "600",
+                         "author": "benchmark", "channelId": "UCbenchmark", "viewCount": "0",
+                         "isLiveContent": False},
+        "streamingData": {
+            "expiresInSeconds": "21540",
+            "formats": [{
+                "itag": 18, "url": f"{playback}&itag=18&clen={size}&ratebypass=yes&sig=bench",
+                "mimeType": 'video/mp4; codecs="avc1.42001E, mp4a.40.2"', "bitrate": 500000,
+                "width": 640, "height": 360, "contentLength": str(size), "quality": "medium",
+                "fps": 30, "qualityLabel": "360p", "averageBitrate": 500000,
+                "audioQuality": "AUDIO_QUALITY_LOW", "approxDurationMs": "600000",
+                "audioSampleRate": "44100", "audioChannels": 2,
+            }],
+            "adaptiveFormats": [{
+                "itag": 137,
+                "url": f"{playback}&itag=137&otf=1&segments={segment_count}"
+                       f"&segsize={segment_size}&ratebypass=yes&sig=bench",
+                "mimeType": 'video/mp4; codecs="avc1.640028"', "bitrate": 4000000,
+                "width": 1920, "height": 1080, "quality": "hd1080", "fps": 30,
+                "qualityLabel": "1080p", "type": "FORMAT_STREAM_TYPE_OTF",
+                "approxDurationMs": "600000",
+            }],
+        },
+    }
+
+
+def make_watch_html(player_response):
+    status = json.dumps({"playabilityStatus": player_response["playabilityStatus"]})
+    return (f'<html><head><script src="{PLAYER_JS_PATH}"></script></head><body>'
+            f"<script>var ytInitialPlayerResponse = {status};</script></body></html>")
+
+
+def load_fixture(path, base_url):
+    """Watch page, player response and player script from a pytube mock fixture.
+
+    Media URLs are pointed at the stub; the stub then sizes each stream by
+    its ``clen``.
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        fixture = json.load(f)
+    vid_info = json.loads(re.sub(r"https://[^/\"]+\.googlevideo\.com", base_url,
+                                 json.dumps(fixture["vid_info"])))
+    return fixture["watch_html"], vid_info, fixture.get("js")
+
+
+class GoogleVideoStub(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, size=64 * MB, segment_count=60, segment_size=512 * 1024,
+                 throttle=None, latency=0.0, fail_rate=0.0, fixture=None):
+        """Start listening on a free local port.
+
+        Args:
+            size: Media size in bytes when a URL has no ``clen``.
+            segment_count: Segments of OTF streams, after the header segment.
+            segment_size: Bytes per OTF segment.
+            throttle: Bytes per second per connection, None for no limit.
+            latency: Seconds before each response starts.
+            fail_rate: Share of media responses cut off halfway.
+            fixture: A ``create_mock_html_json`` file to serve instead of the
+                built-in watch page and player response.
+        """
+        super().__init__(("127.0.0.1", 0), _StubHandler)
+        self.base_url = f"http://127.0.0.1:{self.server_port}"
+        self.size = size
+        self.throttle = throttle
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.random = random.Random(1)
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        self.player_js = None
+        if fixture:
+            self.watch_html, self.player_response, self.player_js = load_fixture(fixture, self.base_url)
+        else:
+            self.player_response = make_player_response(self.base_url, size, segment_count,
+                                                        segment_size)
+            self.watch_html = make_watch_html(self.player_response)
+            self.player_js = PLAYER_JS
+
+    def count(self, kind):
+        with self._lock:
+            self.requests[kind] += 1
+
+    def take_counts(self):
+        with self._lock:
+            counts, self.requests = self.requests, Counter()
+        return counts
+
+    def should_fail(self):
+        with self._lock:
+            return self.random.random() < self.fail_rate
+
+    def handle_error(self, request, client_address):
+        # Clients drop connections on purpose (probes, stops); don't log them.
+        pass
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="googlevideo-stub", daemon=True).start()
+        return self
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def do_GET(self, head=False):
+        url = parse.urlsplit(self.path)
+        query = {k: v[0] for k, v in parse.parse_qs(url.query).items()}
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if url.path == "/watch":
+            self.server.count("watch")
+            self._send(200, self.server.watch_html.encode(), "text/html", head=head)
+        elif url.path.endswith("base.js") and self.server.player_js:
+            self.server.count("player")
+            self._send(200, self.server.player_js.encode(), "text/javascript", head=head)
+        elif url.path == "/videoplayback":
+            self.server.count("media")
+            self._media(query, head)
+        else:
+            self.server.count("other")
+            self._send(404, b"", "text/plain", head=head)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.path.startswith("/youtubei/v1/player"):
+            self.server.count("player_api")
+            self._send(200, json.dumps(self.server.player_response).encode(), "application/json")
+        else:
+            self.server.count("other")
+            self._send(404, b"", "text/plain")
+
+    def _media(self, query, head):
+        if "redirect" in query:
+            # Like redirector.googlevideo.com, send the client on to the media.
+            del query["redirect"]
+            self.send_response(302)
+            self.send_header("Location", f"/videoplayback?{parse.urlencode(query)}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if "sq" in query:
+            self._segment(query, head)
+            return
+        size = int(query.get("clen", self.server.size))
+        start, end, status = 0, size - 1, 200
+        if "range" in query:
+            # googlevideo answers a ``range=`` parameter with a plain 200.
+            first, last = query["range"].split("-")
+            start, end = int(first), min(int(last), size - 1)
+        elif self.headers.get("Range"):
+            first, last = self.headers["Range"].split("=", 1)[1].split("-")
+            start, end, status = int(first), min(int(last or size - 1), size - 1), 206
+        self.send_response(status)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(end - start + 1))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        if not head:
+            self._write_body(media_chunks(start, end), end - start + 1)
+
+    def _segment(self, query, head):
+        sq = int(query["sq"])
+        count = int(query.get("segments", 60))
+        segment_size = int(query.get("segsize", 512 * 1024))
+        if sq == 0:
+            body = f"Segment-Count: {count}\r\nSequence-Number: 0\r\n\r\n".encode()
+            body += bytes(segment_size - len(body))
+            chunks = [body]
+        elif sq <= count:
+            chunks = list(media_chunks(sq * segment_size, (sq + 1) * segment_size - 1))
+        else:
+            self._send(404, b"", "text/plain", head=head)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(segment_size))
+        self.end_headers()
+        if not head:
+            self._write_body(chunks, segment_size)
+
+    def _write_body(self, chunks, length):
+        cut_at = length // 2 if self.server.should_fail() else None
+        throttle = self.server.throttle
+        sent = 0
+        started = time.perf_counter()
+        for chunk in chunks:
+            if cut_at is not None and sent + len(chunk) > cut_at:
+                self.wfile.write(chunk[:cut_at - sent])
+                self.close_connection = True
+                return
+            self.wfile.write(chunk)
+            sent += len(chunk)
+            if throttle:
+                ahead = sent / throttle - (time.perf_counter() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+    def _send(self, status, body, content_type, head=False):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+
+# Benchmarks; these run in the child process.
+
+def route_to(base_url):
+    """Send every youtube.com and googlevideo request to the stub."""
+    from pytube import request
+
+    execute_request = request._execute_request
+    pattern = re.compile(r"^https?://(?:(?:www|m)\.)?youtube\.com|^https?://[^/]+\.googlevideo\.com")
+
+    def routed(url, *args, **kwargs):
+        return execute_request(pattern.sub(base_url, url), *args, **kwargs)
+
+    request._execute_request = routed
+
+
+def youtube_class(stock):
+    """``pytube.YouTube`` for stock runs, this project's resolver otherwise."""
+    if stock:
+        from pytube import YouTube
+    else:
+        from resolver import YouTube
+    return YouTube
+
+
+def stream_url(base_url, itag, stock):
+    from pytube import extract
+
+    YouTube = youtube_class(stock)
+    for stream in extract.apply_descrambler(YouTube(f"{base_url}/watch?v={VIDEO_ID}").streaming_data):
+        if stream["itag"] == itag:
+            return stream["url"]
+    raise LookupError(f"No itag {itag} in the player response")
+
+
+def bench_request_stream(base_url, work_dir, stock):
+    from pytube import request
+
+    url = stream_url(base_url, 18, stock)
+    return sum(len(chunk) for chunk in request.stream(url))
+
+
+def bench_request_seq_stream(base_url, work_dir, stock):
+    from pytube import request
+
+    url = stream_url(base_url, 137, stock)
+    return sum(len(chunk) for chunk in request.seq_stream(url))
+
+
+def bench_stream_download(base_url, work_dir, stock):
+    YouTube = youtube_class(stock)
+    stream = YouTube(f"https://www.youtube.com/watch?v={VIDEO_ID}").streams.get_by_itag(18)
+    return os.path.getsize(stream.download(output_path=work_dir))
+
+
+class _Value:
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def __setitem__(self, key, value):
+        pass
+
+
+class _Lines:
+    def __init__(self):
+        self.lines = []
+
+    def insert(self, index, text):
+        self.lines.append(text)
+
+
+def bench_download_manager(base_url, work_dir, stock):
+    if stock:
+        # What DownloadManager.download did before this project's engine.
+        from pytube import YouTube
+
+        stream = YouTube(f"https://www.youtube.com/watch?v={VIDEO_ID}").streams.get_highest_resolution()
+        return os.path.getsize(stream.download(output_path=work_dir))
+
+    import v6
+
+    # The progressive path; the adaptive one depends on a local ffmpeg.
+    v6.adaptive_mux.ffmpeg_available = lambda: False
+    messages = _Lines()
+    manager = v6.DownloadManager(_Value(0), _Value("720p"), messages)
+    manager.download_directory = work_dir
+    manager.download(f"https://www.youtube.com/watch?v={VIDEO_ID}")
+    if not any(line.startswith("Download completed") for line in messages.lines):
+        raise RuntimeError("".join(messages.lines) or "download did not complete")
+    manager.engine.close()
+    return sum(os.path.getsize(os.path.join(work_dir, name)) for name in os.listdir(work_dir))
+
+
+BENCHMARK_FUNCTIONS = {
+    "request.stream": bench_request_stream,
+    "request.seq_stream": bench_request_seq_stream,
+    "Stream.download": bench_stream_download,
+    "DownloadManager.download": bench_download_manager,
+}
+
+
+def resource_usage():
+    """CPU seconds and peak RSS in MB of this process (RSS is None on Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return time.process_time(), None
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss is in KiB on Linux and in bytes on macOS.
+    peak_rss = usage.ru_maxrss / (MB if sys.platform == "darwin" else 1024)
+    return usage.ru_utime + usage.ru_stime, peak_rss
+
+
+def run_child(name, base_url, stock):
+    if not stock:
+        import http_transport
+        import json_extract
+        import otf_download
+        import stream_size
+
+        http_transport.install()
+        json_extract.install()
+        stream_size.install()
+        otf_download.install()
+    route_to(base_url)
+
+    cpu_before, _ = resource_usage()
+    with tempfile.TemporaryDirectory() as work_dir:
+        started = time.perf_counter()
+        transferred = BENCHMARK_FUNCTIONS[name](base_url, work_dir, stock)
+        elapsed = time.perf_counter() - started
+    cpu_after, peak_rss = resource_usage()
+    json.dump({"bytes": transferred, "seconds": elapsed, "cpu_seconds": cpu_after - cpu_before,
+               "peak_rss_mb": peak_rss}, sys.stdout)
+
+
+def run_benchmark(server, name, stock):
+    server.take_counts()
+    with tempfile.TemporaryDirectory() as home:
+        env = dict(os.environ, HOME=home, USERPROFILE=home)
+        command = [sys.executable, os.path.abspath(__file__), "--child", name,
+                   "--base-url", server.base_url]
+        if stock:
+            command.append("--stock")
+        completed = subprocess.run(command, capture_output=True, text=True, env=env,
+                                   cwd=os.path.dirname(os.path.abspath(__file__)))
+    counts = server.take_counts()
+    if completed.returncode != 0:
+        return {"name": name, "error": completed.stderr.strip().splitlines()[-1:]}
+    result = json.loads(completed.stdout)
+    result.update(name=name, requests=sum(counts.values()), media_requests=counts["media"],
+                  mb_per_second=result["bytes"] / MB / result["seconds"])
+    return result
+
+
+def print_table(results):
+    print(f"{'benchmark':<26}{'MB':>8}{'s':>8}{'MB/s':>9}{'reqs':>7}{'media':>7}"
+          f"{'cpu s':>8}{'rss MB':>8}")
+    for result in results:
+        if "error" in result:
+            print(f"{result['name']:<26}  failed: {' '.join(result['error'])}")
+            continue
+        rss = f"{result['peak_rss_mb']:.0f}" if result["peak_rss_mb"] is not None else "-"
+        print(f"{result['name']:<26}{result['bytes'] / MB:>8.1f}{result['seconds']:>8.2f}"
+              f"{result['mb_per_second']:>9.1f}{result['requests']:>7}{result['media_requests']:>7}"
+              f"{result['cpu_seconds']:>8.2f}{rss:>8}")
+
+
+IMPORT_PROBE = """
+import importlib.util, json, sys, time
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location("script", sys.argv[1])
+spec.loader.exec_module(importlib.util.module_from_spec(spec))
+elapsed = time.perf_counter() - started
+loaded = [name for name in sys.argv[2:]
+          if name in sys.modules and type(sys.modules[name]).__name__ != "_LazyModule"]
+print(json.dumps({"ms": elapsed * 1000, "loaded": loaded}))
+"""
+
+
+def measure_startup(script, deferred, runs=STARTUP_RUNS):
+    """Median milliseconds to import ``script`` in a fresh interpreter."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    samples = []
+    for _ in range(runs):
+        completed = subprocess.run([sys.executable, "-c", IMPORT_PROBE, os.path.join(here, script),
+                                    *deferred], capture_output=True, text=True, cwd=here, check=True)
+        samples.append(json.loads(completed.stdout))
+    samples.sort(key=lambda sample: sample["ms"])
+    return samples[len(samples) // 2]
+
+
+def run_startup(budget, as_json):
+    """Check every script against the import budget; returns the exit status."""
+    results = []
+    for script, deferred in STARTUP_SCRIPTS:
+        result = measure_startup(script, deferred)
+        result.update(script=script, ok=result["ms"] <= budget and not result["loaded"])
+        results.append(result)
+    if as_json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        print(f"{'script':<44}{'import ms':>10}  eagerly imported")
+        for result in results:
+            flag = "" if result["ok"] else "  OVER BUDGET" if not result["loaded"] else "  FAIL"
+            print(f"{result['script']:<44}{result['ms']:>10.1f}  {', '.join(result['loaded']) or '-'}{flag}")
+    return 0 if all(result["ok"] for result in results) else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("benchmarks", nargs="*", metavar="benchmark",
+                        help=f"any of {', '.join(BENCHMARKS)}; all by default")
+    parser.add_argument("--size", type=float, default=64, help="media size in MB")
+    parser.add_argument("--segments", type=int, default=60, help="OTF segment count")
+    parser.add_argument("--segment-size", type=float, default=0.5, help="OTF segment size in MB")
+    parser.add_argument("--throttle", type=float, help="per-connection limit in MB/s")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before each response")
+    parser.add_argument("--fail-rate", type=float, default=0.0,
+                        help="share of media responses cut off halfway")
+    parser.add_argument("--fixture", help="a pytube create_mock_html_json .json.gz file")
+    parser.add_argument("--stock", action="store_true", help="don't install this project's patches")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--startup", action="store_true",
+                        help="measure the scripts' import time instead of downloads")
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET_MS,
+                        help="milliseconds each script may take to import with --startup")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(sorted(unknown))}")
+    if args.startup:
+        sys.exit(run_startup(args.import_budget, args.json))
+    if args.child:
+        run_child(args.child, args.base_url, args.stock)
+        return
+
+    server = GoogleVideoStub(size=int(args.size * MB), segment_count=args.segments,
+                             segment_size=int(args.segment_size * MB),
+                             throttle=args.throttle * MB if args.throttle else None,
+                             latency=args.latency, fail_rate=args.fail_rate,
+                             fixture=args.fixture).start()
+    results = [run_benchmark(server, name, args.stock) for name in args.benchmarks or BENCHMARKS]
+    server.shutdown()
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        print_table(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""Concurrent caption download with streaming SRT and WebVTT conversion.
+
+``BulkCaptions`` resolves many videos and fetches their tracks on a thread
+pool. Each track is parsed as it arrives and written to every output
+format from a single fetch.
+"""
+import codecs
+import os
+import re
+import threading
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from html import unescape
+from json import JSONDecodeError, JSONDecoder
+from urllib import parse
+
+from pytube import request
+from pytube.helpers import safe_filename
+
+import tracing
+from batch_resolver import BatchResolver
+
+DEFAULT_WORKERS = 16
+DEFAULT_SOURCE = "json3"
+CHUNK_SIZE = 64 * 1024
+
+_decoder = JSONDecoder()
+_EVENTS = re.compile(r'"events"\s*:\s*\[')
+_SEPARATORS = re.compile(r"[\s,]*")
+
+
+def format_timestamp(ms, separator=","):
+    """``3890`` -> ``00:00:03,890``; WebVTT uses ``.`` as ``separator``."""
+    seconds, ms = divmod(ms, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%02d:%02d:%02d%s%03d" % (hours, minutes, seconds, separator, ms)
+
+
+def track_url(url, fmt):
+    """The caption track ``url`` with its ``fmt`` parameter set to ``fmt``."""
+    parts = parse.urlsplit(url)
+    query = [(key, value) for key, value in parse.parse_qsl(parts.query, keep_blank_values=True)
+             if key != "fmt"]
+    query.append(("fmt", fmt))
+    return parse.urlunsplit(parts._replace(query=parse.urlencode(query)))
+
+
+def _cue_text(text):
+    # A blank line would end the cue early in both formats.
+    return "\n".join(line.strip() for line in text.splitlines() if line and not line.isspace())
+
+
+class Json3CueParser:
+    """Turns ``fmt=json3`` bytes into ``(start_ms, end_ms, text)`` cues as they arrive."""
+
+    def __init__(self):
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._in_events = False
+        self._done = False
+
+    def feed(self, data):
+        self._buffer += self._text.decode(data)
+        return self._cues()
+
+    def close(self):
+        self._buffer += self._text.decode(b"", final=True)
+        cues = self._cues()
+        if not self._done:
+            raise ValueError("Truncated or malformed json3 captions")
+        return cues
+
+    def _cues(self):
+        cues = []
+        buffer = self._buffer
+        pos = 0
+        if not self._in_events:
+            match = _EVENTS.search(buffer)
+            if match is None:
+                return cues
+            self._in_events = True
+            pos = match.end()
+        while not self._done:
+            pos = _SEPARATORS.match(buffer, pos).end()
+            if pos == len(buffer):
+                break
+            if buffer[pos] == "]":
+                self._done = True
+                pos += 1
+                break
+            try:
+                event, pos = _decoder.raw_decode(buffer, pos)
+            except JSONDecodeError:
+                # The event isn't complete yet.
+                break
+            segments = event.get("segs")
+            if segments:
+                start = event.get("tStartMs", 0)
+                text = "".join(segment.get("utf8", "") for segment in segments)
+                cues.append((start, start + event.get("dDurationMs", 0), text))
+        self._buffer = buffer[pos:]
+        return cues
+
+
+class XmlCueParser:
+    """Same as ``Json3CueParser`` for ``fmt=srv3`` (and the older ``srv1``) XML."""
+
+    def __init__(self):
+        self._parser = ElementTree.XMLPullParser(("start", "end"))
+        self._open = []
+
+    def feed(self, data):
+        self._parser.feed(data)
+        return self._cues()
+
+    def close(self):
+        self._parser.close()
+        return self._cues()
+
+    def _cues(self):
+        cues = []
+        for event, element in self._parser.read_events():
+            if event == "start":
+                self._open.append(element)
+                continue
+            self._open.pop()
+            if element.tag == "p":
+                # srv3: times in milliseconds, text split over <s> elements.
+                start = int(element.get("t", 0))
+                end = start + int(element.get("d", 0))
+                text = "".join(element.itertext())
+            elif element.tag == "text":
+                # srv1: times in seconds, text escaped twice.
+                start = round(float(element.get("start", 0)) * 1000)
+                end = start + round(float(element.get("dur", 0)) * 1000)
+                text = element.text or ""
+                if "&" in text:
+                    text = unescape(text)
+            else:
+                continue
+            cues.append((start, end, text))
+            # Drop finished cues so a long track isn't kept in memory.
+            del self._open[-1][:]
+        return cues
+
+
+class SrtWriter:
+    def __init__(self, file):
+        self.file = file
+        self.count = 0
+
+    def write(self, start, end, text):
+        self.count += 1
+        self.file.write(f"{self.count}\n{format_timestamp(start)} --> {format_timestamp(end)}\n"
+                        f"{text}\n\n")
+
+
+class VttWriter:
+    def __init__(self, file):
+        self.file = file
+        self.file.write("WEBVTT\n\n")
+
+    def write(self, start, end, text):
+        text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+        self.file.write(f"{format_timestamp(start, '.')} --> {format_timestamp(end, '.')}\n"
+                        f"{text}\n\n")
+
+
+PARSERS = {"json3": Json3CueParser, "srv3": XmlCueParser}
+WRITERS = {"srt": SrtWriter, "vtt": VttWriter}
+
+
+def convert(chunks, writers, source=DEFAULT_SOURCE):
+    """Parse the caption ``chunks`` (bytes) and hand every cue to each writer.
+
+    Returns the number of cues written.
+    """
+    parser = PARSERS[source]()
+    written = 0
+    for cues in _parsed(parser, chunks):
+        for start, end, text in cues:
+            text = _cue_text(text)
+            if not text:
+                continue
+            for writer in writers:
+                writer.write(start, end, text)
+            written += 1
+    return written
+
+
+def _parsed(parser, chunks):
+    for chunk in chunks:
+        yield parser.feed(chunk)
+    yield parser.close()
+
+
+def _read_chunks(response, chunk_size=CHUNK_SIZE):
+    while True:
+        chunk = response.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def download_track(caption, path_stem, formats=("srt",), source=DEFAULT_SOURCE):
+    """Fetch one ``pytube.Caption`` and write ``<path_stem>.<format>`` for each format.
+
+    The files are written next to their final paths and only replace them
+    once the whole track was converted. Returns ``{format: path}``.
+    """
+    suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+    paths = {fmt: f"{path_stem}.{fmt}" for fmt in formats}
+    files = {fmt: open(path + suffix, "w", encoding="utf-8") for fmt, path in paths.items()}
+    try:
+        writers = [WRITERS[fmt](file) for fmt, file in files.items()]
+        response = request._execute_request(track_url(caption.url, source))
+        try:
+            convert(_read_chunks(response), writers, source)
+        finally:
+            response.close()
+    except BaseException:
+        for fmt, file in files.items():
+            file.close()
+            os.remove(paths[fmt] + suffix)
+        raise
+    for fmt, file in files.items():
+        file.close()
+        os.replace(paths[fmt] + suffix, paths[fmt])
+    return paths
+
+
+def default_filename(title, caption):
+    """The file name stem ``Caption.download`` would use."""
+    return f"{safe_filename(title)} ({caption.code})"
+
+
+class CaptionResult:
+    """The outcome of one track, or of a video whose tracks couldn't be listed."""
+
+    def __init__(self, index, video, code=None):
+        self.index = index
+        self.video = video
+        self.code = code
+        self.paths = {}
+        self.error = None
+
+    def __repr__(self):
+        status = f"error={self.error!r}" if self.error else ", ".join(self.paths) or "no tracks"
+        return f"<CaptionResult {self.index:02d} {self.code or '-'} {status}: {self.video}>"
+
+
+class BulkCaptions:
+    def __init__(self, workers=DEFAULT_WORKERS, formats=("srt",), source=DEFAULT_SOURCE,
+                 languages=None, filename=default_filename, resolver=None, on_result=None):
+        """Set up the downloader.
+
+        Args:
+            workers: How many videos are resolved, and how many tracks are
+                fetched, at the same time.
+            formats: Output formats, any of ``WRITERS``.
+            source: The track format to fetch and parse, ``"json3"`` or ``"srv3"``.
+            languages: Caption codes to fetch (e.g. ``"en"``, ``"a.en"``);
+                all tracks when None.
+            filename: Builds the file name stem from ``(title, caption)``.
+            resolver: The ``BatchResolver`` used for URLs and video IDs.
+            on_result: Called with each ``CaptionResult`` as it finishes.
+        """
+        unknown = set(formats) - set(WRITERS)
+        if unknown or source not in PARSERS:
+            raise ValueError(f"Unsupported caption format: {', '.join(sorted(unknown)) or source}")
+        self.workers = workers
+        self.formats = tuple(formats)
+        self.source = source
+        self.languages = set(languages) if languages is not None else None
+        self.filename = filename
+        self.resolver = resolver or BatchResolver(workers=workers)
+        self.on_result = on_result
+
+    def run(self, videos, output_directory):
+        """Download the captions of every video; returns results in input order.
+
+        ``videos`` holds URLs, video IDs, or objects with ``title`` and
+        ``captions`` such as ``pytube.YouTube`` and ``ResolvedVideo``. A
+        video's tracks start downloading as soon as it is resolved.
+        """
+        os.makedirs(output_directory, exist_ok=True)
+        results = []
+        with ThreadPoolExecutor(max_workers=self.workers) as resolve_pool, \
+                ThreadPoolExecutor(max_workers=self.workers) as fetch_pool:
+            resolving = {}
+            for index, video in enumerate(videos, start=1):
+                resolving[resolve_pool.submit(self._tracks, video)] = (index, video)
+            fetching = []
+            for future in as_completed(resolving):
+                index, video = resolving[future]
+                try:
+                    title, captions = future.result()
+                except Exception as e:
+                    result = CaptionResult(index, video)
+                    results.append(result)
+                    self._finish(result, error=e)
+                    continue
+                for caption in captions:
+                    result = CaptionResult(index, video, caption.code)
+                    results.append(result)
+                    path_stem = os.path.join(output_directory, self.filename(title, caption))
+                    fetching.append(fetch_pool.submit(self._fetch, result, caption, path_stem))
+            for future in fetching:
+                future.result()
+        # Stable, so each video's tracks stay in caption order.
+        return sorted(results, key=lambda result: result.index)
+
+    def _tracks(self, video):
+        if isinstance(video, str):
+            # Captions don't need streams, so unplayable videos are fine.
+            video = self.resolver.resolve_player(video, require_streams=False)
+        captions = [caption for caption in video.captions
+                    if self.languages is None or caption.code in self.languages]
+        return video.title, captions
+
+    def _fetch(self, result, caption, path_stem):
+        try:
+            with tracing.span("caption", source=self.source):
+                result.paths = download_track(caption, path_stem, self.formats, self.source)
+        except Exception as e:
+            self._finish(result, error=e)
+        else:
+            self._finish(result)
+
+    def _finish(self, result, error=None):
+        result.error = error
+        if self.on_result:
+            self.on_result(result)
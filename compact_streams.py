@@ -0,0 +1,232 @@
+"""Compact ``Stream`` objects and a ``StreamQuery`` with lookup indexes.
+
+``CompactStream`` keeps only the manifest fields in ``__slots__`` and reuses
+pytube's methods. ``IndexedStreamQuery`` builds its itag, type, progressive
+and bitrate indexes in one pass on first use and memoizes its filters.
+"""
+import functools
+from math import ceil
+
+from pytube import Stream, StreamQuery, extract
+from pytube.itags import get_format_profile
+
+
+@functools.lru_cache(maxsize=None)
+def format_profile(itag):
+    """``get_format_profile``, one shared dict per itag; don't modify it."""
+    return get_format_profile(itag)
+
+
+@functools.lru_cache(maxsize=1024)
+def _mime_type_codec(mime_type_codec):
+    mime_type, codecs = extract.mime_type_codec(mime_type_codec)
+    return mime_type, tuple(codecs)
+
+
+@functools.lru_cache(maxsize=256)
+def _sort_number(value):
+    return int("".join(filter(str.isdigit, value)))
+
+
+def _rounded(size, divisor):
+    return float(ceil(size / divisor * 1000) / 1000)
+
+
+class CompactStream:
+    """A ``pytube.Stream`` that stores only the manifest fields."""
+
+    __slots__ = ("_monostate", "url", "itag", "mime_type", "codecs", "is_otf", "bitrate",
+                 "_filesize", "fps", "_profile", "__weakref__")
+
+    def __init__(self, stream, monostate):
+        self._monostate = monostate
+        self.url = stream["url"]
+        self.itag = int(stream["itag"])
+        # The tuple is shared by every stream with the same mime type and codecs.
+        self.mime_type, self.codecs = _mime_type_codec(stream["mimeType"])
+        self.is_otf = stream["is_otf"]
+        self.bitrate = stream["bitrate"]
+        self._filesize = int(stream.get("contentLength", 0))
+        if "fps" in stream:
+            self.fps = stream["fps"]
+        self._profile = format_profile(self.itag)
+
+    @property
+    def type(self):
+        return self.mime_type.partition("/")[0]
+
+    @property
+    def subtype(self):
+        return self.mime_type.partition("/")[2]
+
+    @property
+    def video_codec(self):
+        return self.parse_codecs()[0]
+
+    @property
+    def audio_codec(self):
+        return self.parse_codecs()[1]
+
+    @property
+    def is_dash(self):
+        return self._profile["is_dash"]
+
+    @property
+    def abr(self):
+        return self._profile["abr"]
+
+    @property
+    def resolution(self):
+        return self._profile["resolution"]
+
+    @property
+    def is_3d(self):
+        return self._profile["is_3d"]
+
+    @property
+    def is_hdr(self):
+        return self._profile["is_hdr"]
+
+    @property
+    def is_live(self):
+        return self._profile["is_live"]
+
+    @property
+    def filesize_kb(self):
+        return _rounded(self.filesize, 1024)
+
+    @property
+    def filesize_mb(self):
+        return _rounded(self.filesize, 1024 * 1024)
+
+    @property
+    def filesize_gb(self):
+        return _rounded(self.filesize, 1024 * 1024 * 1024)
+
+    # Everything else is pytube's implementation, working on the slots above.
+    is_adaptive = Stream.is_adaptive
+    is_progressive = Stream.is_progressive
+    includes_audio_track = Stream.includes_audio_track
+    includes_video_track = Stream.includes_video_track
+    parse_codecs = Stream.parse_codecs
+    filesize = Stream.filesize
+    title = Stream.title
+    filesize_approx = Stream.filesize_approx
+    expiration = Stream.expiration
+    default_filename = Stream.default_filename
+    download = Stream.download
+    get_file_path = Stream.get_file_path
+    exists_at_path = Stream.exists_at_path
+    stream_to_buffer = Stream.stream_to_buffer
+    on_progress = Stream.on_progress
+    on_complete = Stream.on_complete
+    __repr__ = Stream.__repr__
+
+
+class IndexedStreamQuery(StreamQuery):
+    def __init__(self, fmt_streams):
+        # ``StreamQuery`` would build its itag index here; it's part of
+        # ``_index`` instead, built on first use.
+        self.fmt_streams = fmt_streams
+        self._lookups = {}
+
+    def _lookup(self, key, find):
+        # Queries don't change once built, so each answer is computed once.
+        try:
+            return self._lookups[key]
+        except KeyError:
+            result = self._lookups[key] = find()
+            return result
+
+    def _index(self):
+        return self._lookup("index", self._build_index)
+
+    def _build_index(self):
+        # Every index the lookups use, in one pass over the streams.
+        index = {"itag": {}, "type": {}, "subtype": {}, "mime_type": {}, "progressive": [],
+                 "adaptive": [], "by_resolution": {}, "audio_only": {}}
+        best_abr = {}
+        for stream in self.fmt_streams:
+            index["itag"][stream.itag] = stream
+            index["type"].setdefault(stream.type, []).append(stream)
+            index["subtype"].setdefault(stream.subtype, []).append(stream)
+            index["mime_type"].setdefault(stream.mime_type, []).append(stream)
+            if stream.is_progressive:
+                index["progressive"].append(stream)
+                if stream.subtype == "mp4" and stream.resolution:
+                    index["by_resolution"].setdefault(stream.resolution, stream)
+            else:
+                index["adaptive"].append(stream)
+                if stream.type == "audio" and stream.abr:
+                    # The last of equal bitrates, as ``order_by("abr").last()`` gives.
+                    abr = _sort_number(stream.abr)
+                    for subtype in (stream.subtype, None):
+                        if abr >= best_abr.get(subtype, -1):
+                            best_abr[subtype] = abr
+                            index["audio_only"][subtype] = stream
+        return index
+
+    @property
+    def itag_index(self):
+        return self._index()["itag"]
+
+    def filter(self, *args, **kwargs):
+        if args or kwargs.get("custom_filter_functions"):
+            return super().filter(*args, **kwargs)
+        try:
+            key = ("filter", frozenset(kwargs.items()))
+        except TypeError:
+            # e.g. a list of resolutions
+            return self._filter_indexed(kwargs)
+        return self._lookup(key, functools.partial(self._filter_indexed, kwargs))
+
+    def _filter_indexed(self, kwargs):
+        # pytube's filter, run over the smallest index list that holds every match.
+        index = self._index()
+        candidates = [self.fmt_streams]
+        if kwargs.get("progressive"):
+            candidates.append(index["progressive"])
+        if kwargs.get("adaptive"):
+            candidates.append(index["adaptive"])
+        if kwargs.get("only_audio"):
+            candidates.append(index["type"].get("audio", []))
+        if kwargs.get("only_video") or kwargs.get("type"):
+            candidates.append(index["type"].get(kwargs.get("type") or "video", []))
+        if kwargs.get("subtype") or kwargs.get("file_extension"):
+            candidates.append(index["subtype"].get(kwargs.get("subtype") or kwargs["file_extension"], []))
+        if kwargs.get("mime_type"):
+            candidates.append(index["mime_type"].get(kwargs["mime_type"], []))
+        return StreamQuery.filter(IndexedStreamQuery(min(candidates, key=len)), **kwargs)
+
+    def _filter(self, filters):
+        return IndexedStreamQuery([s for s in self.fmt_streams if all(f(s) for f in filters)])
+
+    def order_by(self, attribute_name):
+        has_attribute = [s for s in self.fmt_streams if getattr(s, attribute_name) is not None]
+        if has_attribute and isinstance(getattr(has_attribute[0], attribute_name), str):
+            try:
+                return IndexedStreamQuery(sorted(
+                    has_attribute, key=lambda s: _sort_number(getattr(s, attribute_name))))
+            except ValueError:
+                pass
+        return IndexedStreamQuery(sorted(has_attribute, key=lambda s: getattr(s, attribute_name)))
+
+    def desc(self):
+        return IndexedStreamQuery(self.fmt_streams[::-1])
+
+    def get_by_itag(self, itag):
+        return self._index()["itag"].get(int(itag))
+
+    def get_by_resolution(self, resolution):
+        if not isinstance(resolution, str) or not resolution:
+            return super().get_by_resolution(resolution)
+        return self._index()["by_resolution"].get(resolution)
+
+    def get_lowest_resolution(self):
+        return self._lookup("lowest_resolution", super().get_lowest_resolution)
+
+    def get_highest_resolution(self):
+        return self._lookup("highest_resolution", super().get_highest_resolution)
+
+    def get_audio_only(self, subtype="mp4"):
+        return self._index()["audio_only"].get(subtype or None)
@@ -0,0 +1,43 @@
+"""Archive of finished downloads, checked before a video is resolved.
+
+One ``<video id> <format>`` line per download, like youtube-dl's
+``--download-archive``, loaded into a set once.
+"""
+import os
+import threading
+
+from batch_resolver import video_id_of
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "youtube_downloader", "archive.txt")
+
+
+class DownloadArchive:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = set()
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    video_id, _, fmt = line.strip().partition(" ")
+                    if video_id:
+                        self._entries.add((video_id, fmt))
+        except FileNotFoundError:
+            pass
+
+    def __len__(self):
+        return len(self._entries)
+
+    def contains(self, video_url, fmt):
+        """Whether ``video_url`` (a URL or ID) was already downloaded as ``fmt``."""
+        return (video_id_of(video_url), fmt) in self._entries
+
+    def add(self, video_url, fmt):
+        entry = (video_id_of(video_url), fmt)
+        with self._lock:
+            if entry in self._entries:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(f"{entry[0]} {entry[1]}\n")
+            self._entries.add(entry)
@@ -0,0 +1,158 @@
+"""Pooled keep-alive HTTP transport shared by pytube and the downloaders.
+
+``install()`` puts a ``urllib3.PoolManager`` under
+``pytube.request._execute_request``. Responses and errors look like
+``urlopen``'s.
+"""
+import http.client
+import io
+import json
+import socket
+from urllib.error import HTTPError, URLError
+
+import urllib3
+from pytube import request
+
+DEFAULT_CONNECTIONS_PER_HOST = 10
+MAX_DRAIN_SIZE = 64 * 1024
+MAX_REDIRECTS = 5
+BASE_HEADERS = {"User-Agent": "Mozilla/5.0", "accept-language": "en-US,en"}
+
+
+def _url_error(error):
+    if isinstance(error, (urllib3.exceptions.ConnectTimeoutError,
+                          urllib3.exceptions.ReadTimeoutError)):
+        return URLError(socket.timeout(str(error)))
+    return URLError(error)
+
+
+class PooledResponse:
+    """Wraps a ``urllib3`` response in the parts of the ``urlopen`` API pytube uses."""
+
+    def __init__(self, url, response):
+        self.url = url
+        self._response = response
+        self.status = response.status
+        self.headers = response.headers
+        self._released = False
+
+    def getcode(self):
+        return self.status
+
+    def info(self):
+        return self.headers
+
+    def read(self, amt=None):
+        try:
+            data = self._response.read(amt)
+        except urllib3.exceptions.ProtocolError as e:
+            raise http.client.IncompleteRead(b"") from e
+        except urllib3.exceptions.ReadTimeoutError as e:
+            raise URLError(socket.timeout(str(e))) from e
+        if amt is None or not data or self._response.length_remaining == 0:
+            self.close()
+        return data
+
+    def readinto(self, b):
+        try:
+            n = self._response.readinto(b)
+        except urllib3.exceptions.ProtocolError as e:
+            raise http.client.IncompleteRead(b"") from e
+        except urllib3.exceptions.ReadTimeoutError as e:
+            raise URLError(socket.timeout(str(e))) from e
+        if not n or self._response.length_remaining == 0:
+            self.close()
+        return n
+
+    def close(self):
+        # Hand the connection back to the pool; a short unread tail is drained
+        # so the socket can be reused, a long one is not worth reading.
+        if self._released:
+            return
+        self._released = True
+        remaining = self._response.length_remaining
+        if remaining is not None and remaining <= MAX_DRAIN_SIZE:
+            self._response.drain_conn()
+        else:
+            self._response.close()
+        self._response.release_conn()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        # The body is released once it is read to the end or closed, but pytube
+        # drops some responses without reading them; don't leak their
+        # connection out of the bounded pool.
+        self.close()
+
+
+class PooledTransport:
+    def __init__(self, connections_per_host=DEFAULT_CONNECTIONS_PER_HOST, **pool_kwargs):
+        """Create the connection pools.
+
+        Args:
+            connections_per_host: The most connections kept open to one host;
+                further requests wait for a free connection.
+            pool_kwargs: Passed on to ``urllib3.PoolManager``.
+        """
+        # Redirects are followed like ``urlopen`` does; everything else is
+        # retried by the callers, which know whether a request can be resumed.
+        retries = urllib3.Retry(total=None, connect=0, read=0, status=0,
+                                redirect=MAX_REDIRECTS, raise_on_redirect=True)
+        self.pool = urllib3.PoolManager(maxsize=connections_per_host, block=True,
+                                        retries=retries, **pool_kwargs)
+
+    def execute_request(self, url, method=None, headers=None, data=None,
+                        timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
+        """Drop-in replacement for ``pytube.request._execute_request``."""
+        base_headers = dict(BASE_HEADERS)
+        if headers:
+            base_headers.update(headers)
+        if data and not isinstance(data, bytes):
+            data = bytes(json.dumps(data), encoding="utf-8")
+        if not url.lower().startswith("http"):
+            raise ValueError("Invalid URL")
+        if method is None:
+            method = "POST" if data else "GET"
+
+        kwargs = {}
+        if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+            kwargs["timeout"] = timeout
+        try:
+            response = self.pool.request(method, url, headers=base_headers, body=data or None,
+                                         preload_content=method == "HEAD", redirect=True,
+                                         **kwargs)
+        except urllib3.exceptions.MaxRetryError as e:
+            raise _url_error(e.reason or e) from e
+        except urllib3.exceptions.HTTPError as e:
+            raise _url_error(e) from e
+
+        if response.status >= 400:
+            body = response.read()
+            response.release_conn()
+            raise HTTPError(url, response.status, response.reason, response.headers, io.BytesIO(body))
+        # Like ``urlopen``, the response carries the URL it was redirected to.
+        return PooledResponse(response.url or url, response)
+
+    def get(self, url, headers=None, timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
+        return self.execute_request(url, "GET", headers=headers, timeout=timeout)
+
+    def clear(self):
+        self.pool.clear()
+
+
+default_transport = PooledTransport()
+_original_execute_request = request._execute_request
+
+
+def install(transport=default_transport):
+    """Route every ``pytube.request`` call through ``transport``."""
+    request._execute_request = transport.execute_request
+
+
+def uninstall():
+    request._execute_request = _original_execute_request
@@ -0,0 +1,168 @@
+"""Crash-safe journal of download jobs in SQLite.
+
+``JobJournal`` records each job's stream, URL expiry, path, status and
+written ranges, and doubles as the downloaders' ``state_store``. After a
+restart, ``unfinished()`` lists the jobs to resume.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from urllib import parse
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "youtube_downloader", "jobs.sqlite3")
+EXPIRY_MARGIN = 5 * 60  # don't start on a URL that is about to expire
+
+PENDING = "pending"
+RUNNING = "running"
+PAUSED = "paused"
+DONE = "done"
+FAILED = "failed"
+UNFINISHED = (PENDING, RUNNING, PAUSED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    path TEXT PRIMARY KEY,
+    video_url TEXT NOT NULL,
+    itag INTEGER NOT NULL,
+    stream_url TEXT NOT NULL,
+    expires_at INTEGER,
+    is_otf INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    error TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS layouts (
+    path TEXT PRIMARY KEY,
+    total_size INTEGER NOT NULL,
+    segment_size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ranges (
+    path TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    written INTEGER NOT NULL,
+    PRIMARY KEY (path, start)
+);
+"""
+
+Job = namedtuple("Job", "path video_url itag stream_url expires_at is_otf status error updated_at")
+
+
+def url_expiry(stream_url):
+    """The ``expire`` timestamp of a googlevideo URL, or None."""
+    expire = parse.parse_qs(parse.urlsplit(stream_url).query).get("expire")
+    if expire and expire[0].isdigit():
+        return int(expire[0])
+    return None
+
+
+def is_expired(job, now=None):
+    if job.expires_at is None:
+        return False
+    return job.expires_at - EXPIRY_MARGIN <= (now or time.time())
+
+
+class JobJournal:
+    def __init__(self, path=DEFAULT_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # FULL keeps committed checkpoints across a power loss, not only a crash.
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def start(self, video_url, stream, path):
+        """Record that ``stream`` of ``video_url`` is being written to ``path``.
+
+        A job for another stream at the same path starts over; the same
+        stream keeps its ranges and resumes.
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT itag FROM jobs WHERE path = ?", (path,)).fetchone()
+            if row is not None and row[0] != stream.itag:
+                self._clear(path)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?)",
+                (path, video_url, stream.itag, stream.url, url_expiry(stream.url),
+                 int(stream.is_otf), RUNNING, time.time()))
+
+    def set_status(self, path, status, error=None):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE path = ?",
+                               (status, error, time.time(), path))
+
+    def update_url(self, path, stream_url):
+        """Store a freshly resolved URL for a job whose old one expired."""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE jobs SET stream_url = ?, expires_at = ? WHERE path = ?",
+                               (stream_url, url_expiry(stream_url), path))
+
+    def get(self, path):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE path = ?", (path,)).fetchone()
+        return Job(*row) if row else None
+
+    def unfinished(self):
+        """Jobs that were pending, running or paused, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM jobs WHERE status IN ({', '.join('?' * len(UNFINISHED))}) "
+                "ORDER BY updated_at", UNFINISHED).fetchall()
+        return [Job(*row) for row in rows]
+
+    def forget(self, path):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM jobs WHERE path = ?", (path,))
+            self._clear(path)
+
+    def run(self, video_url, stream, path, download):
+        """Call ``download(stream, path)`` and keep the job's status in step.
+
+        Returns what ``download`` returns: True when complete, False when
+        it stopped early.
+        """
+        self.start(video_url, stream, path)
+        try:
+            completed = download(stream, path)
+        except Exception as e:
+            self.set_status(path, FAILED, str(e))
+            raise
+        self.set_status(path, DONE if completed else PAUSED)
+        return completed
+
+    # The ``state_store`` interface of the downloaders.
+
+    def load(self, path, total_size, segment_size):
+        with self._lock:
+            layout = self._conn.execute("SELECT total_size, segment_size FROM layouts WHERE path = ?",
+                                        (path,)).fetchone()
+            if layout != (total_size, segment_size):
+                return {}
+            rows = self._conn.execute("SELECT start, written FROM ranges WHERE path = ?",
+                                      (path,)).fetchall()
+        return dict(rows)
+
+    def save(self, path, total_size, segment_size, written):
+        # ``written`` is always the full state, older rows may be of another layout.
+        with self._lock, self._conn:
+            self._clear(path)
+            self._conn.execute("INSERT INTO layouts VALUES (?, ?, ?)",
+                               (path, total_size, segment_size))
+            self._conn.executemany("INSERT INTO ranges VALUES (?, ?, ?)",
+                                   [(path, start, count) for start, count in written.items()])
+
+    def clear(self, path):
+        with self._lock, self._conn:
+            self._clear(path)
+
+    def _clear(self, path):
+        self._conn.execute("DELETE FROM layouts WHERE path = ?", (path,))
+        self._conn.execute("DELETE FROM ranges WHERE path = ?", (path,))
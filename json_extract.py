@@ -0,0 +1,117 @@
+"""Fast extraction of the JSON objects embedded in YouTube pages.
+
+Plain JSON is decoded in place with ``JSONDecoder.raw_decode``; anything
+else is scanned with regex jumps, with the same result as
+``pytube.parser.find_object_from_startpoint``. ``install()`` swaps both in.
+"""
+import ast
+import functools
+import json
+import re
+
+from pytube import cipher, parser
+from pytube.exceptions import HTMLParseError
+
+CACHE_SIZE = 16
+
+_decoder = json.JSONDecoder()
+_CLOSERS = {"{": "}", "[": "]", '"': '"', "/": "/"}
+# The next character that opens or closes a context, outside of strings and regexes.
+_CODE_TOKEN = re.compile(r'[{}\[\]"/]')
+# The end of a string or regex literal, or an escape inside it.
+_LITERAL_TOKENS = {'"': re.compile(r'["\\]'), "/": re.compile(r"[/\\]")}
+# A slash after one of these starts a regex literal, anywhere else it is a division.
+_REGEX_PRECEDERS = frozenset("(,=:[!&|?{};")
+
+
+def find_object_from_startpoint(html, start_point):
+    """The source of the JavaScript object or array starting at ``start_point``.
+
+    Same result as ``pytube.parser.find_object_from_startpoint``, without
+    copying the page or looking at every character.
+    """
+    if html[start_point:start_point + 1] not in ("{", "["):
+        raise HTMLParseError(f"Invalid start point. Start of HTML:\n{html[start_point:start_point + 20]}")
+
+    stack = [html[start_point]]
+    i = start_point + 1
+    end = len(html)
+    while stack and i < end:
+        context = stack[-1]
+        if context in _LITERAL_TOKENS:
+            match = _LITERAL_TOKENS[context].search(html, i)
+            if match is None:
+                break
+            i = match.start()
+            if html[i] == "\\":
+                i += 2
+                continue
+            stack.pop()
+            i += 1
+            continue
+
+        match = _CODE_TOKEN.search(html, i)
+        if match is None:
+            break
+        i = match.start()
+        char = html[i]
+        if char == _CLOSERS[context]:
+            stack.pop()
+        elif char in _CLOSERS and (char != "/" or _previous_char(html, start_point, i) in _REGEX_PRECEDERS):
+            stack.append(char)
+        i += 1
+    else:
+        return html[start_point:i]
+    return html[start_point:end]
+
+
+def _previous_char(html, start_point, i):
+    # pytube's scanner skips spaces and newlines, but not tabs, when it looks back.
+    j = i - 1
+    while j > start_point and html[j] in " \n":
+        j -= 1
+    return html[j] if j > start_point else None
+
+
+def parse_for_object_from_startpoint(html, start_point):
+    """Drop-in replacement for ``pytube.parser.parse_for_object_from_startpoint``."""
+    return _parse(html, start_point)
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _parse(html, start_point):
+    # The page is hashed once per string object, so repeated lookups are cheap.
+    if html[start_point:start_point + 1] not in ("{", "["):
+        raise HTMLParseError(f"Invalid start point. Start of HTML:\n{html[start_point:start_point + 20]}")
+    try:
+        return _decoder.raw_decode(html, start_point)[0]
+    except json.JSONDecodeError:
+        pass
+
+    full_obj = find_object_from_startpoint(html, start_point)
+    try:
+        return json.loads(full_obj)
+    except json.JSONDecodeError:
+        try:
+            return ast.literal_eval(full_obj)
+        except (ValueError, SyntaxError):
+            raise HTMLParseError("Could not parse object.")
+
+
+def clear_cache():
+    _parse.cache_clear()
+
+
+_originals = (parser.find_object_from_startpoint, parser.parse_for_object_from_startpoint,
+              cipher.find_object_from_startpoint)
+
+
+def install():
+    parser.find_object_from_startpoint = find_object_from_startpoint
+    parser.parse_for_object_from_startpoint = parse_for_object_from_startpoint
+    cipher.find_object_from_startpoint = find_object_from_startpoint
+
+
+def uninstall():
+    (parser.find_object_from_startpoint, parser.parse_for_object_from_startpoint,
+     cipher.find_object_from_startpoint) = _originals
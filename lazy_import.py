@@ -0,0 +1,25 @@
+"""Modules that are only imported when they are first used.
+
+Keeps ``pytube``, ``requests`` and friends out of the scripts' start-up
+time, via ``importlib.util.LazyLoader``.
+"""
+import importlib.util
+import sys
+
+
+def lazy_import(name):
+    """``import name``, deferred until the module is used.
+
+    A module that is already imported is returned as it is. A missing module
+    raises ``ModuleNotFoundError`` here, not at first use.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,70 @@
+"""youtube-dl fallback for videos pytube can't fetch without a login.
+
+``youtube_dl`` is imported on first use, with only its YouTube extractors
+registered instead of all ~800.
+"""
+import importlib
+import importlib.abc
+import importlib.util
+import sys
+import threading
+
+REGISTRY_MODULE = "youtube_dl.extractor.lazy_extractors"
+EXTRACTOR_MODULES = ("youtube_dl.extractor.youtube",)
+
+_lock = threading.Lock()
+
+
+class YouTubeExtractorRegistry(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    """Serves ``REGISTRY_MODULE`` with only the extractors of ``modules``."""
+
+    def __init__(self, modules=EXTRACTOR_MODULES):
+        self.modules = modules
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname != REGISTRY_MODULE:
+            return None
+        return importlib.util.spec_from_loader(fullname, self)
+
+    def create_module(self, spec):
+        return None
+
+    def exec_module(self, module):
+        # Runs while ``youtube_dl.extractor`` is half initialized; its
+        # submodules can already be imported.
+        classes = []
+        for name in self.modules:
+            extractors = importlib.import_module(name)
+            classes += [value for key, value in vars(extractors).items()
+                        if key.endswith("IE") and isinstance(value, type)
+                        and value.__module__ == name and getattr(value, "_VALID_URL", None)]
+        for extractor in classes:
+            setattr(module, extractor.__name__, extractor)
+        module.__all__ = [extractor.__name__ for extractor in classes]
+        module._ALL_CLASSES = classes
+
+
+def import_youtube_dl(registry=None):
+    """Import ``youtube_dl`` with only the YouTube extractors registered.
+
+    A ``youtube_dl`` that is already imported, or that ships its own
+    ``lazy_extractors``, is used as it is.
+    """
+    with _lock:
+        if "youtube_dl" in sys.modules:
+            return sys.modules["youtube_dl"]
+        registry = registry or YouTubeExtractorRegistry()
+        if importlib.util.find_spec("youtube_dl") is None:
+            raise ModuleNotFoundError("No module named 'youtube_dl'", name="youtube_dl")
+        sys.meta_path.append(registry)
+        try:
+            return importlib.import_module("youtube_dl")
+        finally:
+            sys.meta_path.remove(registry)
+
+
+def download(video_url, username, password):
+    """Download ``video_url`` through youtube-dl, logged in as ``username``."""
+    youtube_dl = import_youtube_dl()
+    with youtube_dl.YoutubeDL({"username": username, "password": password}) as ydl:
+        ydl.download([video_url])
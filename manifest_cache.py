@@ -0,0 +1,176 @@
+"""Signed stream manifests, kept until their URLs expire.
+
+``resolver.YouTube`` and ``BatchResolver`` build their streams from here
+without a request while the URLs are valid. A refused URL (``403``) makes
+them resolve the video again.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.error import HTTPError
+
+from job_journal import EXPIRY_MARGIN, url_expiry
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "youtube_downloader", "manifests")
+DEFAULT_MAX_ENTRIES = 512
+# What ``CompactStream`` reads from a stream of the manifest.
+STREAM_KEYS = ("url", "itag", "mimeType", "is_otf", "bitrate", "contentLength", "fps")
+
+
+def manifest_expiry(stream_manifest):
+    """When the first URL of the manifest expires, or None if one has no ``expire``."""
+    expiries = [url_expiry(stream["url"]) for stream in stream_manifest]
+    if not expiries or None in expiries:
+        return None
+    return min(expiries)
+
+
+def is_forbidden(error):
+    """Whether ``error``, or an error it was raised from, is an HTTP 403."""
+    while error is not None:
+        if isinstance(error, HTTPError) and error.code == 403:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class CachedManifest:
+    def __init__(self, streams, vid_info, expires):
+        self.streams = streams
+        # Only ``videoDetails`` and ``captions`` of the player response are kept.
+        self.vid_info = vid_info
+        self.expires = expires
+
+    @property
+    def title(self):
+        return self.vid_info["videoDetails"]["title"]
+
+    @property
+    def length(self):
+        return int(self.vid_info["videoDetails"].get("lengthSeconds", 0))
+
+
+class ManifestCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_entries=DEFAULT_MAX_ENTRIES,
+                 expiry_margin=EXPIRY_MARGIN):
+        """Set up the cache.
+
+        Args:
+            cache_dir: Where manifests are stored; None keeps them in memory only.
+            max_entries: The most manifests kept, on disk and in memory.
+            expiry_margin: Seconds before its expiry that a manifest stops
+                being served, so a transfer doesn't start on a dying URL.
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.expiry_margin = expiry_margin
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, video_id, client):
+        """The ``CachedManifest`` of the video, or None if there is no valid one."""
+        key = (video_id, client)
+        with self._lock:
+            manifest = self._memory.get(key)
+            if manifest is not None:
+                self._memory.move_to_end(key)
+        if manifest is None:
+            manifest = self._read(video_id, client)
+            if manifest is not None:
+                self._remember(key, manifest)
+        if manifest is None:
+            return None
+        if manifest.expires - self.expiry_margin <= time.time():
+            self.invalidate(video_id, client)
+            return None
+        return manifest
+
+    def put(self, video_id, client, stream_manifest, vid_info):
+        """Store a signed manifest (as passed to ``CompactStream``) and its player response.
+
+        Manifests whose URLs don't carry an expiry are not stored.
+        """
+        expires = manifest_expiry(stream_manifest)
+        if expires is None or expires - self.expiry_margin <= time.time():
+            return
+        streams = [{key: stream[key] for key in STREAM_KEYS if key in stream}
+                   for stream in stream_manifest]
+        vid_info = {key: vid_info[key] for key in ("videoDetails", "captions") if key in vid_info}
+        manifest = CachedManifest(streams, vid_info, expires)
+        self._remember((video_id, client), manifest)
+        self._write(video_id, client, manifest)
+
+    def invalidate(self, video_id, client):
+        """Forget a manifest, e.g. after one of its URLs was refused."""
+        with self._lock:
+            self._memory.pop((video_id, client), None)
+        if self.cache_dir is not None:
+            try:
+                os.remove(self._path(video_id, client))
+            except OSError:
+                pass
+
+    def evict(self):
+        """Drop expired manifests from disk, and all but the ``max_entries`` that expire last."""
+        try:
+            names = [name for name in os.listdir(self.cache_dir) if name.endswith(".json")]
+        except (OSError, TypeError):
+            return
+        expiries = []
+        for name in names:
+            path = os.path.join(self.cache_dir, name)
+            try:
+                expiries.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        expiries.sort(reverse=True)
+        now = time.time()
+        for position, (expires, path) in enumerate(expiries):
+            if position < self.max_entries and expires > now:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _remember(self, key, manifest):
+        with self._lock:
+            self._memory[key] = manifest
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _path(self, video_id, client):
+        return os.path.join(self.cache_dir, f"{video_id}.{client}.json")
+
+    def _read(self, video_id, client):
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self._path(video_id, client), encoding="utf-8") as f:
+                stored = json.load(f)
+            return CachedManifest(stored["streams"], stored["vid_info"], stored["expires"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write(self, video_id, client, manifest):
+        if self.cache_dir is None:
+            return
+        path = self._path(video_id, client)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({"streams": manifest.streams, "vid_info": manifest.vid_info,
+                           "expires": manifest.expires}, f)
+            os.replace(temp_path, path)
+            # The modification time holds the expiry, so evicting only needs a listing.
+            os.utime(path, (manifest.expires, manifest.expires))
+        except OSError:
+            return
+        self.evict()
+
+
+default_cache = ManifestCache()
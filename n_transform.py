@@ -0,0 +1,51 @@
+"""Side-effect free evaluation of the player's ``n`` parameter transform.
+
+``Cipher.calculate_n`` caches the first answer for every later input;
+``NTransform`` runs the plan on a fresh array per ``n`` and memoizes by ``n``.
+"""
+import functools
+
+from pytube.exceptions import ExtractError
+
+DEFAULT_CACHE_SIZE = 1024
+
+
+class NTransform:
+    def __init__(self, throttling_plan, throttling_array, cache_size=DEFAULT_CACHE_SIZE):
+        """Compile a throttling plan.
+
+        Args:
+            throttling_plan: ``Cipher.throttling_plan``, steps of string indexes.
+            throttling_array: An unused ``Cipher.throttling_array`` where the
+                ``"b"`` entries still stand for the ``n`` argument.
+            cache_size: How many ``n`` values are memoized.
+        """
+        self.steps = [tuple(int(index) for index in step) for step in throttling_plan]
+        self._template = list(throttling_array)
+        self._n_positions = [i for i, item in enumerate(throttling_array) if item == "b"]
+        self._self_positions = [i for i, item in enumerate(throttling_array) if item is throttling_array]
+        self._calculate = functools.lru_cache(maxsize=cache_size)(self._evaluate)
+
+    @classmethod
+    def from_cipher(cls, js_cipher, cache_size=DEFAULT_CACHE_SIZE):
+        return cls(js_cipher.throttling_plan, js_cipher.throttling_array, cache_size)
+
+    def __call__(self, n):
+        """Return the transformed value of ``n``."""
+        return self._calculate(n)
+
+    def _evaluate(self, n):
+        n_chars = list(n)
+        array = list(self._template)
+        for i in self._n_positions:
+            array[i] = n_chars
+        for i in self._self_positions:
+            array[i] = array
+
+        for step in self.steps:
+            func = array[step[0]]
+            if not callable(func):
+                raise ExtractError(f"{func} is not callable.")
+            func(*[array[index] for index in step[1:]])
+
+        return "".join(n_chars)
@@ -0,0 +1,167 @@
+"""Download engine for sequential (OTF / live replay) streams.
+
+The header segment is scanned as it arrives for ``Segment-Count``; the
+following ``sq=`` segments are prefetched on a small pool, retried one by
+one and written strictly in order.
+"""
+import http.client
+import socket
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from pytube import request
+
+from manifest_cache import is_forbidden
+from stream_size import SEGMENT_COUNT_PATTERN, segment_url
+import tracing
+from transfer import MIN_BLOCK_SIZE
+
+DEFAULT_PREFETCH = 4
+
+
+class OTFDownloadError(Exception):
+    """Raised when a segment can not be fetched after all retries."""
+
+
+class OTFDownloader:
+    def __init__(self, prefetch=DEFAULT_PREFETCH, max_retries=3,
+                 timeout=socket._GLOBAL_DEFAULT_TIMEOUT, on_progress=None, should_stop=None,
+                 throttle=None):
+        """Configure the downloader.
+
+        Args:
+            prefetch: How many segments are fetched (and held) ahead.
+            max_retries: Retries per segment.
+            timeout: Seconds to wait for a connection or for the next bytes.
+            on_progress: Called with the size of every chunk ``download`` writes.
+            should_stop: Returns True when the download should stop early.
+            throttle: Called with the size of every read before it is made,
+                e.g. ``BandwidthJob.acquire``.
+        """
+        self.prefetch = prefetch
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.on_progress = on_progress
+        self.should_stop = should_stop or (lambda: False)
+        self.throttle = throttle
+
+    def segments(self, url):
+        """Yield the stream as chunks in order: the header, then every segment."""
+        header = bytearray()
+        count = None
+        for chunk in self._read_header(url):
+            if count is None:
+                # Scan until Segment-Count shows up; the header segment is small.
+                header += chunk
+                match = SEGMENT_COUNT_PATTERN.search(header)
+                if match:
+                    count = int(match.group(1))
+            yield chunk
+        if count is None:
+            raise OTFDownloadError(f"No Segment-Count in the header of {url}")
+
+        with ThreadPoolExecutor(max_workers=self.prefetch) as pool:
+            pending = deque()
+            next_sq = 1
+            while next_sq <= count or pending:
+                while next_sq <= count and len(pending) < self.prefetch:
+                    pending.append(pool.submit(self._fetch_segment, segment_url(url, next_sq)))
+                    next_sq += 1
+                if self.should_stop():
+                    for future in pending:
+                        future.cancel()
+                    return
+                yield pending.popleft().result()
+
+    def download(self, url, path):
+        """Write the whole stream to ``path``; returns False if stopped early."""
+        with open(path, "wb", buffering=0) as f:
+            for chunk in self.segments(url):
+                f.write(chunk)
+                if self.on_progress:
+                    self.on_progress(len(chunk))
+                if self.should_stop():
+                    return False
+        return True
+
+    def _read_header(self, url):
+        # Retried like the other segments; a retry skips what was already yielded.
+        header_url = segment_url(url, 0)
+        received = 0
+        tries = 0
+        while True:
+            try:
+                response = self._open(header_url)
+                length = response.headers.get("Content-Length")
+                position = 0
+                while True:
+                    if self.throttle:
+                        self.throttle(MIN_BLOCK_SIZE)
+                    chunk = response.read(MIN_BLOCK_SIZE)
+                    if not chunk:
+                        break
+                    position += len(chunk)
+                    if position > received:
+                        yield chunk[len(chunk) - (position - received):]
+                        received = position
+                # Reads of a size don't notice a body that was cut off.
+                if length is not None and position < int(length):
+                    raise http.client.IncompleteRead(b"", int(length) - position)
+                return
+            except (OSError, http.client.HTTPException) as e:
+                tries = self._retry(header_url, e, tries)
+
+    def _fetch_segment(self, url):
+        tries = 0
+        while True:
+            try:
+                if self.throttle:
+                    return self._read_throttled(self._open(url))
+                return self._open(url).read()
+            except (OSError, http.client.HTTPException) as e:
+                tries = self._retry(url, e, tries)
+
+    def _read_throttled(self, response):
+        length = response.headers.get("Content-Length")
+        body = bytearray()
+        while True:
+            self.throttle(MIN_BLOCK_SIZE)
+            block = response.read(MIN_BLOCK_SIZE)
+            if not block:
+                break
+            body += block
+        if length is not None and len(body) < int(length):
+            raise http.client.IncompleteRead(bytes(body), int(length) - len(body))
+        return bytes(body)
+
+    def _retry(self, url, error, tries):
+        # Returns the new number of tries, or raises if there are none left.
+        if is_forbidden(error):
+            raise OTFDownloadError(f"Segment {url} failed: {error}") from error
+        tracing.count("retries", kind="segment")
+        if tries >= self.max_retries:
+            raise OTFDownloadError(f"Segment {url} failed: {error}") from error
+        return tries + 1
+
+    def _open(self, url):
+        return request._execute_request(url, method="GET", timeout=self.timeout)
+
+
+default_downloader = OTFDownloader()
+_original_seq_stream = request.seq_stream
+
+
+def seq_stream(url, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, max_retries=0):
+    """Drop-in replacement for ``pytube.request.seq_stream``."""
+    downloader = OTFDownloader(prefetch=default_downloader.prefetch,
+                               max_retries=max(max_retries, default_downloader.max_retries),
+                               timeout=timeout)
+    return downloader.segments(url)
+
+
+def install():
+    request.seq_stream = seq_stream
+
+
+def uninstall():
+    request.seq_stream = _original_seq_stream
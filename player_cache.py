@@ -0,0 +1,189 @@
+"""Persistent cache for YouTube player scripts and their parsed cipher plans.
+
+Players are keyed by URL and kept on disk, so a new process rebuilds a
+``Cipher`` without downloading or parsing ``base.js`` again.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from pytube import cipher, request
+
+from n_transform import NTransform
+from signature_transform import SignatureTransform
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "youtube_downloader", "players")
+DEFAULT_MAX_ENTRIES = 8
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60  # 30 days
+
+
+def _encode_throttling_array(throttling_array):
+    encoded = []
+    for item in throttling_array:
+        if item is throttling_array:
+            encoded.append({"self": True})
+        elif callable(item):
+            encoded.append({"fn": item.__name__})
+        else:
+            encoded.append(item)
+    return encoded
+
+
+def _decode_throttling_array(encoded):
+    throttling_array = []
+    for item in encoded:
+        if isinstance(item, dict) and item.get("fn"):
+            item = getattr(cipher, item["fn"])
+        throttling_array.append(item)
+    # The "null" entries of the player array refer to the array itself.
+    for i, item in enumerate(throttling_array):
+        if isinstance(item, dict) and item.get("self"):
+            throttling_array[i] = throttling_array
+    return throttling_array
+
+
+def cipher_to_plan(js_cipher):
+    """Turn a ``Cipher`` into a JSON serialisable dict."""
+    return {
+        "transform_plan": js_cipher.transform_plan,
+        "transform_map": {name: fn.__name__ for name, fn in js_cipher.transform_map.items()},
+        "js_func_patterns": js_cipher.js_func_patterns,
+        "throttling_plan": [list(step) for step in js_cipher.throttling_plan],
+        "throttling_array": _encode_throttling_array(js_cipher.throttling_array),
+    }
+
+
+def cipher_from_plan(plan):
+    """Rebuild a ``Cipher`` from ``cipher_to_plan`` output without any parsing."""
+    js_cipher = cipher.Cipher.__new__(cipher.Cipher)
+    js_cipher.transform_plan = plan["transform_plan"]
+    js_cipher.transform_map = {name: getattr(cipher, fn) for name, fn in plan["transform_map"].items()}
+    js_cipher.js_func_patterns = plan["js_func_patterns"]
+    js_cipher.throttling_plan = [tuple(step) for step in plan["throttling_plan"]]
+    js_cipher.throttling_array = _decode_throttling_array(plan["throttling_array"])
+    js_cipher.calculated_n = None
+    return js_cipher
+
+
+class PlayerCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_age=DEFAULT_MAX_AGE):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._js = {}
+        self._plans = {}
+        self._n_transforms = {}
+        self._signature_transforms = {}
+        self._lock = threading.Lock()
+
+    def _path(self, js_url, extension):
+        key = hashlib.sha1(js_url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.{extension}")
+
+    def get_js(self, js_url):
+        """Return the player script, from memory, disk or the network."""
+        js = self._js.get(js_url)
+        if js is not None:
+            return js
+        with self._lock:
+            js = self._js.get(js_url)
+            if js is None:
+                js = self._read(self._path(js_url, "js"))
+            if js is None:
+                js = request.get(js_url)
+                self._write(self._path(js_url, "js"), js)
+                self.evict()
+            self._js[js_url] = js
+        return js
+
+    def get_cipher(self, js_url):
+        """Return a ``Cipher`` for the player, parsing it at most once."""
+        plan = self._plans.get(js_url)
+        if plan is None:
+            raw_plan = self._read(self._path(js_url, "json"))
+            if raw_plan is not None:
+                plan = json.loads(raw_plan)
+            else:
+                plan = cipher_to_plan(cipher.Cipher(js=self.get_js(js_url)))
+                self._write(self._path(js_url, "json"), json.dumps(plan))
+                self.evict()
+            self._plans[js_url] = plan
+        return cipher_from_plan(plan)
+
+    def get_n_transform(self, js_url):
+        """Return the player's ``NTransform``, shared by every stream in the process."""
+        n_transform = self._n_transforms.get(js_url)
+        if n_transform is None:
+            n_transform = NTransform.from_cipher(self.get_cipher(js_url))
+            self._n_transforms[js_url] = n_transform
+        return n_transform
+
+    def get_signature_transform(self, js_url):
+        """Return the player's ``SignatureTransform``, compiled per signature length."""
+        signature_transform = self._signature_transforms.get(js_url)
+        if signature_transform is None:
+            signature_transform = SignatureTransform.from_cipher(self.get_cipher(js_url))
+            self._signature_transforms[js_url] = signature_transform
+        return signature_transform
+
+    def invalidate(self, js_url):
+        """Forget a player, e.g. after its plan failed to decipher a stream."""
+        with self._lock:
+            self._js.pop(js_url, None)
+            self._plans.pop(js_url, None)
+            self._n_transforms.pop(js_url, None)
+            self._signature_transforms.pop(js_url, None)
+            for extension in ("js", "json"):
+                try:
+                    os.remove(self._path(js_url, extension))
+                except OSError:
+                    pass
+
+    def evict(self):
+        """Drop players older than ``max_age`` and all but ``max_entries``."""
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        last_used = {}
+        for name in names:
+            key, extension = os.path.splitext(name)
+            if extension not in (".js", ".json"):
+                continue
+            try:
+                mtime = os.path.getmtime(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            last_used[key] = max(mtime, last_used.get(key, 0))
+        now = time.time()
+        newest_first = sorted(last_used, key=last_used.get, reverse=True)
+        for position, key in enumerate(newest_first):
+            if position >= self.max_entries or now - last_used[key] > self.max_age:
+                for extension in (".js", ".json"):
+                    try:
+                        os.remove(os.path.join(self.cache_dir, key + extension))
+                    except OSError:
+                        pass
+
+    def _read(self, path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                content = f.read()
+        except OSError:
+            return None
+        # Touch the file so eviction keeps recently used players.
+        os.utime(path)
+        return content
+
+    def _write(self, path, content):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(temp_path, path)
+
+
+default_cache = PlayerCache()
@@ -0,0 +1,187 @@
+"""Concurrent playlist engine.
+
+Videos are resolved and transferred on separate bounded pools, so the next
+videos are resolved while earlier ones are still downloading.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from batch_resolver import BatchResolver
+from manifest_cache import is_forbidden
+
+DEFAULT_RESOLVE_WORKERS = 8
+DEFAULT_DOWNLOAD_WORKERS = 2
+
+
+class PlaylistItemResult:
+    """The outcome of one playlist entry."""
+
+    def __init__(self, index, video_url):
+        self.index = index
+        self.video_url = video_url
+        self.title = None
+        self.path = None
+        self.error = None
+        self.completed = False
+        self.skipped = False
+
+    def __repr__(self):
+        if self.skipped:
+            status = "skipped"
+        else:
+            status = "error" if self.error else ("done" if self.completed else "stopped")
+        return f"<PlaylistItemResult {self.index:02d} {status}: {self.video_url}>"
+
+
+def highest_resolution(streams):
+    return streams.get_highest_resolution()
+
+
+def default_filename(index, video, stream):
+    return f"{index:02d} - {stream.default_filename}"
+
+
+def stream_download(stream, path):
+    directory, filename = os.path.split(path)
+    stream.download(output_path=directory or None, filename=filename)
+    return True
+
+
+class PlaylistPipeline:
+    def __init__(self, resolve_workers=DEFAULT_RESOLVE_WORKERS,
+                 download_workers=DEFAULT_DOWNLOAD_WORKERS, select_stream=highest_resolution,
+                 filename=default_filename, download_stream=stream_download,
+                 on_result=None, should_stop=None, resolver=None, journal=None,
+                 archive=None, archive_format="best"):
+        """Set up the pipeline.
+
+        Args:
+            resolve_workers: How many videos are resolved at the same time.
+            download_workers: How many videos are transferred at the same time.
+            select_stream: Picks a stream from a ``StreamQuery``.
+            filename: Builds the file name from ``(index, video, stream)``, where
+                ``video`` is a ``batch_resolver.ResolvedVideo``.
+            download_stream: Writes ``stream`` to ``path``; returns False if it
+                stopped before the file was complete.
+            on_result: Called with each ``PlaylistItemResult`` as it finishes.
+            should_stop: Returns True when pending items should be skipped.
+            resolver: The ``BatchResolver`` shared by all items; one with a
+                single innertube client is created when not given.
+            journal: A ``job_journal.JobJournal`` that records every transfer
+                so it can be resumed after a restart.
+            archive: A ``download_archive.DownloadArchive``; items already in it
+                are skipped before they are resolved, finished ones are added.
+            archive_format: The format key items are archived under.
+        """
+        self.resolve_workers = resolve_workers
+        self.download_workers = download_workers
+        self.select_stream = select_stream
+        self.filename = filename
+        self.download_stream = download_stream
+        self.on_result = on_result
+        self.should_stop = should_stop or (lambda: False)
+        self.resolver = resolver or BatchResolver(workers=resolve_workers)
+        self.journal = journal
+        self.archive = archive
+        self.archive_format = archive_format
+
+    def run(self, video_urls, output_directory):
+        """Resolve and download every URL; returns results in playlist order.
+
+        ``video_urls`` may be a lazy iterable such as
+        ``PlaylistSync.video_urls()``. Items start resolving and downloading
+        as soon as they arrive, while later ones are still being listed.
+        """
+        results = []
+        # Items listed but not yet transferring, so a long playlist doesn't
+        # queue (and hold the manifests of) every video at once.
+        in_flight = threading.BoundedSemaphore(self.resolve_workers * 2)
+        with ThreadPoolExecutor(max_workers=self.resolve_workers) as resolve_pool, \
+                ThreadPoolExecutor(max_workers=self.download_workers) as download_pool:
+            resolving = []
+            for idx, url in enumerate(video_urls, start=1):
+                result = PlaylistItemResult(idx, url)
+                results.append(result)
+                if self._archived(result):
+                    result.skipped = True
+                    self._finish(result)
+                    continue
+                in_flight.acquire()
+                resolving.append(resolve_pool.submit(self._resolve_and_queue, result, in_flight,
+                                                     download_pool, output_directory))
+            for future in resolving:
+                transfer = future.result()
+                if transfer is not None:
+                    transfer.result()
+        return results
+
+    def _resolve_and_queue(self, result, in_flight, download_pool, output_directory):
+        # Hands the item to the download pool as soon as it is resolved, even
+        # while the listing is still waiting for its next page.
+        try:
+            resolved = self._resolve(result)
+        except Exception as e:
+            in_flight.release()
+            self._finish(result, error=e)
+            return None
+        if resolved is None:
+            in_flight.release()
+            self._finish(result)
+            return None
+        video, stream = resolved
+        path = os.path.join(output_directory, self.filename(result.index, video, stream))
+        return download_pool.submit(self._transfer, result, stream, path, in_flight)
+
+    def _archived(self, result):
+        return self.archive is not None and self.archive.contains(result.video_url,
+                                                                  self.archive_format)
+
+    def _resolve(self, result):
+        if self.should_stop():
+            return None
+        video = self.resolver.resolve_one(result.video_url)
+        stream = self.select_stream(video.streams)
+        if stream is None:
+            raise LookupError(f"No matching stream for {result.video_url}")
+        result.title = video.title
+        return video, stream
+
+    def _transfer(self, result, stream, path, in_flight):
+        in_flight.release()
+        if self.should_stop():
+            self._finish(result)
+            return
+        result.path = path
+        download = lambda stream, path: self._download_fresh(result, stream, path)
+        try:
+            if self.journal:
+                completed = self.journal.run(result.video_url, stream, path, download)
+            else:
+                completed = download(stream, path)
+        except Exception as e:
+            self._finish(result, error=e)
+        else:
+            if completed and self.archive is not None:
+                self.archive.add(result.video_url, self.archive_format)
+            self._finish(result, completed=completed)
+
+    def _download_fresh(self, result, stream, path):
+        try:
+            return self.download_stream(stream, path)
+        except Exception as e:
+            if not is_forbidden(e):
+                raise
+        # The URL expired or was refused: resolve again and continue the same file.
+        stream = self.resolver.refresh(result.video_url).streams.get_by_itag(stream.itag)
+        if stream is None:
+            raise LookupError(f"No matching stream for {result.video_url}")
+        if self.journal:
+            self.journal.update_url(path, stream.url)
+        return self.download_stream(stream, path)
+
+    def _finish(self, result, error=None, completed=False):
+        result.error = error
+        result.completed = completed
+        if self.on_result:
+            self.on_result(result)
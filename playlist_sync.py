@@ -0,0 +1,127 @@
+"""Playlist enumeration with background page fetching and an on-disk snapshot.
+
+Pages are fetched on a background thread while the caller works through the
+first videos, and saved once a run completes. The next sync reuses them when
+the first page's videos and the header are unchanged, or refetches only the
+tail when the playlist just grew.
+"""
+import json
+import os
+import queue
+import threading
+
+from pytube import Playlist, request
+
+import response_cache
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "youtube_downloader", "playlists")
+_DONE = object()
+
+
+def _page(token, videos_urls, continuation):
+    return {"token": token, "ids": [url.split("=", 1)[1] for url in videos_urls],
+            "next": continuation}
+
+
+class PlaylistSync:
+    def __init__(self, url, cache_dir=DEFAULT_CACHE_DIR):
+        self.playlist = Playlist(url)
+        self.cache_dir = cache_dir
+        self.pages_fetched = 0
+
+    @property
+    def playlist_id(self):
+        return self.playlist.playlist_id
+
+    @property
+    def title(self):
+        return self.playlist.title
+
+    def video_urls(self):
+        """Yield watch URLs in playlist order as their pages arrive."""
+        for video_id in self.video_ids():
+            yield f"https://www.youtube.com/watch?v={video_id}"
+
+    def video_ids(self):
+        """Yield video IDs in playlist order, a video listed twice at both positions."""
+        pages = queue.Queue()
+        fetcher = threading.Thread(target=self._fetch_pages, args=(pages,),
+                                   name=f"playlist-{self.playlist_id}", daemon=True)
+        fetcher.start()
+        while True:
+            page = pages.get()
+            if page is _DONE:
+                return
+            if isinstance(page, Exception):
+                raise page
+            yield from page["ids"]
+
+    def _fetch_pages(self, pages):
+        try:
+            first = _page(None, *self.playlist._extract_videos(
+                json.dumps(self.playlist.initial_data)))
+            signature = self._signature()
+            fetched = [first]
+            stored = self._load()
+            # Continuation tokens change from one fetch to the next; the videos don't.
+            if stored and stored["pages"][0]["ids"] == first["ids"] and signature is not None:
+                if stored["signature"] == signature:
+                    fetched = stored["pages"]
+                elif stored["signature"] and signature[0] > stored["signature"][0]:
+                    fetched = self._grown(stored["pages"]) or fetched
+            for page in fetched:
+                pages.put(page)
+
+            while fetched[-1]["next"]:
+                page = self._fetch_page(fetched[-1]["next"])
+                fetched.append(page)
+                pages.put(page)
+            self._save({"signature": signature, "pages": fetched})
+        except Exception as e:
+            pages.put(e)
+        finally:
+            pages.put(_DONE)
+
+    def _grown(self, stored_pages):
+        # Refetch the last stored page: if its videos are still at the start of
+        # it, nothing before it moved and the earlier pages can be reused.
+        last = stored_pages[-1]
+        if last["token"] is None:
+            return None
+        # A cached copy would be the page as it was, not as it is now.
+        with response_cache.fresh():
+            page = self._fetch_page(last["token"])
+        if page["ids"][:len(last["ids"])] != last["ids"]:
+            return None
+        return stored_pages[:-1] + [page]
+
+    def _fetch_page(self, token):
+        url, headers, data = self.playlist._build_continuation_url(token)
+        raw_json = request.post(url, extra_headers=headers, data=data)
+        self.pages_fetched += 1
+        return _page(token, *self.playlist._extract_videos(raw_json))
+
+    def _signature(self):
+        # Video count and "last updated" from the playlist header, if it has them.
+        try:
+            return [self.playlist.length, str(self.playlist.last_updated)]
+        except (KeyError, IndexError, TypeError, ValueError):
+            return None
+
+    def _snapshot_path(self):
+        return os.path.join(self.cache_dir, f"{self.playlist_id}.json")
+
+    def _load(self):
+        try:
+            with open(self._snapshot_path(), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, snapshot):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._snapshot_path()
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, path)
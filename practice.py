@@ -1,9 +1,13 @@
-import pytube
 import tkinter as tk
 from tkinter import filedialog
 from tkinter import ttk
-import requests
 import threading
+from lazy_import import lazy_import
+from transfer import MIN_BLOCK_SIZE, copy_response
+
+# Imported on the first download, so the window opens right away.
+pytube = lazy_import("pytube")
+requests = lazy_import("requests")
 
 class DownloadManager:
     def __init__(self, progress_bar, quality_var):
@@ -13,7 +17,7 @@ class DownloadManager:
         self.stream = None
         self.bytes_downloaded = 0
         self.paused = False
-        self.chunk_size = 1024
+        self.chunk_size = MIN_BLOCK_SIZE
         self.progress_bar = progress_bar
         self.quality_var = quality_var
 
@@ -29,21 +33,25 @@ class DownloadManager:
             self.stream = youtube.streams.get_by_resolution(self.quality_var.get())
 
             response = requests.get(self.stream.url, stream=True)
+            # Let urllib3 undo any Content-Encoding, as iter_content would.
+            response.raw.decode_content = True
             total_size = int(response.headers.get('content-length', 0))
 
             filename = self.stream.default_filename
             if is_playlist:
                 filename = f"{playlist.title}/{filename}"
 
-            with open(filename, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=self.chunk_size):
-                    if self.paused:
-                        return
-
-                    if chunk:
-                        f.write(chunk)
-                        self.bytes_downloaded += len(chunk)
-                        self.update_progress(total_size)
+            def on_progress(block_length):
+                self.bytes_downloaded += block_length
+                self.update_progress(total_size)
+
+            with open(filename, 'wb', buffering=0) as f:
+                copy_response(response.raw, f, on_progress=on_progress,
+                              should_stop=lambda: self.paused, block_size=self.chunk_size)
+            if self.paused:
+                # Drop the connection instead of leaving the rest of the body unread.
+                response.close()
+                return
 
         self.progress_bar["value"] = 100
 
@@ -0,0 +1,113 @@
+"""Progress reporting that keeps Tk calls off the download threads.
+
+Workers append counts to a deque; one ``root.after`` tick folds them into
+percentage, rate and ETA across all transfers.
+"""
+import time
+from collections import deque
+
+RATE_SMOOTHING = 0.3  # weight of the newest sample in the moving average
+
+
+class ProgressSnapshot:
+    def __init__(self, downloaded, total, rate, transfers):
+        self.downloaded = downloaded
+        self.total = total
+        self.rate = rate  # bytes per second
+        self.transfers = transfers
+
+    @property
+    def percent(self):
+        if not self.total:
+            return 0.0
+        return min(self.downloaded / self.total * 100, 100.0)
+
+    @property
+    def eta(self):
+        """Seconds left at the current rate, or None if it is unknown."""
+        if not self.total or not self.rate:
+            return None
+        return max(self.total - self.downloaded, 0) / self.rate
+
+
+class ProgressTracker:
+    def __init__(self):
+        self._events = deque()
+        self._downloaded = {}
+        self._totals = {}
+        self._rate = 0.0
+        self._last_time = None
+        self._last_downloaded = 0
+
+    def set_total(self, transfer_id, total_size):
+        """Register the size of a transfer so it counts towards the totals."""
+        self._events.append((transfer_id, 0, total_size))
+
+    def add(self, transfer_id, byte_count):
+        """Record ``byte_count`` new bytes; safe to call from any thread."""
+        self._events.append((transfer_id, byte_count, None))
+
+    def snapshot(self):
+        """Fold pending counters into the totals; call from one thread only."""
+        events = self._events
+        downloaded = self._downloaded
+        while events:
+            transfer_id, byte_count, total_size = events.popleft()
+            downloaded[transfer_id] = downloaded.get(transfer_id, 0) + byte_count
+            if total_size is not None:
+                self._totals[transfer_id] = total_size
+
+        now = time.monotonic()
+        total_downloaded = sum(downloaded.values())
+        if self._last_time is not None and now > self._last_time:
+            sample = (total_downloaded - self._last_downloaded) / (now - self._last_time)
+            self._rate = RATE_SMOOTHING * sample + (1 - RATE_SMOOTHING) * self._rate
+        self._last_time = now
+        self._last_downloaded = total_downloaded
+
+        return ProgressSnapshot(total_downloaded, sum(self._totals.values()),
+                                self._rate, len(self._totals))
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+class TkProgressView:
+    def __init__(self, root, tracker, progress_bar=None, percentage_label=None,
+                 size_label=None, interval_ms=250):
+        self.root = root
+        self.tracker = tracker
+        self.progress_bar = progress_bar
+        self.percentage_label = percentage_label
+        self.size_label = size_label
+        self.interval_ms = interval_ms
+
+    def start(self, is_running, on_finished=None):
+        """Render every ``interval_ms`` until ``is_running()`` returns False."""
+        self.render()
+        if is_running():
+            self.root.after(self.interval_ms, self.start, is_running, on_finished)
+        elif on_finished:
+            on_finished()
+
+    def render(self):
+        snapshot = self.tracker.snapshot()
+        if self.progress_bar is not None:
+            self.progress_bar["value"] = snapshot.percent
+        if self.percentage_label is not None:
+            self.percentage_label.config(text=f"{snapshot.percent:.2f}%")
+        if self.size_label is not None:
+            downloaded_mb = snapshot.downloaded / (1024 * 1024)
+            total_mb = snapshot.total / (1024 * 1024)
+            rate_mb = snapshot.rate / (1024 * 1024)
+            self.size_label.config(
+                text=f"{downloaded_mb:.2f} MB / {total_mb:.2f} MB\n"
+                     f"{rate_mb:.2f} MB/s, ETA {format_eta(snapshot.eta)}"
+                     f" ({snapshot.transfers} files)")
@@ -0,0 +1,212 @@
+"""``pytube.YouTube`` with the player script and cipher served from a cache.
+
+The player comes from ``player_cache`` and signed streams from
+``manifest_cache``, so another ``YouTube`` for the same video needs no
+request while its URLs are valid.
+"""
+import copy
+import logging
+import time
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import pytube
+from pytube import extract
+from pytube.exceptions import ExtractError, LiveStreamError
+
+from compact_streams import CompactStream, IndexedStreamQuery
+from job_journal import EXPIRY_MARGIN, url_expiry
+from manifest_cache import default_cache as default_manifest_cache, is_forbidden
+from n_transform import NTransform
+from player_cache import default_cache
+from signature_transform import SignatureTransform
+
+logger = logging.getLogger(__name__)
+
+
+def needs_signature(stream):
+    """Whether a descrambled stream still has to go through the cipher."""
+    url = stream.get("url", "")
+    if "signature" in url:
+        return False
+    return "s" in stream or not ("&sig=" in url or "&lsig=" in url)
+
+
+def apply_signature(stream_manifest, vid_info, js_cipher, n_transform=None, signature_transform=None):
+    """Sign the stream URLs in place, like ``pytube.extract.apply_signature``.
+
+    Args:
+        stream_manifest: The output of ``extract.apply_descrambler``.
+        vid_info: The innertube player response.
+        js_cipher: A ready ``Cipher`` for the video's player.
+        n_transform: The player's ``NTransform``; built from ``js_cipher``
+            when not given.
+        signature_transform: The player's ``SignatureTransform``; built
+            from ``js_cipher`` when not given.
+    """
+    if n_transform is None:
+        n_transform = NTransform.from_cipher(js_cipher)
+    if signature_transform is None:
+        signature_transform = SignatureTransform.from_cipher(js_cipher)
+    for i, stream in enumerate(stream_manifest):
+        try:
+            url = stream["url"]
+        except KeyError:
+            live_stream = vid_info.get("playabilityStatus", {}).get("liveStreamability")
+            if live_stream:
+                raise LiveStreamError("UNKNOWN")
+            raise
+        if not needs_signature(stream):
+            # Already signed by YouTube, nothing to decipher.
+            continue
+
+        signature = signature_transform(stream["s"])
+
+        parsed_url = urlparse(url)
+        query_params = {k: v[0] for k, v in parse_qs(parsed_url.query).items()}
+        query_params["sig"] = signature
+        if "ratebypass" not in query_params:
+            query_params["n"] = n_transform(query_params["n"])
+
+        stream_manifest[i]["url"] = (
+            f"{parsed_url.scheme}://{parsed_url.netloc}{parsed_url.path}?{urlencode(query_params)}"
+        )
+
+
+class YouTube(pytube.YouTube):
+    # The client pytube's ``vid_info`` asks for; cached manifests are kept per client.
+    client = "ANDROID_MUSIC"
+
+    def __init__(self, url, *args, player_cache=default_cache,
+                 manifest_cache=default_manifest_cache, **kwargs):
+        super().__init__(url, *args, **kwargs)
+        self.player_cache = player_cache
+        self.manifest_cache = manifest_cache
+        self._streams = None
+
+    @property
+    def js(self):
+        if self._js:
+            return self._js
+        self._js = self.player_cache.get_js(self.js_url)
+        return self._js
+
+    @property
+    def vid_info(self):
+        # While the manifest cache holds the video, its ``videoDetails`` and
+        # ``captions`` answer ``title``, ``length``, ``author`` and friends
+        # without a player request. It isn't kept, so a resolve that needs
+        # the full response (streams, availability) still fetches it.
+        if self._vid_info:
+            return self._vid_info
+        cached = self._cached_manifest()
+        if cached is not None:
+            return cached.vid_info
+        return super().vid_info
+
+    @property
+    def streams(self):
+        # One query per video, so its indexes are built once. ``fmt_streams``
+        # checks availability when it has to resolve.
+        if self._streams is None or self._streams.fmt_streams is not self.fmt_streams:
+            self._streams = IndexedStreamQuery(self.fmt_streams)
+        return self._streams
+
+    @property
+    def fmt_streams(self):
+        if self._fmt_streams:
+            return self._fmt_streams
+
+        cached = self._cached_manifest()
+        if cached is not None:
+            # Signed by an earlier resolve and not expired yet.
+            self._title = self._title or cached.title
+            stream_manifest = cached.streams
+            duration = cached.length
+        else:
+            self.check_availability()
+            stream_manifest = self._signed_manifest()
+            duration = self.length
+            if self.manifest_cache:
+                self.manifest_cache.put(self.video_id, self.client, stream_manifest, self.vid_info)
+
+        self._fmt_streams = [CompactStream(stream=stream, monostate=self.stream_monostate)
+                             for stream in stream_manifest]
+
+        self.stream_monostate.title = self.title
+        self.stream_monostate.duration = duration
+        return self._fmt_streams
+
+    def refresh(self):
+        """Resolve the streams again, bypassing the caches, e.g. after a 403.
+
+        Returns the new ``IndexedStreamQuery``.
+        """
+        # response_cache imports tracing, which wraps this module's functions.
+        import response_cache
+
+        if self.manifest_cache:
+            self.manifest_cache.invalidate(self.video_id, self.client)
+        self._vid_info = None
+        self._fmt_streams = None
+        self._streams = None
+        with response_cache.fresh():
+            return self.streams
+
+    def download_fresh(self, stream, path, download, on_refresh=None):
+        """``download(stream, path)``, with a new URL if the stream's was refused.
+
+        A stream whose URL already expired is resolved again before it
+        starts; one refused with a 403 is resolved again once and continues
+        into the same ``path``.
+
+        Args:
+            stream: A stream of this video.
+            path: Where it is written.
+            download: Writes ``stream`` to ``path``, like the downloaders'
+                ``download_stream``; its return value is passed on.
+            on_refresh: Called with ``(stream, path)`` for the re-resolved stream.
+        """
+        expires = url_expiry(stream.url)
+        if expires is not None and expires - EXPIRY_MARGIN <= time.time():
+            stream = self._refreshed(stream, path, on_refresh)
+        try:
+            return download(stream, path)
+        except Exception as e:
+            if not is_forbidden(e):
+                raise
+            logger.debug("stream url of %s refused, resolving again", self.watch_url)
+        return download(self._refreshed(stream, path, on_refresh), path)
+
+    def _refreshed(self, stream, path, on_refresh):
+        fresh = self.refresh().get_by_itag(stream.itag)
+        if fresh is None:
+            raise ExtractError(f"itag {stream.itag} is no longer offered for {self.watch_url}")
+        if on_refresh:
+            on_refresh(fresh, path)
+        return fresh
+
+    def _cached_manifest(self):
+        if not self.manifest_cache:
+            return None
+        return self.manifest_cache.get(self.video_id, self.client)
+
+    def _signed_manifest(self):
+        # Descramble a copy so a failed attempt leaves streaming_data untouched.
+        stream_manifest = extract.apply_descrambler(copy.deepcopy(self.streaming_data))
+        if any(needs_signature(stream) for stream in stream_manifest):
+            try:
+                self._sign(stream_manifest)
+            except ExtractError:
+                # The cached player may be stale, fetch and parse it again.
+                logger.debug("cached cipher failed for %s, refreshing", self.js_url)
+                self.player_cache.invalidate(self.js_url)
+                self._js = None
+                stream_manifest = extract.apply_descrambler(copy.deepcopy(self.streaming_data))
+                self._sign(stream_manifest)
+        return stream_manifest
+
+    def _sign(self, stream_manifest):
+        apply_signature(stream_manifest, self.vid_info,
+                        self.player_cache.get_cipher(self.js_url),
+                        self.player_cache.get_n_transform(self.js_url),
+                        self.player_cache.get_signature_transform(self.js_url))
@@ -0,0 +1,347 @@
+"""Response cache in front of ``pytube.request`` and the innertube API.
+
+Pages and player responses are kept in memory and on disk for their
+endpoint's TTL (``DEFAULT_TTLS``) and revalidated with ``ETag`` when they
+expire. Requests inside ``with fresh():`` always go to YouTube.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import re
+import socket
+import threading
+import time
+from collections import OrderedDict
+from urllib import parse
+from urllib.error import HTTPError
+
+from pytube import request
+from pytube.innertube import InnerTube
+
+import tracing
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "youtube_downloader", "responses")
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_MEMORY = 64 * 1024 * 1024
+DEFAULT_MAX_DISK = 256 * 1024 * 1024
+# Seconds a response is used without asking YouTube again. Player responses
+# hold signed stream URLs, so they are kept well short of their expiry.
+DEFAULT_TTLS = {
+    "player": 5 * 60,
+    "browse": 10 * 60,
+    "watch": 30 * 60,
+    "embed": 30 * 60,
+    "playlist": 10 * 60,
+    "channel": 30 * 60,
+    "player_js": 24 * 60 * 60,
+    "captions": 60 * 60,
+}
+_ENDPOINTS = (
+    ("player", re.compile(r"/youtubei/v1/player\b")),
+    ("browse", re.compile(r"/youtubei/v1/(?:browse|next)\b")),
+    ("watch", re.compile(r"youtube\.com/watch\?")),
+    ("embed", re.compile(r"youtube\.com/embed/")),
+    ("playlist", re.compile(r"youtube\.com/playlist\?")),
+    ("channel", re.compile(r"youtube\.com/(?:c/|channel/|user/|@)")),
+    ("player_js", re.compile(r"/s/player/[^?]*\.js$")),
+    ("captions", re.compile(r"/api/timedtext\?")),
+)
+# Only playable player responses are kept; a bot check or an error may be gone on retry.
+_PLAYABLE = re.compile(rb'"playabilityStatus"\s*:\s*\{\s*"status"\s*:\s*"OK"')
+_KEY_LOCKS = 64
+_local = threading.local()
+
+
+def endpoint_of(url):
+    """The ``DEFAULT_TTLS`` key for ``url``, or None if it isn't cacheable."""
+    for endpoint, pattern in _ENDPOINTS:
+        if pattern.search(url):
+            return endpoint
+    return None
+
+
+@contextlib.contextmanager
+def fresh():
+    """Skip the stored responses for the requests this thread makes in the block."""
+    previous = getattr(_local, "fresh", False)
+    _local.fresh = True
+    try:
+        yield
+    finally:
+        _local.fresh = previous
+
+
+class CachedResponse:
+    def __init__(self, url, body, expires, etag=None, last_modified=None):
+        self.url = url
+        self.body = body
+        self.expires = expires
+        self.etag = etag
+        self.last_modified = last_modified
+
+
+class ResponseCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, ttls=None, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_memory=DEFAULT_MAX_MEMORY, max_disk=DEFAULT_MAX_DISK):
+        """Set up the cache.
+
+        Args:
+            cache_dir: Where responses are stored on disk; None keeps them in
+                memory only.
+            ttls: Seconds per endpoint (see ``endpoint_of``), merged over
+                ``DEFAULT_TTLS``. A TTL of 0 turns caching off for that endpoint.
+            max_entries: The most responses kept in memory.
+            max_memory: The most response bytes kept in memory.
+            max_disk: The most response bytes kept on disk; the least
+                recently used are removed first.
+        """
+        self.cache_dir = cache_dir
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.max_entries = max_entries
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = None
+        self._lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(_KEY_LOCKS)]
+
+    def fetch(self, url, method=None, headers=None, data=None,
+              timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
+        """``request._execute_request(...).read()``, answered from the cache when possible."""
+        endpoint = endpoint_of(url)
+        ttl = self.ttls.get(endpoint, 0)
+        if not ttl:
+            return self._execute(url, method, headers, data, timeout).read()
+
+        key = self._key(url, method, headers, data)
+        use_stored = not getattr(_local, "fresh", False)
+        entry = self._get(key) if use_stored else None
+        if entry is not None and entry.expires > time.time():
+            tracing.count("cache_hits", endpoint=endpoint)
+            return entry.body
+        # The second of two identical requests waits for the first one's response.
+        with self._key_locks[int(key[:8], 16) % _KEY_LOCKS]:
+            entry = self._get(key) if use_stored else None
+            if entry is not None and entry.expires > time.time():
+                tracing.count("cache_hits", endpoint=endpoint)
+                return entry.body
+            return self._refresh(key, endpoint, ttl, entry, url, method, headers, data, timeout)
+
+    def get(self, url, extra_headers=None, timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
+        """Drop-in replacement for ``pytube.request.get``."""
+        return self.fetch(url, headers=extra_headers or {}, timeout=timeout).decode("utf-8")
+
+    def post(self, url, extra_headers=None, data=None, timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
+        """Drop-in replacement for ``pytube.request.post``."""
+        headers = dict(extra_headers or {}, **{"Content-Type": "application/json"})
+        return self.fetch(url, headers=headers, data=data or {}, timeout=timeout).decode("utf-8")
+
+    def call_api(self, innertube, endpoint, query, data):
+        """``InnerTube._call_api`` through the cache."""
+        if innertube.use_oauth:
+            del query["key"]
+        headers = {"Content-Type": "application/json"}
+        if innertube.use_oauth:
+            if innertube.access_token:
+                innertube.refresh_bearer_token()
+            else:
+                innertube.fetch_bearer_token()
+            headers["Authorization"] = f"Bearer {innertube.access_token}"
+        headers.update(innertube.header)
+        body = self.fetch(f"{endpoint}?{parse.urlencode(query)}", "POST", headers=headers, data=data)
+        return json.loads(body)
+
+    def clear(self):
+        """Forget every response, in memory and on disk."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            for name in self._disk_names():
+                self._remove(name)
+            self._disk_bytes = 0
+
+    def _refresh(self, key, endpoint, ttl, entry, url, method, headers, data, timeout):
+        headers = dict(headers or {})
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        response = None
+        try:
+            response = self._execute(url, method, headers, data, timeout)
+            status = response.getcode()
+        except HTTPError as e:
+            # urlopen reports a 304 as an error.
+            if e.code != 304 or entry is None:
+                raise
+            status = 304
+        if status == 304 and entry is not None:
+            if response is not None:
+                response.close()
+            tracing.count("cache_revalidations", endpoint=endpoint)
+            entry.expires = time.time() + ttl
+            self._put(key, entry)
+            return entry.body
+
+        tracing.count("cache_misses", endpoint=endpoint)
+        try:
+            body = response.read()
+        finally:
+            response.close()
+        if endpoint == "player" and not _PLAYABLE.search(body):
+            return body
+        response_headers = response.info()
+        self._put(key, CachedResponse(url, body, time.time() + ttl,
+                                      response_headers.get("ETag"),
+                                      response_headers.get("Last-Modified")))
+        return body
+
+    @staticmethod
+    def _execute(url, method, headers, data, timeout):
+        # Looked up on each call so other patches of the transport still apply.
+        return request._execute_request(url, method, headers=headers, data=data, timeout=timeout)
+
+    @staticmethod
+    def _key(url, method, headers, data):
+        if data and not isinstance(data, bytes):
+            data = json.dumps(data, sort_keys=True).encode("utf-8")
+        # Responses fetched with a login are only shared by requests with the same login.
+        authorization = (headers or {}).get("Authorization", "")
+        key = hashlib.sha256()
+        for part in (method or ("POST" if data else "GET"), url, authorization):
+            key.update(part.encode("utf-8") + b"\0")
+        key.update(data or b"")
+        return key.hexdigest()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry
+        entry = self._read(key)
+        if entry is not None:
+            with self._lock:
+                self._remember(key, entry)
+        return entry
+
+    def _put(self, key, entry):
+        with self._lock:
+            self._remember(key, entry)
+        self._write(key, entry)
+
+    def _remember(self, key, entry):
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous.body)
+        self._memory[key] = entry
+        self._memory_bytes += len(entry.body)
+        while self._memory and (len(self._memory) > self.max_entries
+                                or self._memory_bytes > self.max_memory):
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted.body)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.http")
+
+    def _read(self, key):
+        if self.cache_dir is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                meta = json.loads(f.readline())
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        # Touch the file so eviction keeps recently used responses.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return CachedResponse(meta["url"], body, meta["expires"], meta.get("etag"),
+                              meta.get("last_modified"))
+
+    def _write(self, key, entry):
+        if self.cache_dir is None:
+            return
+        meta = {"url": entry.url, "expires": entry.expires, "etag": entry.etag,
+                "last_modified": entry.last_modified}
+        content = json.dumps(meta).encode("utf-8") + b"\n" + entry.body
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            with open(temp_path, "wb") as f:
+                f.write(content)
+            os.replace(temp_path, path)
+        except OSError:
+            # The cache is an optimisation; a full or read-only disk isn't an error.
+            return
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+            else:
+                self._disk_bytes += len(content) - replaced
+            if self._disk_bytes > self.max_disk:
+                self._evict()
+
+    def _evict(self):
+        # Oldest first until the store fits again.
+        files = sorted(self._disk_files(), key=lambda file: file[2])
+        self._disk_bytes = sum(size for _, size, _ in files)
+        for name, size, _ in files:
+            if self._disk_bytes <= self.max_disk:
+                break
+            self._remove(name)
+            self._disk_bytes -= size
+
+    def _disk_names(self):
+        if self.cache_dir is None:
+            return []
+        try:
+            return [name for name in os.listdir(self.cache_dir) if name.endswith(".http")]
+        except OSError:
+            return []
+
+    def _disk_files(self):
+        files = []
+        for name in self._disk_names():
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            files.append((name, stat.st_size, stat.st_mtime))
+        return files
+
+    def _remove(self, name):
+        try:
+            os.remove(os.path.join(self.cache_dir, name))
+        except OSError:
+            pass
+
+
+default_cache = ResponseCache()
+_originals = (request.get, request.post, InnerTube._call_api)
+
+
+def install(cache=default_cache):
+    """Answer pytube's page, player and API requests from ``cache``."""
+    request.get = cache.get
+    request.post = cache.post
+
+    def _call_api(self, endpoint, query, data):
+        return cache.call_api(self, endpoint, query, data)
+
+    InnerTube._call_api = _call_api
+
+
+def uninstall():
+    request.get, request.post, InnerTube._call_api = _originals
@@ -0,0 +1,254 @@
+"""Multi-connection downloader that fetches a file as parallel byte ranges.
+
+Ranges are written at their offsets in a preallocated file, and the bytes
+written per range are saved so an interrupted download resumes.
+"""
+import http.client
+import io
+import json
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+
+from http_transport import default_transport
+from manifest_cache import is_forbidden
+import tracing
+from transfer import MIN_BLOCK_SIZE, copy_response
+
+DEFAULT_CONNECTIONS = 4
+DEFAULT_SEGMENT_SIZE = 8 * 1024 * 1024  # 8 MB
+
+
+class SegmentedDownloadError(Exception):
+    """Raised when a range can not be fetched after all retries."""
+
+
+def split_ranges(total_size, segment_size):
+    """Split a file into inclusive ``(start, end)`` byte ranges.
+
+    Args:
+        total_size: The size of the file in bytes.
+        segment_size: The maximum size of a single range in bytes.
+    """
+    return [
+        (start, min(start + segment_size, total_size) - 1)
+        for start in range(0, total_size, segment_size)
+    ]
+
+
+def preallocate(path, total_size):
+    """Create ``path`` at its full size; True if a partial file of that size is reused."""
+    if os.path.exists(path) and os.path.getsize(path) == total_size:
+        return True
+    with open(path, "wb") as f:
+        f.truncate(total_size)
+    return False
+
+
+def sync_file(path):
+    """Flush the written blocks of ``path`` to the disk."""
+    with open(path, "rb") as f:
+        os.fsync(f.fileno())
+
+
+class PartsFile:
+    """Keeps the bytes written per range in a ``<file>.parts`` file next to it.
+
+    Any object with the same ``load``/``save``/``clear`` methods can be passed
+    to the downloaders as ``state_store``, e.g. a ``job_journal.JobJournal``.
+    """
+
+    def load(self, path, total_size, segment_size):
+        """Bytes already written per range start.
+
+        Returns an empty dict when there is no state or it belongs to a
+        different file size or range layout.
+        """
+        try:
+            with open(path + ".parts") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if state.get("total_size") != total_size or state.get("segment_size") != segment_size:
+            return {}
+        return {int(start): count for start, count in state["written"].items()}
+
+    def save(self, path, total_size, segment_size, written):
+        state = {"total_size": total_size, "segment_size": segment_size,
+                 "written": {str(start): count for start, count in written.items()}}
+        with open(path + ".parts", "w") as f:
+            json.dump(state, f)
+
+    def clear(self, path):
+        if os.path.exists(path + ".parts"):
+            os.remove(path + ".parts")
+
+
+class SegmentedDownloader:
+    def __init__(self, connections=DEFAULT_CONNECTIONS, segment_size=DEFAULT_SEGMENT_SIZE,
+                 block_size=MIN_BLOCK_SIZE, max_retries=3, timeout=30,
+                 transport=None, state_store=None, scheduler=None, weight=1,
+                 on_progress=None, should_stop=None):
+        self.connections = connections
+        self.segment_size = segment_size
+        self.block_size = block_size
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.transport = transport or default_transport
+        self.state_store = state_store or PartsFile()
+        self.scheduler = scheduler
+        self.weight = weight
+        self.on_progress = on_progress
+        self.should_stop = should_stop or (lambda: False)
+        self._lock = threading.Lock()
+        self._abort = threading.Event()
+
+    def probe_size(self, url):
+        """Read the total size of ``url`` from a one byte range request."""
+        with self.transport.get(url, headers={"Range": "bytes=0-0"}, timeout=self.timeout) as response:
+            pass
+        content_range = response.headers.get("Content-Range", "")
+        if "/" in content_range:
+            return int(content_range.rsplit("/", 1)[1])
+        return int(response.headers.get("Content-Length", 0))
+
+    def download(self, url, path, total_size=None):
+        """Download ``url`` to ``path`` over several connections.
+
+        Args:
+            url: The media URL, it must accept HTTP range requests.
+            path: Where the file should be written.
+            total_size: The size of the file in bytes if it is already known.
+
+        Returns:
+            True when the file is complete, False when ``should_stop`` asked
+            the download to stop early. The partial file and its state are
+            kept, so calling ``download`` again resumes it.
+        """
+        if not total_size:
+            total_size = self.probe_size(url)
+
+        written = self.state_store.load(path, total_size, self.segment_size)
+        if not preallocate(path, total_size):
+            written = {}
+
+        pending = [(start, end) for start, end in split_ranges(total_size, self.segment_size)
+                   if written.get(start, 0) < end - start + 1]
+        if self.on_progress:
+            already_done = sum(written.values())
+            if already_done:
+                self.on_progress(already_done)
+
+        self._abort.clear()
+        bandwidth = self.scheduler.job(path, self.weight) if self.scheduler else None
+        with ThreadPoolExecutor(max_workers=self.connections) as pool:
+            throttle = bandwidth.acquire if bandwidth else None
+            futures = [pool.submit(self._fetch_range, url, path, start, end, written, throttle)
+                       for start, end in pending]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+                    self._save_state(path, total_size, written)
+            except Exception:
+                # Stop the other ranges, they resume on the next call.
+                self._abort.set()
+                raise
+            finally:
+                self._save_state(path, total_size, written)
+                if bandwidth:
+                    bandwidth.close()
+
+        if sum(written.values()) < total_size:
+            return False
+        self.state_store.clear(path)
+        return True
+
+    def stream(self, url, total_size=None, throttle=None):
+        """Yield the bytes of ``url`` in order, fetching the next ranges in parallel.
+
+        Nothing is written to disk and at most ``connections`` ranges are
+        held in memory, so the bytes can go into a pipe. ``throttle`` is
+        called with the size of every read before it is made, like
+        ``copy_response``'s.
+        """
+        if not total_size:
+            total_size = self.probe_size(url)
+        self._abort.clear()
+        ranges = deque(split_ranges(total_size, self.segment_size))
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.connections) as pool:
+            try:
+                while ranges or pending:
+                    while ranges and len(pending) < self.connections:
+                        start, end = ranges.popleft()
+                        pending.append(pool.submit(self._read_range, url, start, end, throttle))
+                    data = pending.popleft().result()
+                    if self._stopping():
+                        return
+                    yield data
+            finally:
+                # Stopped, failed or abandoned: don't finish the ranges in flight.
+                self._abort.set()
+                for future in pending:
+                    future.cancel()
+
+    def _read_range(self, url, start, end, throttle):
+        buffer = io.BytesIO()
+        self._fetch_range(url, None, start, end, {}, throttle, buffer)
+        return buffer.getvalue()
+
+    def _fetch_range(self, url, path, start, end, written, throttle=None, buffer=None):
+        def on_block(block_length):
+            with self._lock:
+                written[start] = written.get(start, 0) + block_length
+                if self.on_progress:
+                    self.on_progress(block_length)
+
+        tries = 0
+        while True:
+            offset = start + written.get(start, 0)
+            if offset > end or self._stopping():
+                return
+            try:
+                with self.transport.get(url, headers={"Range": f"bytes={offset}-{end}"},
+                                        timeout=self.timeout) as response:
+                    if response.status != 206 and offset > 0:
+                        raise SegmentedDownloadError(f"Server ignored range request for {url}")
+                    with self._open_at(path, buffer, start, offset) as f:
+                        copy_response(response, f, on_progress=on_block,
+                                      should_stop=self._stopping, limit=end - offset + 1,
+                                      block_size=self.block_size, throttle=throttle)
+                if self._stopping():
+                    return
+                if start + written.get(start, 0) <= end:
+                    raise SegmentedDownloadError(f"Connection closed early at byte {offset}")
+                return
+            except (OSError, http.client.HTTPException, SegmentedDownloadError) as e:
+                if is_forbidden(e):
+                    # An expired URL stays refused; the caller has to resolve the stream again.
+                    raise SegmentedDownloadError(f"Range {start}-{end} failed: {e}") from e
+                tries += 1
+                tracing.count("retries", kind="range")
+                if tries > self.max_retries:
+                    raise SegmentedDownloadError(f"Range {start}-{end} failed: {e}") from e
+
+    def _open_at(self, path, buffer, start, offset):
+        # A range goes to its offset in the file, or into its own ``buffer``.
+        if buffer is not None:
+            buffer.seek(offset - start)
+            return nullcontext(buffer)
+        f = open(path, "r+b", buffering=0)
+        f.seek(offset)
+        return f
+
+    def _stopping(self):
+        return self._abort.is_set() or self.should_stop()
+
+    def _save_state(self, path, total_size, written):
+        with self._lock:
+            written = dict(written)
+        # Record only counts whose bytes are already on the disk.
+        sync_file(path)
+        self.state_store.save(path, total_size, self.segment_size, written)
@@ -0,0 +1,63 @@
+"""Signature deciphering compiled into a permutation of the input.
+
+The transform plan is run once per signature length on the indexes and kept
+as a few slices, so deciphering a signature is one ``join``.
+"""
+import functools
+
+DEFAULT_CACHE_SIZE = 64  # signature lengths per player
+
+
+def _as_slices(indexes):
+    """Compress a permutation into runs of consecutive or reversed indexes."""
+    slices = []
+    i = 0
+    while i < len(indexes):
+        start = indexes[i]
+        step = 1
+        if i + 1 < len(indexes) and indexes[i + 1] == start - 1:
+            step = -1
+        j = i + 1
+        while j < len(indexes) and indexes[j] == indexes[j - 1] + step:
+            j += 1
+        stop = indexes[j - 1] + step
+        slices.append(slice(start, stop if stop >= 0 else None, step))
+        i = j
+    return tuple(slices)
+
+
+class SignatureTransform:
+    def __init__(self, steps, cache_size=DEFAULT_CACHE_SIZE):
+        """Compile a transform plan.
+
+        Args:
+            steps: ``(function, argument)`` pairs, where each function takes
+                a list and the argument and returns the transformed list, as
+                ``cipher.reverse``, ``splice`` and ``swap`` do.
+            cache_size: How many signature lengths are kept compiled.
+        """
+        self.steps = steps
+        self._compile = functools.lru_cache(maxsize=cache_size)(self._evaluate)
+
+    @classmethod
+    def from_cipher(cls, js_cipher, cache_size=DEFAULT_CACHE_SIZE):
+        steps = []
+        for js_func in js_cipher.transform_plan:
+            name, argument = js_cipher.parse_function(js_func)
+            steps.append((js_cipher.transform_map[name], argument))
+        return cls(steps, cache_size)
+
+    def __call__(self, signature):
+        """Return the deciphered ``signature``."""
+        return "".join([signature[part] for part in self._compile(len(signature))])
+
+    def permutation(self, length):
+        """The source index of each deciphered character, for ``length``."""
+        return [index for part in self._compile(length)
+                for index in range(length)[part]]
+
+    def _evaluate(self, length):
+        indexes = list(range(length))
+        for function, argument in self.steps:
+            indexes = function(indexes, argument)
+        return _as_slices(indexes)
@@ -0,0 +1,160 @@
+"""Size discovery for media streams without extra probe requests.
+
+``SizeService`` takes sizes from the manifest or the first data response,
+caches them per URL and probes OTF segments concurrently.
+"""
+import http.client
+import re
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from math import ceil
+from urllib import parse
+from urllib.error import URLError
+
+from pytube import request
+from pytube.exceptions import MaxRetriesExceeded, RegexMatchError
+
+import tracing
+
+SEGMENT_COUNT_PATTERN = re.compile(rb"Segment-Count: (\d+)")
+DEFAULT_PROBE_WORKERS = 8
+
+
+def size_from_headers(headers, status):
+    """Total size from a data response, or None if the headers don't tell."""
+    content_range = headers.get("Content-Range")
+    if content_range and "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        if total.isdigit():
+            return int(total)
+    if status == 200 and headers.get("Content-Length"):
+        return int(headers["Content-Length"])
+    return None
+
+
+def segment_url(url, sequence_number):
+    split_url = parse.urlsplit(url)
+    querys = dict(parse.parse_qsl(split_url.query))
+    querys["sq"] = sequence_number
+    return f"{split_url.scheme}://{split_url.netloc}{split_url.path}?{parse.urlencode(querys)}"
+
+
+def segment_count(header_segment):
+    match = SEGMENT_COUNT_PATTERN.search(header_segment)
+    if not match:
+        raise RegexMatchError("segment_count", SEGMENT_COUNT_PATTERN.pattern)
+    return int(match.group(1))
+
+
+class SizeService:
+    def __init__(self, probe_workers=DEFAULT_PROBE_WORKERS):
+        self.probe_workers = probe_workers
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def cached(self, url):
+        return self._sizes.get(url)
+
+    def remember(self, url, size):
+        if size:
+            with self._lock:
+                self._sizes[url] = size
+
+    def size_of(self, stream):
+        """Return the size of a ``pytube.Stream`` and store it on the stream."""
+        size = stream._filesize or self.cached(stream.url)
+        if not size:
+            size = self.seq_filesize(stream.url) if stream.is_otf else self.filesize(stream.url)
+        self.remember(stream.url, size)
+        stream._filesize = size
+        if hasattr(stream, "_filesize_kb"):
+            # pytube's Stream keeps rounded copies; CompactStream derives them from _filesize.
+            stream._filesize_kb = float(ceil(size / 1024 * 1000) / 1000)
+            stream._filesize_mb = float(ceil(size / 1024 / 1024 * 1000) / 1000)
+            stream._filesize_gb = float(ceil(size / 1024 / 1024 / 1024 * 1000) / 1000)
+        return size
+
+    def filesize(self, url):
+        """Size of a ranged stream from a single one byte request."""
+        size = self.cached(url)
+        if size:
+            return size
+        with request._execute_request(url, method="GET", headers={"Range": "bytes=0-0"}) as response:
+            size = size_from_headers(response.info(), response.status)
+        if size is None:
+            size = int(request.head(url)["content-length"])
+        self.remember(url, size)
+        return size
+
+    def seq_filesize(self, url):
+        """Size of a sequential (OTF) stream, probing the segments concurrently."""
+        size = self.cached(url)
+        if size:
+            return size
+        header_segment = request._execute_request(segment_url(url, 0), method="GET").read()
+        count = segment_count(header_segment)
+        segment_urls = [segment_url(url, sq) for sq in range(1, count + 1)]
+        with ThreadPoolExecutor(max_workers=self.probe_workers) as pool:
+            sizes = pool.map(lambda u: int(request.head(u)["content-length"]), segment_urls)
+            size = len(header_segment) + sum(sizes)
+        self.remember(url, size)
+        return size
+
+    def stream(self, url, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, max_retries=0):
+        """Same windows as ``pytube.request.stream`` without the full-range probe.
+
+        The total size comes from this cache or from the ``Content-Range`` of
+        the first window.
+        """
+        file_size = self.cached(url)
+        downloaded = 0
+        while file_size is None or downloaded < file_size:
+            stop_pos = downloaded + request.default_range_size - 1
+            if file_size is not None:
+                stop_pos = min(stop_pos, file_size - 1)
+            response = self._open_window(url, downloaded, stop_pos, timeout, max_retries)
+            if file_size is None:
+                file_size = size_from_headers(response.info(), response.status) or 0
+                self.remember(url, file_size)
+            window_start = downloaded
+            while True:
+                chunk = response.read()
+                if not chunk:
+                    break
+                downloaded += len(chunk)
+                yield chunk
+            if downloaded == window_start:
+                # An empty window would loop forever; the server has no more data.
+                return
+
+    def _open_window(self, url, start, stop, timeout, max_retries):
+        tries = 0
+        while True:
+            if tries >= 1 + max_retries:
+                raise MaxRetriesExceeded()
+            try:
+                return request._execute_request(url, method="GET", timeout=timeout,
+                                                headers={"Range": f"bytes={start}-{stop}"})
+            except URLError as e:
+                if not isinstance(e.reason, socket.timeout):
+                    raise
+            except http.client.IncompleteRead:
+                pass
+            tracing.count("retries", kind="window")
+            tries += 1
+
+
+default_service = SizeService()
+_originals = (request.stream, request.filesize, request.seq_filesize)
+
+
+def install(service=default_service):
+    """Serve ``pytube.request`` sizes and windows from ``service``."""
+    request.stream = service.stream
+    request.filesize = service.filesize
+    request.seq_filesize = service.seq_filesize
+
+
+def uninstall():
+    request.stream, request.filesize, request.seq_filesize = _originals
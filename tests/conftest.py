@@ -0,0 +1,23 @@
+import pytest
+
+from benchmark import MB, GoogleVideoStub, route_to
+
+
+@pytest.fixture(scope="module")
+def stub():
+    """A ``GoogleVideoStub`` with small media, running for the module's tests."""
+    server = GoogleVideoStub(size=2 * MB, segment_count=6, segment_size=64 * 1024).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def routed(stub, monkeypatch):
+    """Send pytube's youtube.com and googlevideo requests to ``stub`` for one test."""
+    from pytube import request
+
+    monkeypatch.setattr(request, "_execute_request", request._execute_request)
+    route_to(stub.base_url)
+    stub.take_counts()
+    return stub
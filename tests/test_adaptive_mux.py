@@ -0,0 +1,38 @@
+from pytube import Stream, StreamQuery
+
+from adaptive_mux import select_adaptive
+
+MIME_TYPES = {
+    137: 'video/mp4; codecs="avc1.640028"',
+    248: 'video/webm; codecs="vp9"',
+    313: 'video/webm; codecs="vp9"',
+    140: 'audio/mp4; codecs="mp4a.40.2"',
+    251: 'audio/webm; codecs="opus"',
+}
+
+
+def streams(*itags):
+    return StreamQuery([Stream({"url": f"https://example.invalid/{itag}", "itag": itag,
+                                "mimeType": MIME_TYPES[itag], "is_otf": False, "bitrate": 1000},
+                               monostate=None) for itag in itags])
+
+
+def itags(pair):
+    return tuple(stream.itag for stream in pair)
+
+
+def test_mp4_is_preferred_at_the_same_resolution():
+    assert itags(select_adaptive(streams(248, 137, 251, 140), "1080p")) == (137, 140)
+
+
+def test_webm_above_1080p_goes_with_webm_audio():
+    assert itags(select_adaptive(streams(137, 313, 140, 251), "2160p")) == (313, 251)
+    assert itags(select_adaptive(streams(137, 313, 140, 251))) == (313, 251)
+
+
+def test_webm_without_webm_audio_is_skipped():
+    assert itags(select_adaptive(streams(137, 313, 140), "2160p")) == (137, 140)
+
+
+def test_lowest_track_when_none_fits():
+    assert itags(select_adaptive(streams(137, 140), "720p")) == (137, 140)
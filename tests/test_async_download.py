@@ -0,0 +1,49 @@
+from async_download import AsyncDownloadManager, SyncDownloadManager
+from tests.test_otf_download import SEGMENT_SIZE, SEGMENTS, expected_stream, otf_url
+
+
+def test_otf_total_comes_from_the_header(stub, tmp_path):
+    engine = SyncDownloadManager(AsyncDownloadManager())
+    path = tmp_path / "otf.mp4"
+    totals = []
+    stub.take_counts()
+    try:
+        assert engine.download_segments(otf_url(stub), str(path), on_total=totals.append)
+    finally:
+        engine.close()
+
+    assert path.read_bytes() == expected_stream()
+    assert totals == [len(expected_stream())] * 2
+    assert stub.take_counts()["media"] == SEGMENTS + 1
+
+
+class RecordingScheduler:
+    """Lets every byte through and records what each job asked for."""
+
+    def __init__(self):
+        self.charges = []
+
+    def job(self, name, weight=1):
+        return self
+
+    async def acquire_async(self, n):
+        self.charges.append(n)
+
+    def close(self):
+        pass
+
+
+def test_otf_segments_are_charged_before_each_read(stub, tmp_path):
+    scheduler = RecordingScheduler()
+    block_size = 16 * 1024
+    engine = SyncDownloadManager(AsyncDownloadManager(scheduler=scheduler, block_size=block_size))
+    path = tmp_path / "otf.mp4"
+    try:
+        assert engine.download_segments(otf_url(stub), str(path))
+    finally:
+        engine.close()
+
+    assert path.read_bytes() == expected_stream()
+    # Block by block, not a whole segment after it has arrived.
+    assert set(scheduler.charges) == {block_size}
+    assert len(scheduler.charges) * block_size >= SEGMENTS * SEGMENT_SIZE
@@ -0,0 +1,59 @@
+import datetime
+import threading
+import time
+
+from bandwidth import PAUSE_POLL, BandwidthScheduler
+
+
+def test_no_cap_grants_every_read():
+    job = BandwidthScheduler().job("a")
+    assert job.reserve(10 * 1024 * 1024) == 0
+
+
+def test_paused_jobs_wait_until_resumed():
+    scheduler = BandwidthScheduler()
+    job = scheduler.job("a")
+    other = scheduler.job("b")
+    job.pause()
+    assert job.reserve(1) == PAUSE_POLL
+    assert other.reserve(1) == 0
+    job.resume()
+    assert job.reserve(1) == 0
+    scheduler.pause()
+    assert other.reserve(1) == PAUSE_POLL
+
+
+def test_cap_holds_reads_back():
+    job = BandwidthScheduler(rate=1000).job("a")
+    assert job.reserve(500) > 0
+
+
+def test_schedule_windows_wrap_past_midnight():
+    scheduler = BandwidthScheduler(rate=100, schedule=[("08:00", "23:00", 10), ("23:00", "02:00", 0)])
+    assert scheduler.current_rate(datetime.time(12, 0)) == 10
+    assert scheduler.current_rate(datetime.time(23, 30)) == 0
+    assert scheduler.current_rate(datetime.time(1, 0)) == 0
+    assert scheduler.current_rate(datetime.time(5, 0)) == 100
+
+
+def test_competing_jobs_share_by_weight():
+    scheduler = BandwidthScheduler(rate=2 * 1024 * 1024)
+    received = {}
+    deadline = time.monotonic() + 0.8
+
+    def transfer(name, weight):
+        received[name] = 0
+        with scheduler.job(name, weight) as job:
+            while time.monotonic() < deadline:
+                job.acquire(16 * 1024)
+                received[name] += 16 * 1024
+
+    threads = [threading.Thread(target=transfer, args=("light", 1)),
+               threading.Thread(target=transfer, args=("heavy", 3))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert 2 <= received["heavy"] / received["light"] <= 4.5
+    # Together no faster than the cap, plus the first second's burst.
+    assert sum(received.values()) <= 2 * 1024 * 1024 * 1.8 + 64 * 1024
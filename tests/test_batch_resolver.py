@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pytest
+from pytube import exceptions
+
+from batch_resolver import AGE_GATE_REASON, PRIVATE_REASON, BatchResolver
+
+VIDEO_ID = "aBcDeFgHiJk"
+DETAILS = {"videoId": VIDEO_ID, "title": "Canned", "lengthSeconds": "10"}
+STREAMS = {"formats": [{"itag": 18, "mimeType": 'video/mp4; codecs="avc1"', "bitrate": 1000,
+                        "url": "https://example.com/v?expire=1&sig=x"}]}
+
+
+def status(status, reason=None, **response):
+    playability = {"status": status}
+    if reason:
+        playability["reason"] = reason
+    return dict(response, playabilityStatus=playability)
+
+
+def resolver(response, embed_response, **kwargs):
+    resolver = BatchResolver(manifest_cache=None, **kwargs)
+    resolver.innertube.player = lambda video_id: response
+    resolver.embed_innertube.player = lambda video_id: embed_response
+    return resolver
+
+
+@pytest.mark.parametrize("response, embed_response, error", [
+    (status("LOGIN_REQUIRED", PRIVATE_REASON), status("LOGIN_REQUIRED", PRIVATE_REASON),
+     exceptions.VideoPrivate),
+    (status("LOGIN_REQUIRED", AGE_GATE_REASON), status("LOGIN_REQUIRED", AGE_GATE_REASON),
+     exceptions.AgeRestrictedError),
+    (status("LOGIN_REQUIRED"), status("UNPLAYABLE"), exceptions.AgeRestrictedError),
+    (status("ERROR", "Video unavailable"), status("ERROR", "Video unavailable"),
+     exceptions.VideoUnavailable),
+])
+def test_unplayable_responses_raise_like_pytube(response, embed_response, error):
+    with pytest.raises(error):
+        resolver(response, embed_response).resolve_one(VIDEO_ID)
+    # resolve() keeps going and reports the error per video.
+    assert isinstance(resolver(response, embed_response).resolve([VIDEO_ID])[0].error, error)
+
+
+def test_age_gate_falls_back_to_embedded_player():
+    embed_response = status("OK", videoDetails=DETAILS, streamingData=STREAMS)
+    video = resolver(status("LOGIN_REQUIRED", AGE_GATE_REASON), embed_response).resolve_one(VIDEO_ID)
+    assert video.title == "Canned"
+    assert video.streams.get_by_itag(18) is not None
+
+
+def test_details_of_unplayable_video():
+    response = status("LOGIN_REQUIRED", AGE_GATE_REASON, videoDetails=DETAILS,
+                      captions={"playerCaptionsTracklistRenderer": {"captionTracks": []}})
+    video = resolver(response, status("UNPLAYABLE")).resolve_player(VIDEO_ID, require_streams=False)
+    assert video.title == "Canned"
+    with pytest.raises(exceptions.AgeRestrictedError):
+        resolver(response, status("UNPLAYABLE")).resolve_player(VIDEO_ID)
+
+
+def test_resolve_one_is_bounded_by_workers():
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def player(video_id):
+        with lock:
+            running.append(video_id)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.remove(video_id)
+        return status("OK", videoDetails=DETAILS, streamingData=STREAMS)
+
+    batch = resolver(None, None, workers=2)
+    batch.innertube.player = player
+    threads = [threading.Thread(target=batch.resolve_one, args=(VIDEO_ID,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(peak) == 2
@@ -0,0 +1,75 @@
+import io
+import json
+
+import pytest
+
+import captions_bulk
+from captions_bulk import SrtWriter, VttWriter, convert, download_track, format_timestamp, track_url
+
+JSON3 = json.dumps({"wireMagic": "pb3", "events": [
+    {"tStartMs": 0, "dDurationMs": 1500, "segs": [{"utf8": "Hello "}, {"utf8": "world"}]},
+    {"tStartMs": 1500, "dDurationMs": 10},
+    {"tStartMs": 3890, "dDurationMs": 2000, "segs": [{"utf8": "A < B & C\n\nnext"}]},
+    {"tStartMs": 7000, "dDurationMs": 500, "segs": [{"utf8": "\n"}]},
+]}).encode()
+
+SRV3 = ('<?xml version="1.0" encoding="utf-8" ?><timedtext format="3"><body>'
+        '<p t="0" d="1500"><s>Hello </s><s>world</s></p>'
+        '<p t="3890" d="2000">A &lt; B &amp; C\n\nnext</p>'
+        '</body></timedtext>').encode()
+
+SRT = "1\n00:00:00,000 --> 00:00:01,500\nHello world\n\n2\n00:00:03,890 --> 00:00:05,890\nA < B & C\nnext\n\n"
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("source, data", [("json3", JSON3), ("srv3", SRV3)])
+@pytest.mark.parametrize("chunk_size", [1, 7, 1 << 20])
+def test_cues_are_parsed_as_they_arrive(source, data, chunk_size):
+    srt, vtt = io.StringIO(), io.StringIO()
+    assert convert(chunked(data, chunk_size), [SrtWriter(srt), VttWriter(vtt)], source) == 2
+    assert srt.getvalue() == SRT
+    assert vtt.getvalue().startswith("WEBVTT\n\n00:00:00.000 --> 00:00:01.500\nHello world\n\n")
+    assert "A &lt; B &amp; C\nnext" in vtt.getvalue()
+
+
+def test_truncated_json3_is_an_error():
+    with pytest.raises(ValueError):
+        convert([JSON3[:-10]], [SrtWriter(io.StringIO())])
+
+
+def test_track_url_and_timestamps():
+    assert track_url("https://www.youtube.com/api/timedtext?v=x&fmt=srv1&lang=en", "json3") == \
+        "https://www.youtube.com/api/timedtext?v=x&lang=en&fmt=json3"
+    assert format_timestamp(3_723_004) == "01:02:03,004"
+    assert format_timestamp(5, ".") == "00:00:00.005"
+
+
+class Caption:
+    code = "en"
+    url = "https://www.youtube.com/api/timedtext?v=x&lang=en"
+
+
+def test_download_track_writes_every_format_from_one_fetch(tmp_path, monkeypatch):
+    fetched = []
+
+    def execute_request(url, *args, **kwargs):
+        fetched.append(url)
+        return io.BytesIO(JSON3)
+
+    monkeypatch.setattr(captions_bulk.request, "_execute_request", execute_request)
+    paths = download_track(Caption(), str(tmp_path / "video (en)"), ("srt", "vtt"))
+    assert len(fetched) == 1
+    with open(paths["srt"], encoding="utf-8") as f:
+        assert f.read() == SRT
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["video (en).srt", "video (en).vtt"]
+
+
+def test_failed_track_leaves_no_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(captions_bulk.request, "_execute_request",
+                        lambda url, *args, **kwargs: io.BytesIO(JSON3[:-10]))
+    with pytest.raises(ValueError):
+        download_track(Caption(), str(tmp_path / "video (en)"), ("srt", "vtt"))
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,63 @@
+import pytest
+from pytube import Stream, StreamQuery
+
+from compact_streams import CompactStream, IndexedStreamQuery
+
+FORMATS = [
+    (18, 'video/mp4; codecs="avc1.42001E, mp4a.40.2"'),
+    (22, 'video/mp4; codecs="avc1.64001F, mp4a.40.2"'),
+    (137, 'video/mp4; codecs="avc1.640028"'),
+    (248, 'video/webm; codecs="vp9"'),
+    (136, 'video/mp4; codecs="avc1.4d401f"'),
+    (247, 'video/webm; codecs="vp9"'),
+    (139, 'audio/mp4; codecs="mp4a.40.5"'),
+    (140, 'audio/mp4; codecs="mp4a.40.2"'),
+    (249, 'audio/webm; codecs="opus"'),
+    (251, 'audio/webm; codecs="opus"'),
+]
+
+
+def manifest():
+    return [{"url": f"https://example.invalid/{itag}", "itag": itag, "mimeType": mime_type,
+             "is_otf": False, "bitrate": 1000, "contentLength": "1000"}
+            for itag, mime_type in FORMATS]
+
+
+@pytest.fixture
+def queries():
+    return (StreamQuery([Stream(stream, None) for stream in manifest()]),
+            IndexedStreamQuery([CompactStream(stream, None) for stream in manifest()]))
+
+
+def itags(query):
+    return [stream.itag for stream in query]
+
+
+@pytest.mark.parametrize("kwargs", [
+    {}, {"progressive": True}, {"adaptive": True}, {"only_audio": True}, {"only_video": True},
+    {"subtype": "webm"}, {"file_extension": "mp4"}, {"type": "audio"},
+    {"mime_type": "video/webm"}, {"only_audio": True, "subtype": "webm"},
+    {"adaptive": True, "only_video": True, "subtype": "mp4"}, {"res": "720p"},
+    {"resolution": ["720p", "1080p"]}, {"progressive": True, "subtype": "webm"},
+])
+def test_filter_matches_pytube(queries, kwargs):
+    stock, indexed = queries
+    assert itags(indexed.filter(**kwargs)) == itags(stock.filter(**kwargs))
+
+
+def test_lookups_match_pytube(queries):
+    stock, indexed = queries
+    for itag, _ in FORMATS:
+        assert indexed.get_by_itag(str(itag)).itag == stock.get_by_itag(itag).itag
+    assert indexed.get_by_itag(999) is None
+    for subtype in ("mp4", "webm", "ogg"):
+        assert (getattr(indexed.get_audio_only(subtype), "itag", None)
+                == getattr(stock.get_audio_only(subtype), "itag", None))
+    assert indexed.get_by_resolution("720p").itag == stock.get_by_resolution("720p").itag
+    assert indexed.get_highest_resolution().itag == stock.get_highest_resolution().itag
+    assert indexed.get_lowest_resolution().itag == stock.get_lowest_resolution().itag
+
+
+def test_filters_are_memoized(queries):
+    _, indexed = queries
+    assert indexed.filter(only_audio=True) is indexed.filter(only_audio=True)
@@ -0,0 +1,14 @@
+from download_archive import DownloadArchive
+
+
+def test_entries_are_kept_per_video_and_format(tmp_path):
+    path = str(tmp_path / "archive.txt")
+    archive = DownloadArchive(path)
+    archive.add("https://www.youtube.com/watch?v=aBcDeFgHiJk", "highest")
+    archive.add("aBcDeFgHiJk", "highest")
+    assert archive.contains("https://youtu.be/aBcDeFgHiJk", "highest")
+    assert not archive.contains("aBcDeFgHiJk", "1080p")
+
+    reloaded = DownloadArchive(path)
+    assert len(reloaded) == 1
+    assert reloaded.contains("aBcDeFgHiJk", "highest")
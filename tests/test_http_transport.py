@@ -0,0 +1,45 @@
+from benchmark import media_chunks
+from http_transport import PooledTransport
+
+
+def media_url(stub, size, **params):
+    query = "".join(f"&{key}={value}" for key, value in params.items())
+    return f"{stub.base_url}/videoplayback?id=test&clen={size}{query}"
+
+
+def idle_connections(transport, url):
+    return transport.pool.connection_from_url(url).pool.qsize()
+
+
+def test_follows_redirects(stub):
+    transport = PooledTransport()
+    response = transport.execute_request(media_url(stub, 1000, redirect=1))
+
+    assert response.getcode() == 200
+    assert response.read() == b"".join(media_chunks(0, 999))
+    assert "redirect" not in response.url
+
+
+def test_releases_connection_once_read(stub):
+    transport = PooledTransport(connections_per_host=1)
+    url = media_url(stub, 100 * 1024)
+    response = transport.execute_request(url)
+    assert idle_connections(transport, url) == 0
+
+    while response.read(16 * 1024):
+        pass
+    # Still referenced, so only an explicit release can have returned it.
+    assert idle_connections(transport, url) == 1
+    assert response.read() == b""
+
+
+def test_releases_connection_on_close(stub):
+    transport = PooledTransport(connections_per_host=1)
+    url = media_url(stub, 100 * 1024)
+    response = transport.execute_request(url)
+    response.read(1024)
+    response.close()
+
+    assert idle_connections(transport, url) == 1
+    # The pool (one connection) isn't exhausted: a second request goes through.
+    assert len(transport.execute_request(url).read()) == 100 * 1024
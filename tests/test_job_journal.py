@@ -0,0 +1,75 @@
+from collections import namedtuple
+
+import pytest
+
+from benchmark import media_chunks
+from job_journal import DONE, FAILED, PAUSED, JobJournal, is_expired, url_expiry
+from segmented_download import SegmentedDownloader
+
+SIZE = 1024 * 1024 + 123
+SEGMENT_SIZE = 256 * 1024
+Stream = namedtuple("Stream", "itag url is_otf")
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = JobJournal(str(tmp_path / "jobs.sqlite3"))
+    yield journal
+    journal.close()
+
+
+def stream(itag=18, expire=2_000_000_000):
+    return Stream(itag, f"https://host/videoplayback?id=x&expire={expire}", False)
+
+
+def test_run_records_the_outcome(journal):
+    journal.run("https://youtu.be/a", stream(), "/tmp/a.mp4", lambda stream, path: True)
+    journal.run("https://youtu.be/b", stream(), "/tmp/b.mp4", lambda stream, path: False)
+    with pytest.raises(OSError):
+        journal.run("https://youtu.be/c", stream(), "/tmp/c.mp4", lambda stream, path: open("/nonexistent/x"))
+    assert journal.get("/tmp/a.mp4").status == DONE
+    assert journal.get("/tmp/c.mp4").status == FAILED
+    assert [(job.path, job.status) for job in journal.unfinished()] == [("/tmp/b.mp4", PAUSED)]
+
+
+def test_another_stream_at_the_same_path_starts_over(journal):
+    journal.start("https://youtu.be/a", stream(18), "/tmp/a.mp4")
+    journal.save("/tmp/a.mp4", 100, 10, {0: 10})
+    journal.start("https://youtu.be/a", stream(18), "/tmp/a.mp4")
+    assert journal.load("/tmp/a.mp4", 100, 10) == {0: 10}
+    journal.start("https://youtu.be/a", stream(22), "/tmp/a.mp4")
+    assert journal.load("/tmp/a.mp4", 100, 10) == {}
+
+
+def test_expiry():
+    assert url_expiry(stream(expire=1234).url) == 1234
+    assert url_expiry("https://host/videoplayback?id=x") is None
+    journal = JobJournal(":memory:")
+    journal.start("https://youtu.be/a", stream(expire=1000), "a")
+    assert is_expired(journal.get("a"), now=900)
+    assert not is_expired(journal.get("a"), now=100)
+
+
+def test_interrupted_download_resumes_after_a_restart(stub, tmp_path):
+    url = f"{stub.base_url}/videoplayback?id=journal&clen={SIZE}"
+    path = str(tmp_path / "video.mp4")
+    received = []
+    journal = JobJournal(str(tmp_path / "jobs.sqlite3"))
+    stopped = SegmentedDownloader(connections=1, segment_size=SEGMENT_SIZE, state_store=journal,
+                                  on_progress=received.append,
+                                  should_stop=lambda: sum(received) >= 600 * 1024)
+    assert stopped.download(url, path, SIZE) is False
+    journal.close()
+
+    # A new process: the journal tells which ranges are on disk.
+    journal = JobJournal(str(tmp_path / "jobs.sqlite3"))
+    assert sum(journal.load(path, SIZE, SEGMENT_SIZE).values()) == sum(received)
+    stub.take_counts()
+    resumed = SegmentedDownloader(connections=1, segment_size=SEGMENT_SIZE, state_store=journal)
+    assert resumed.download(url, path, SIZE) is True
+    with open(path, "rb") as f:
+        assert f.read() == b"".join(media_chunks(0, SIZE - 1))
+    # Only the unfinished range and the ones after it.
+    assert stub.take_counts()["media"] == 3
+    assert journal.load(path, SIZE, SEGMENT_SIZE) == {}
+    journal.close()
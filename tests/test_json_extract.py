@@ -0,0 +1,39 @@
+import pytest
+from pytube import parser
+from pytube.exceptions import HTMLParseError
+
+import json_extract
+
+PAGES = [
+    'var ytInitialData = {"a": [1, 2, {"b": "}"}], "c": "\\"{"};</script>',
+    'x = {a: /[}{]\\//g, b: "x", c: [1, 2]}; trailing {',
+    'q = [1, {"k": [3, 4]}, "]"] + more',
+    'z = {a: 1 / 2, b: {c: 3}};',
+]
+
+
+@pytest.mark.parametrize("page", PAGES)
+def test_same_objects_as_pytube(page):
+    start = min(i for i in (page.find("{"), page.find("[")) if i >= 0)
+    assert (json_extract.find_object_from_startpoint(page, start)
+            == parser.find_object_from_startpoint(page, start))
+
+
+def test_plain_json_is_decoded_in_place():
+    page = PAGES[0]
+    start = page.index("{")
+    assert json_extract.parse_for_object_from_startpoint(page, start) == {"a": [1, 2, {"b": "}"}],
+                                                                          "c": '"{'}
+
+
+def test_parse_falls_back_to_the_scanner():
+    page = "var o = {'single': 'quotes', 'n': [1, 2]}; more"
+    assert json_extract.parse_for_object_from_startpoint(page, page.index("{")) == {
+        "single": "quotes", "n": [1, 2]}
+
+
+def test_invalid_start_point():
+    with pytest.raises(HTMLParseError):
+        json_extract.parse_for_object_from_startpoint("abc {}", 0)
+    with pytest.raises(HTMLParseError):
+        json_extract.find_object_from_startpoint("abc {}", 0)
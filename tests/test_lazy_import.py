@@ -0,0 +1,31 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from lazy_import import lazy_import
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_module_runs_on_first_use(tmp_path):
+    (tmp_path / "side_effect.py").write_text("print('executed')\nvalue = 1\n")
+    code = ("from lazy_import import lazy_import\n"
+            "module = lazy_import('side_effect')\n"
+            "print('imported')\n"
+            "print(module.value)\n")
+    # In a fresh interpreter, with the module next to the script.
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                         env={**os.environ, "PYTHONPATH": os.pathsep.join([str(tmp_path), ROOT])})
+    assert out.stdout.split() == ["imported", "executed", "1"]
+
+
+def test_imported_module_is_returned_as_it_is():
+    import json
+    assert lazy_import("json") is json
+
+
+def test_missing_module_raises_right_away():
+    with pytest.raises(ModuleNotFoundError):
+        lazy_import("no_such_module_here")
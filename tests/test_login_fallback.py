@@ -0,0 +1,23 @@
+import importlib.util
+import subprocess
+import sys
+
+import pytest
+
+from login_fallback import REGISTRY_MODULE, YouTubeExtractorRegistry
+
+
+def test_registry_serves_only_the_lazy_extractors_module():
+    registry = YouTubeExtractorRegistry()
+    assert registry.find_spec("youtube_dl.extractor.vimeo", None) is None
+    assert registry.find_spec(REGISTRY_MODULE, None).loader is registry
+
+
+@pytest.mark.skipif(importlib.util.find_spec("youtube_dl") is None, reason="youtube_dl is not installed")
+def test_only_the_youtube_extractors_are_imported():
+    code = ("import sys, login_fallback\n"
+            "login_fallback.import_youtube_dl()\n"
+            "print(sorted(m for m in sys.modules if m.startswith('youtube_dl.extractor.')))\n")
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert "youtube_dl.extractor.youtube" in out.stdout
+    assert "youtube_dl.extractor.vimeo" not in out.stdout
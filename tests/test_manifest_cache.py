@@ -0,0 +1,49 @@
+import time
+from urllib.error import HTTPError
+
+from manifest_cache import ManifestCache, is_forbidden, manifest_expiry
+
+VIDEO_DETAILS = {"videoId": "abc", "title": "Cached", "lengthSeconds": "42"}
+
+
+def manifest(expires):
+    return [{"url": f"https://host/videoplayback?itag=18&expire={expires}", "itag": 18,
+             "mimeType": 'video/mp4; codecs="avc1, mp4a"', "is_otf": False, "bitrate": 1,
+             "s": "dropped"}]
+
+
+def test_manifest_is_kept_across_processes(tmp_path):
+    expires = int(time.time()) + 3600
+    ManifestCache(cache_dir=str(tmp_path)).put("abc", "ANDROID", manifest(expires),
+                                               {"videoDetails": VIDEO_DETAILS, "streamingData": {}})
+    cached = ManifestCache(cache_dir=str(tmp_path)).get("abc", "ANDROID")
+    assert cached.title == "Cached" and cached.length == 42
+    assert "s" not in cached.streams[0]
+    assert "streamingData" not in cached.vid_info
+    assert ManifestCache(cache_dir=str(tmp_path)).get("abc", "WEB") is None
+
+
+def test_manifests_close_to_expiry_are_not_served():
+    cache = ManifestCache(cache_dir=None, expiry_margin=600)
+    cache.put("abc", "ANDROID", manifest(int(time.time()) + 300), {})
+    assert cache.get("abc", "ANDROID") is None
+    cache.put("abc", "ANDROID", manifest(int(time.time()) + 3600), {})
+    cache.invalidate("abc", "ANDROID")
+    assert cache.get("abc", "ANDROID") is None
+
+
+def test_expiry_is_the_first_url_to_expire():
+    assert manifest_expiry(manifest(200) + manifest(100)) == 100
+    assert manifest_expiry([{"url": "https://host/videoplayback?itag=18"}]) is None
+
+
+def test_forbidden_is_found_in_the_cause():
+    forbidden = HTTPError("https://host", 403, "Forbidden", {}, None)
+    try:
+        try:
+            raise forbidden
+        except HTTPError as e:
+            raise RuntimeError("range failed") from e
+    except RuntimeError as e:
+        assert is_forbidden(e)
+    assert not is_forbidden(HTTPError("https://host", 404, "Not Found", {}, None))
@@ -0,0 +1,39 @@
+import pytest
+
+from benchmark import GoogleVideoStub, media_chunks
+from otf_download import OTFDownloader
+
+SEGMENTS = 6
+SEGMENT_SIZE = 64 * 1024
+
+
+def expected_stream():
+    header = f"Segment-Count: {SEGMENTS}\r\nSequence-Number: 0\r\n\r\n".encode()
+    header += bytes(SEGMENT_SIZE - len(header))
+    return header + b"".join(media_chunks(SEGMENT_SIZE, (SEGMENTS + 1) * SEGMENT_SIZE - 1))
+
+
+def otf_url(stub):
+    return (f"{stub.base_url}/videoplayback?id=test&otf=1&segments={SEGMENTS}"
+            f"&segsize={SEGMENT_SIZE}")
+
+
+def test_segments_in_order(stub):
+    stub.take_counts()
+    assert b"".join(OTFDownloader().segments(otf_url(stub))) == expected_stream()
+    # The header and every segment once: no probing.
+    assert stub.take_counts()["media"] == SEGMENTS + 1
+
+
+@pytest.fixture
+def flaky_stub():
+    server = GoogleVideoStub(fail_rate=0.4).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_cut_off_segments_and_header_are_retried(flaky_stub):
+    downloader = OTFDownloader(max_retries=20)
+    assert b"".join(downloader.segments(otf_url(flaky_stub))) == expected_stream()
+    assert flaky_stub.take_counts()["media"] > SEGMENTS + 1
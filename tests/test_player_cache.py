@@ -0,0 +1,39 @@
+import os
+import time
+
+from benchmark import PLAYER_JS_PATH
+from player_cache import PlayerCache
+
+
+def test_player_is_fetched_and_parsed_once(routed, tmp_path):
+    js_url = f"https://www.youtube.com{PLAYER_JS_PATH}"
+    cache = PlayerCache(cache_dir=str(tmp_path))
+    assert cache.get_cipher(js_url).get_signature("0123456789") == "76543210"
+    assert cache.get_n_transform(js_url)("abcdef") == "fedcba"
+    assert routed.take_counts()["player"] == 1
+
+    # Another process reads the script and the plan from disk.
+    restarted = PlayerCache(cache_dir=str(tmp_path))
+    assert restarted.get_signature_transform(js_url)("0123456789") == "76543210"
+    assert routed.take_counts()["player"] == 0
+
+
+def test_invalidate_fetches_the_player_again(routed, tmp_path):
+    js_url = f"https://www.youtube.com{PLAYER_JS_PATH}"
+    cache = PlayerCache(cache_dir=str(tmp_path))
+    cache.get_js(js_url)
+    cache.invalidate(js_url)
+    cache.get_js(js_url)
+    assert routed.take_counts()["player"] == 2
+
+
+def test_evict_keeps_the_newest_players(tmp_path):
+    cache = PlayerCache(cache_dir=str(tmp_path), max_entries=2)
+    now = time.time()
+    paths = []
+    for i in range(4):
+        paths.append(cache._path(f"https://www.youtube.com/s/player/{i}/base.js", "js"))
+        cache._write(paths[-1], "js")
+        os.utime(paths[-1], (now - 100 + i, now - 100 + i))
+    cache.evict()
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(path) for path in paths[2:])
@@ -0,0 +1,66 @@
+import threading
+import time
+
+from playlist_pipeline import PlaylistPipeline
+
+
+class FakeVideo:
+    def __init__(self, video_url):
+        self.title = video_url
+        self.streams = self
+
+    def get_highest_resolution(self):
+        return self
+
+
+class FakeResolver:
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.resolved = 0
+
+    def resolve_one(self, video_url):
+        self.resolved += 1
+        time.sleep(self.delay)
+        return FakeVideo(video_url)
+
+
+def filename(index, video, stream):
+    return f"{index:02d}.mp4"
+
+
+def test_transfer_starts_while_the_listing_waits(tmp_path):
+    transferred = threading.Event()
+
+    def video_urls():
+        yield "first"
+        # Like PlaylistSync waiting for its next page.
+        assert transferred.wait(5), "the resolved item was not handed on"
+        yield "second"
+
+    def download_stream(stream, path):
+        transferred.set()
+        return True
+
+    results = PlaylistPipeline(resolver=FakeResolver(delay=0.05), filename=filename,
+                               download_stream=download_stream).run(video_urls(), str(tmp_path))
+    assert [result.completed for result in results] == [True, True]
+
+
+def test_items_in_flight_are_bounded(tmp_path):
+    resolver = FakeResolver()
+    lock = threading.Lock()
+    started = []
+    most_ahead = []
+
+    def download_stream(stream, path):
+        with lock:
+            started.append(path)
+            most_ahead.append(resolver.resolved - len(started))
+        return True
+
+    pipeline = PlaylistPipeline(resolve_workers=2, download_workers=1, resolver=resolver,
+                                filename=filename, download_stream=download_stream)
+    results = pipeline.run((f"video{n}" for n in range(200)), str(tmp_path))
+
+    assert all(result.completed for result in results)
+    assert max(most_ahead) <= 2 * 2
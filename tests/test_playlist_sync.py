@@ -0,0 +1,71 @@
+import itertools
+import json
+
+import pytest
+
+import playlist_sync
+import response_cache
+from playlist_sync import PlaylistSync
+
+
+class FakePlaylist:
+    """Pages of video IDs, with a new continuation token on every fetch like YouTube's."""
+
+    playlist_id = "PLtest"
+    last_updated = "today"
+    _tokens = itertools.count()
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.initial_data = {"page": 0}
+
+    @property
+    def length(self):
+        return sum(len(page) for page in self.pages)
+
+    def _extract_videos(self, raw_json):
+        page = json.loads(raw_json)["page"]
+        urls = [f"/watch?v={video_id}" for video_id in self.pages[page]]
+        more = page + 1 < len(self.pages)
+        return urls, f"{page + 1}:{next(self._tokens)}" if more else None
+
+    def _build_continuation_url(self, token):
+        return "https://www.youtube.com/youtubei/v1/browse", {}, {"page": int(token.split(":")[0])}
+
+
+@pytest.fixture
+def posts(monkeypatch):
+    posts = []
+
+    def post(url, extra_headers=None, data=None):
+        posts.append((data["page"], getattr(response_cache._local, "fresh", False)))
+        return json.dumps(data)
+
+    monkeypatch.setattr(playlist_sync.request, "post", post)
+    return posts
+
+
+def sync(pages, cache_dir):
+    syncer = PlaylistSync("https://www.youtube.com/playlist?list=PLtest", cache_dir=str(cache_dir))
+    syncer.playlist = FakePlaylist(pages)
+    return list(syncer.video_ids())
+
+
+def test_duplicates_keep_their_positions(posts, tmp_path):
+    assert sync([["a", "b"], ["a", "c"]], tmp_path) == ["a", "b", "a", "c"]
+
+
+def test_unchanged_playlist_is_not_fetched_again(posts, tmp_path):
+    pages = [["a", "b"], ["c", "d"], ["e"]]
+    sync(pages, tmp_path)
+    posts.clear()
+    # The first page comes with a new continuation token, but its videos are the same.
+    assert sync(pages, tmp_path) == ["a", "b", "c", "d", "e"]
+    assert posts == []
+
+
+def test_grown_playlist_refetches_its_last_page_fresh(posts, tmp_path):
+    sync([["a", "b"], ["c", "d"], ["e"]], tmp_path)
+    posts.clear()
+    assert sync([["a", "b"], ["c", "d"], ["e", "f"]], tmp_path) == ["a", "b", "c", "d", "e", "f"]
+    assert posts == [(2, True)]
@@ -0,0 +1,41 @@
+import threading
+
+from progress import ProgressSnapshot, ProgressTracker, format_eta
+
+
+def test_counts_from_many_threads_add_up():
+    tracker = ProgressTracker()
+    tracker.set_total("a", 4000 * 8)
+    tracker.set_total("b", 100)
+
+    def work():
+        for _ in range(1000):
+            tracker.add("a", 4)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    snapshot = tracker.snapshot()
+    assert snapshot.downloaded == 4000 * 8
+    assert snapshot.total == 4000 * 8 + 100
+    assert snapshot.transfers == 2
+
+
+def test_a_new_total_replaces_the_estimate():
+    tracker = ProgressTracker()
+    tracker.set_total("otf", 1000)
+    tracker.add("otf", 600)
+    tracker.set_total("otf", 600)
+    assert tracker.snapshot().percent == 100.0
+
+
+def test_percent_and_eta():
+    snapshot = ProgressSnapshot(downloaded=250, total=1000, rate=50, transfers=1)
+    assert snapshot.percent == 25.0
+    assert snapshot.eta == 15
+    assert ProgressSnapshot(0, 0, 0, 0).eta is None
+    assert format_eta(None) == "--:--"
+    assert format_eta(75) == "01:15"
+    assert format_eta(3725) == "1:02:05"
@@ -0,0 +1,35 @@
+from benchmark import VIDEO_ID
+from manifest_cache import ManifestCache
+from player_cache import PlayerCache
+from resolver import YouTube
+
+WATCH_URL = f"https://www.youtube.com/watch?v={VIDEO_ID}"
+
+
+def youtube(tmp_path):
+    return YouTube(WATCH_URL, player_cache=PlayerCache(str(tmp_path / "players")),
+                   manifest_cache=ManifestCache(str(tmp_path / "manifests")))
+
+
+def test_second_run_reads_details_and_streams_without_requests(routed, tmp_path):
+    first = youtube(tmp_path)
+    assert first.title == "Benchmark video"
+    assert first.streams.get_by_itag(18) is not None
+    assert routed.take_counts()["player_api"] == 1
+
+    # A new process, as on a re-run: title first, as v6 does, then the streams.
+    second = youtube(tmp_path)
+    assert second.title == "Benchmark video"
+    assert second.length == 600
+    assert second.author == "benchmark"
+    assert second.streams.get_by_itag(18).url == first.streams.get_by_itag(18).url
+    assert sum(routed.take_counts().values()) == 0
+
+
+def test_refresh_resolves_again(routed, tmp_path):
+    youtube(tmp_path).streams
+    video = youtube(tmp_path)
+    routed.take_counts()
+
+    assert video.refresh().get_by_itag(18) is not None
+    assert routed.take_counts()["player_api"] == 1
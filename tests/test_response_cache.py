@@ -0,0 +1,46 @@
+import response_cache
+from benchmark import VIDEO_ID
+from response_cache import ResponseCache, endpoint_of
+
+WATCH_URL = f"https://www.youtube.com/watch?v={VIDEO_ID}"
+
+
+def test_endpoints():
+    assert endpoint_of(WATCH_URL) == "watch"
+    assert endpoint_of("https://www.youtube.com/youtubei/v1/player?key=x") == "player"
+    assert endpoint_of("https://r1.googlevideo.com/videoplayback?id=x") is None
+
+
+def test_page_is_fetched_once(routed):
+    cache = ResponseCache(cache_dir=None)
+    assert cache.get(WATCH_URL) == cache.get(WATCH_URL)
+    assert routed.take_counts()["watch"] == 1
+
+
+def test_fresh_goes_to_youtube(routed):
+    cache = ResponseCache(cache_dir=None)
+    cache.get(WATCH_URL)
+    with response_cache.fresh():
+        cache.get(WATCH_URL)
+    cache.get(WATCH_URL)
+    assert routed.take_counts()["watch"] == 2
+
+
+def test_responses_survive_a_restart_on_disk(routed, tmp_path):
+    ResponseCache(cache_dir=str(tmp_path)).get(WATCH_URL)
+    ResponseCache(cache_dir=str(tmp_path)).get(WATCH_URL)
+    assert routed.take_counts()["watch"] == 1
+
+
+def test_playable_player_responses_are_cached(routed):
+    cache = ResponseCache(cache_dir=None)
+    url = "https://www.youtube.com/youtubei/v1/player?key=test"
+    assert cache.post(url, data={"videoId": VIDEO_ID}) == cache.post(url, data={"videoId": VIDEO_ID})
+    assert routed.take_counts()["player_api"] == 1
+
+
+def test_zero_ttl_turns_caching_off(routed):
+    cache = ResponseCache(cache_dir=None, ttls={"watch": 0})
+    cache.get(WATCH_URL)
+    cache.get(WATCH_URL)
+    assert routed.take_counts()["watch"] == 2
@@ -0,0 +1,40 @@
+from benchmark import media_chunks
+from segmented_download import SegmentedDownloader
+
+SIZE = 2 * 1024 * 1024 + 123
+
+
+def media_url(stub):
+    return f"{stub.base_url}/videoplayback?id=test&clen={SIZE}"
+
+
+def expected_media():
+    return b"".join(media_chunks(0, SIZE - 1))
+
+
+def test_download_in_ranges(stub, tmp_path):
+    path = tmp_path / "video.mp4"
+    stub.take_counts()
+    SegmentedDownloader(connections=4, segment_size=256 * 1024).download(media_url(stub), str(path))
+    assert path.read_bytes() == expected_media()
+    # A probe and one request per range.
+    assert stub.take_counts()["media"] == 1 + 9
+
+
+def test_stream_yields_ranges_in_order_and_throttles_before_reading(stub):
+    charged = []
+    downloader = SegmentedDownloader(connections=3, segment_size=256 * 1024)
+    data = b"".join(downloader.stream(media_url(stub), SIZE, throttle=charged.append))
+    assert data == expected_media()
+    # Charged once per read, for at least every byte that was read.
+    assert sum(charged) >= SIZE
+
+
+def test_stream_stops_early(stub):
+    charged = []
+    downloader = SegmentedDownloader(connections=3, segment_size=256 * 1024,
+                                     should_stop=lambda: bool(charged))
+    data = b"".join(downloader.stream(media_url(stub), SIZE, throttle=charged.append))
+    assert data == b""
+    # No more than the first read of each range in flight.
+    assert len(charged) <= 3
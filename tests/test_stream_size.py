@@ -0,0 +1,40 @@
+from benchmark import media_chunks
+from stream_size import SizeService, segment_url, size_from_headers
+from tests.test_otf_download import expected_stream, otf_url
+
+SIZE = 300 * 1024
+
+
+def media_url(stub):
+    return f"{stub.base_url}/videoplayback?id=size&clen={SIZE}"
+
+
+def test_size_from_headers():
+    assert size_from_headers({"Content-Range": "bytes 0-0/1234"}, 206) == 1234
+    assert size_from_headers({"Content-Length": "99"}, 200) == 99
+    assert size_from_headers({"Content-Range": "bytes 0-0/*", "Content-Length": "1"}, 206) is None
+
+
+def test_segment_url_sets_the_sequence_number():
+    assert segment_url("https://host/videoplayback?id=x&sq=3", 7) == "https://host/videoplayback?id=x&sq=7"
+
+
+def test_filesize_is_one_request_and_cached(routed):
+    service = SizeService()
+    assert service.filesize(media_url(routed)) == SIZE
+    assert service.filesize(media_url(routed)) == SIZE
+    assert routed.take_counts()["media"] == 1
+
+
+def test_seq_filesize_adds_up_the_segments(routed):
+    assert SizeService().seq_filesize(otf_url(routed)) == len(expected_stream())
+
+
+def test_stream_sizes_itself_from_the_first_window(routed, monkeypatch):
+    from pytube import request
+    monkeypatch.setattr(request, "default_range_size", 100 * 1024)
+    service = SizeService()
+    assert b"".join(service.stream(media_url(routed))) == b"".join(media_chunks(0, SIZE - 1))
+    assert service.cached(media_url(routed)) == SIZE
+    # Three windows and no probe.
+    assert routed.take_counts()["media"] == 3
@@ -0,0 +1,51 @@
+from urllib import parse
+
+import pytest
+
+import tracing
+from batch_resolver import BatchResolver
+from benchmark import VIDEO_ID, make_player_response
+from player_cache import PlayerCache
+
+
+class RecordingSink:
+    def __init__(self):
+        self.spans = []
+        self.counts = []
+
+    def on_span(self, span):
+        self.spans.append(span.name)
+
+    def on_count(self, name, value, labels):
+        self.counts.append((name, value, labels))
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def sink():
+    sink = RecordingSink()
+    tracing.install(tracing.Tracer([sink]))
+    yield sink
+    tracing.uninstall()
+
+
+def ciphered_response(base_url):
+    response = make_player_response(base_url, 1000, 1, 1000)
+    stream = response["streamingData"]["formats"][0]
+    url = stream.pop("url").replace("&sig=bench", "")
+    stream["signatureCipher"] = parse.urlencode({"s": "0123456789abcdef", "sp": "sig", "url": url})
+    response["streamingData"]["adaptiveFormats"] = []
+    return response
+
+
+def test_batch_signing_is_traced(routed, sink, tmp_path):
+    resolver = BatchResolver(manifest_cache=None, player_cache=PlayerCache(cache_dir=str(tmp_path)))
+    response = ciphered_response(routed.base_url)
+    resolver.innertube.player = lambda video_id: response
+
+    video = resolver.resolve_one(VIDEO_ID)
+
+    assert "sig=" in video.streams.get_by_itag(18).url
+    assert "apply_signature" in sink.spans
@@ -0,0 +1,57 @@
+import io
+
+from transfer import MIN_BLOCK_SIZE, best_block_size, copy_response, write_all
+
+
+class ShortWrites(io.BytesIO):
+    """A file that takes at most 1000 bytes per write, like an unbuffered pipe."""
+
+    def write(self, block):
+        return super().write(bytes(block[:1000]))
+
+
+def test_copy_response_copies_everything():
+    data = bytes(range(256)) * 4096
+    f = io.BytesIO()
+    progress = []
+    assert copy_response(io.BytesIO(data), f, on_progress=progress.append) == len(data)
+    assert f.getvalue() == data
+    assert sum(progress) == len(data)
+
+
+def test_copy_response_stops_at_the_limit():
+    f = io.BytesIO()
+    assert copy_response(io.BytesIO(bytes(1000)), f, limit=300, block_size=128) == 300
+    assert len(f.getvalue()) == 300
+
+
+def test_copy_response_throttles_before_each_read():
+    events = []
+
+    class Source(io.BytesIO):
+        def readinto(self, buffer):
+            events.append("read")
+            return super().readinto(buffer)
+
+    copy_response(Source(bytes(3 * MIN_BLOCK_SIZE)), io.BytesIO(),
+                  throttle=lambda n: events.append(n), max_block_size=MIN_BLOCK_SIZE)
+    assert events[:2] == [MIN_BLOCK_SIZE, "read"]
+    assert all(isinstance(event, int) for event in events[::2])
+
+
+def test_copy_response_stops_when_asked():
+    f = io.BytesIO()
+    assert copy_response(io.BytesIO(bytes(1000)), f, should_stop=lambda: True) == 0
+
+
+def test_write_all_retries_short_writes():
+    f = ShortWrites()
+    write_all(f, bytes(range(256)) * 10)
+    assert f.getvalue() == bytes(range(256)) * 10
+
+
+def test_best_block_size_follows_the_rate():
+    assert best_block_size(0, 1000) == 2000
+    assert best_block_size(1.0, 1000) == 1000
+    assert best_block_size(10.0, 1000) == 500
+    assert best_block_size(0, 4 * 1024 * 1024) == 4 * 1024 * 1024
@@ -0,0 +1,38 @@
+import random
+
+import pytest
+from pytube import cipher
+
+from benchmark import PLAYER_JS
+from n_transform import NTransform
+from signature_transform import SignatureTransform
+
+
+def test_n_transform_matches_a_fresh_cipher_for_every_input():
+    transform = NTransform.from_cipher(cipher.Cipher(js=PLAYER_JS))
+    for n in ("abcdef", "QRSTUVWXyz", "abcdef", "0123"):
+        # pytube's Cipher keeps the first answer, so each n gets its own.
+        assert transform(n) == cipher.Cipher(js=PLAYER_JS).calculate_n(list(n))
+
+
+def test_signature_transform_matches_the_cipher():
+    js_cipher = cipher.Cipher(js=PLAYER_JS)
+    transform = SignatureTransform.from_cipher(js_cipher)
+    for length in (1, 10, 87, 105):
+        signature = "".join(random.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789") for _ in range(length))
+        assert transform(signature) == js_cipher.get_signature(signature)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_compiled_plan_is_the_plan(seed):
+    rng = random.Random(seed)
+    steps = [(rng.choice((cipher.reverse, cipher.splice, cipher.swap)), rng.randrange(1, 5))
+             for _ in range(rng.randrange(1, 8))]
+    transform = SignatureTransform(steps)
+    for length in (41, 64, 100):
+        signature = [chr(0x100 + i) for i in range(length)]
+        expected = list(signature)
+        for function, argument in steps:
+            expected = function(expected, argument)
+        assert transform("".join(signature)) == "".join(expected)
+        assert [signature[i] for i in transform.permutation(length)] == expected
@@ -0,0 +1,393 @@
+"""Per-phase timings and counters for resolving and downloading videos.
+
+``Tracer`` records spans and counters and hands them to sinks such as
+``JsonLinesExporter`` and ``PrometheusExporter``. ``install()`` wraps the
+pytube phases; install it after ``http_transport``, ``stream_size`` and
+``otf_download`` so it wraps their versions of ``pytube.request``.
+"""
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+from urllib import parse
+
+import pytube
+from pytube import cipher, extract, innertube, request
+
+THROTTLED_RATE = 128 * 1024  # bytes per second; googlevideo throttles to about 50 KB/s
+THROTTLE_WINDOW = 5.0  # seconds of transfer before the rate is judged
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800)
+PROMETHEUS_PREFIX = "youtube_downloader"
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+
+
+class Span:
+    def __init__(self, tracer, name, labels, parent):
+        self.tracer = tracer
+        self.name = name
+        self.labels = labels
+        self.span_id = next(_span_ids)
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self.attributes = {}
+        self.error = None
+        self.start = None
+        self.duration = None
+        self._token = None
+
+    def set(self, key, value):
+        """Attach an attribute, e.g. a byte count, to the finished span."""
+        self.attributes[key] = value
+
+    def begin(self):
+        """Start the clock without making this the current span."""
+        self.start = time.time()
+        self._started = time.perf_counter()
+        return self
+
+    def end(self, exc=None):
+        self.duration = time.perf_counter() - self._started
+        if exc is not None:
+            self.error = f"{type(exc).__name__}: {exc}"
+        self.tracer.emit_span(self)
+
+    def child(self, name, **labels):
+        return Span(self.tracer, name, labels, self)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self.begin()
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self._token)
+        self.end(exc)
+
+    def to_dict(self):
+        return {"type": "span", "name": self.name, "trace_id": self.trace_id,
+                "span_id": self.span_id, "parent_id": self.parent_id, "start": self.start,
+                "duration": self.duration, "labels": self.labels,
+                "attributes": self.attributes, "error": self.error}
+
+
+class Tracer:
+    def __init__(self, sinks=()):
+        self.sinks = list(sinks)
+        self._lock = threading.Lock()
+
+    def add_sink(self, sink):
+        with self._lock:
+            self.sinks = self.sinks + [sink]
+
+    def remove_sink(self, sink):
+        with self._lock:
+            self.sinks = [s for s in self.sinks if s is not sink]
+
+    def span(self, name, **labels):
+        """Time a phase: ``with tracer.span("watch_html"): ...``.
+
+        Spans opened inside it on the same thread (or asyncio task) become
+        its children and share its ``trace_id``.
+        """
+        return Span(self, name, labels, _current_span.get())
+
+    def count(self, name, value=1, **labels):
+        for sink in self.sinks:
+            sink.on_count(name, value, labels)
+
+    def emit_span(self, span):
+        for sink in self.sinks:
+            sink.on_span(span)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+class JsonLinesExporter:
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def on_span(self, span):
+        self._write(span.to_dict())
+
+    def on_count(self, name, value, labels):
+        self._write({"type": "count", "name": name, "time": time.time(), "value": value,
+                     "labels": labels})
+
+    def _write(self, record):
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class PrometheusExporter:
+    """Aggregates spans and counters and renders them in the text format.
+
+    Every span is observed in ``<prefix>_phase_duration_seconds`` with a
+    ``phase`` label, failed spans also count in
+    ``<prefix>_phase_errors_total``. A counter ``name`` becomes
+    ``<prefix>_<name>_total``.
+    """
+
+    def __init__(self, path=None, prefix=PROMETHEUS_PREFIX, buckets=DURATION_BUCKETS):
+        self.path = path
+        self.prefix = prefix
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._errors = {}
+
+    def on_span(self, span):
+        key = _label_key(span.labels, phase=span.name)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if span.duration <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += span.duration
+            histogram[2] += 1
+            if span.error is not None:
+                self._errors[key] = self._errors.get(key, 0) + 1
+
+    def on_count(self, name, value, labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def render(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(b), s, c) for key, (b, s, c) in self._histograms.items()}
+            errors = dict(self._errors)
+
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            metric = f"{self.prefix}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for (counter, labels), value in sorted(counters.items()):
+                if counter == name:
+                    lines.append(f"{metric}{_format_labels(labels)} {value}")
+
+        metric = f"{self.prefix}_phase_duration_seconds"
+        if histograms:
+            lines.append(f"# TYPE {metric} histogram")
+        for labels, (buckets, total, observations) in sorted(histograms.items()):
+            for bound, cumulative in zip(self.buckets, buckets):
+                lines.append(f"{metric}_bucket{_format_labels(labels, le=bound)} {cumulative}")
+            lines.append(f"{metric}_bucket{_format_labels(labels, le='+Inf')} {observations}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {observations}")
+
+        metric = f"{self.prefix}_phase_errors_total"
+        if errors:
+            lines.append(f"# TYPE {metric} counter")
+        for labels, value in sorted(errors.items()):
+            lines.append(f"{metric}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path=None):
+        """Replace ``path`` with the current metrics in one rename."""
+        path = path or self.path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def close(self):
+        if self.path:
+            self.write()
+
+
+def _label_key(labels, **extra):
+    return tuple(sorted((key, str(value)) for key, value in {**labels, **extra}.items()))
+
+
+def _format_labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for _, value in items)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(items, escaped)) + "}"
+
+
+default_tracer = Tracer()
+
+
+def span(name, **labels):
+    return default_tracer.span(name, **labels)
+
+
+def count(name, value=1, **labels):
+    default_tracer.count(name, value, **labels)
+
+
+def host_kind(url):
+    """A low-cardinality label for the host of ``url``."""
+    host = parse.urlsplit(url).hostname or ""
+    if host.endswith("googlevideo.com"):
+        return "googlevideo"
+    if host.endswith("youtube.com") or host.endswith("youtubei.googleapis.com"):
+        return "youtube"
+    return "other"
+
+
+class TransferMeter:
+    """Counts a transfer's bytes and flags it once if it runs throttled."""
+
+    def __init__(self, tracer, kind):
+        self.tracer = tracer
+        self.kind = kind
+        self.transferred = 0
+        self.throttled = False
+        self._started = time.perf_counter()
+
+    def add(self, byte_count):
+        self.transferred += byte_count
+        if self.throttled:
+            return
+        elapsed = time.perf_counter() - self._started
+        if elapsed >= THROTTLE_WINDOW and self.transferred / elapsed < THROTTLED_RATE:
+            self.throttled = True
+            self.tracer.count("throttled_transfers", kind=self.kind)
+
+    def finish(self):
+        self.tracer.count("bytes", self.transferred, kind=self.kind)
+
+
+# Hooks into pytube.
+
+def _timed(function, name, tracer):
+    def timed(*args, **kwargs):
+        with tracer.span(name):
+            return function(*args, **kwargs)
+
+    timed.__wrapped__ = function
+    return timed
+
+
+def _timed_property(prop, name, cache_attribute, tracer):
+    # Only the call that fills the cache does the work worth timing.
+    def fget(self):
+        if getattr(self, cache_attribute, None):
+            return prop.fget(self)
+        with tracer.span(name):
+            return prop.fget(self)
+
+    return property(fget, prop.fset, prop.fdel, prop.__doc__)
+
+
+def _timed_request(execute_request, tracer):
+    def execute(url, *args, **kwargs):
+        labels = {"host": host_kind(url), "method": kwargs.get("method") or (args[:1] or ("GET",))[0]}
+        # ``urlopen`` returns once the headers are in, so this is the time to first byte.
+        with tracer.span("http_request", **labels) as current:
+            try:
+                response = execute_request(url, *args, **kwargs)
+            except Exception as e:
+                tracer.count("http_requests", status=getattr(e, "code", "error"), **labels)
+                raise
+            status = getattr(response, "status", None) or response.getcode()
+            current.set("status", status)
+        tracer.count("http_requests", status=status, **labels)
+        return response
+
+    execute.__wrapped__ = execute_request
+    return execute
+
+
+def _timed_stream(stream, name, tracer):
+    # A generator runs in its consumer's context, so its spans are not made
+    # current; they would otherwise adopt whatever the consumer does between chunks.
+    def timed(url, *args, **kwargs):
+        meter = TransferMeter(tracer, name)
+        current = tracer.span(name).begin()
+        error = None
+        try:
+            chunks = stream(url, *args, **kwargs)
+            first_byte = current.child("first_byte", kind=name).begin()
+            try:
+                chunk = next(chunks, None)
+            except Exception as e:
+                first_byte.end(e)
+                raise
+            first_byte.end()
+            while chunk is not None:
+                meter.add(len(chunk))
+                yield chunk
+                chunk = next(chunks, None)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            current.set("bytes", meter.transferred)
+            current.set("throttled", meter.throttled)
+            meter.finish()
+            current.end(error)
+
+    timed.__wrapped__ = stream
+    return timed
+
+
+_installed = {}
+
+
+def _phases():
+    """``(owner, attribute, span name, cache attribute for properties)`` of each phase."""
+    # resolver imports modules that import this one, so it is only looked up here.
+    import resolver
+
+    return (
+        (pytube.YouTube, "watch_html", "watch_html", "_watch_html"),
+        (pytube.YouTube, "vid_info", "vid_info", "_vid_info"),
+        (pytube.YouTube, "js", "js", "_js"),
+        (resolver.YouTube, "js", "js", "_js"),
+        (innertube.InnerTube, "player", "innertube_player", None),
+        (cipher.Cipher, "__init__", "cipher", None),
+        (extract, "apply_descrambler", "apply_descrambler", None),
+        (extract, "apply_signature", "apply_signature", None),
+        (resolver, "apply_signature", "apply_signature", None),
+    )
+
+
+def install(tracer=default_tracer):
+    """Wrap the resolve phases and ``pytube.request`` to report to ``tracer``."""
+    if _installed:
+        uninstall()
+    for owner, attribute, name, cache_attribute in _phases():
+        original = vars(owner)[attribute]
+        _installed[owner, attribute] = original
+        if cache_attribute:
+            wrapped = _timed_property(original, name, cache_attribute, tracer)
+        else:
+            wrapped = _timed(original, name, tracer)
+        setattr(owner, attribute, wrapped)
+
+    _installed[request, "_execute_request"] = request._execute_request
+    request._execute_request = _timed_request(request._execute_request, tracer)
+    _installed[request, "stream"] = request.stream
+    request.stream = _timed_stream(request.stream, "stream", tracer)
+    _installed[request, "seq_stream"] = request.seq_stream
+    request.seq_stream = _timed_stream(request.seq_stream, "seq_stream", tracer)
+
+
+def uninstall():
+    for (owner, attribute), original in _installed.items():
+        setattr(owner, attribute, original)
+    _installed.clear()
@@ -0,0 +1,81 @@
+"""Large block transfer loop shared by the downloaders.
+
+Reads go into one reusable buffer with ``readinto``, with the block size
+adapted to the measured rate like youtube-dl's ``best_block_size``.
+"""
+import time
+
+MIN_BLOCK_SIZE = 64 * 1024
+MAX_BLOCK_SIZE = 4 * 1024 * 1024  # 4 MB
+
+
+def best_block_size(elapsed_time, bytes_read, max_block_size=MAX_BLOCK_SIZE):
+    """Pick the next block size from how fast the last block arrived.
+
+    Args:
+        elapsed_time: Seconds spent reading the last block.
+        bytes_read: Size of the last block in bytes.
+        max_block_size: Upper bound for the returned size.
+    """
+    new_min = max(bytes_read / 2.0, 1.0)
+    new_max = min(max(bytes_read * 2.0, 1.0), max_block_size)
+    if elapsed_time < 0.001:
+        return int(new_max)
+    rate = bytes_read / elapsed_time
+    if rate > new_max:
+        return int(new_max)
+    if rate < new_min:
+        return int(new_min)
+    return int(rate)
+
+
+def copy_response(raw, f, on_progress=None, should_stop=None, limit=None,
+                  block_size=MIN_BLOCK_SIZE, max_block_size=MAX_BLOCK_SIZE, throttle=None):
+    """Copy a raw HTTP response body into an open file.
+
+    Args:
+        raw: A readable object with ``readinto``, e.g. a ``PooledResponse``
+            or ``response.raw`` of a streamed ``requests`` response.
+        f: The file to write to, ideally opened unbuffered (``buffering=0``)
+            so blocks are handed to the OS without another copy.
+        on_progress: Called with the size of every written block.
+        should_stop: Returns True when the copy should stop early.
+        limit: The most bytes to copy, or None to read until the end.
+        block_size: The size of the first read.
+        max_block_size: The size of the reusable buffer.
+        throttle: Called with the size of every read before it is made and
+            blocks while the bytes are not allowed yet, e.g.
+            ``BandwidthJob.acquire``.
+
+    Returns:
+        The number of bytes copied.
+    """
+    buffer = bytearray(max_block_size)
+    view = memoryview(buffer)
+    copied = 0
+    while limit is None or copied < limit:
+        if should_stop and should_stop():
+            break
+        want = min(block_size, max_block_size)
+        if limit is not None:
+            want = min(want, limit - copied)
+        if throttle:
+            throttle(want)
+        started = time.perf_counter()
+        n = raw.readinto(view[:want])
+        if not n:
+            break
+        elapsed = time.perf_counter() - started
+        write_all(f, view[:n])
+        copied += n
+        if on_progress:
+            on_progress(n)
+        block_size = max(best_block_size(elapsed, n, max_block_size), MIN_BLOCK_SIZE)
+    return copied
+
+
+def write_all(f, block):
+    """Write all of ``block``; unbuffered files may accept only part of it."""
+    written = f.write(block)
+    while written is not None and written < len(block):
+        written += f.write(block[written:])
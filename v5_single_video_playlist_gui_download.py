@@ -1,12 +1,15 @@
 import re
-import requests
-import pytube
 import tkinter as tk
 from tkinter import filedialog
 from tkinter import ttk
 import threading
 import os
-import urllib3
+from lazy_import import lazy_import
+from transfer import MIN_BLOCK_SIZE, copy_response
+
+# Imported on the first download, so the window opens right away.
+pytube = lazy_import("pytube")
+requests = lazy_import("requests")
 
 
 class DownloadManager:
@@ -17,7 +20,7 @@ class DownloadManager:
         self.stream = None
         self.bytes_downloaded = 0
         self.paused = False
-        self.chunk_size = 1024
+        self.chunk_size = MIN_BLOCK_SIZE
         self.progress_bar = progress_bar
         self.quality_var = quality_var
 
@@ -38,20 +41,26 @@ class DownloadManager:
                 video_stream = youtube.streams.get_highest_resolution()
 
                 response = requests.get(video_stream.url, stream=True)
+                # Let urllib3 undo any Content-Encoding, as iter_content would.
+                response.raw.decode_content = True
 
                 video_title_cleaned = re.sub(r'\W+', '-', youtube.title)
                 video_filename = f"{idx:02d} - {video_title_cleaned}.mp4"
                 video_path = os.path.join(playlist_directory, video_filename)
 
-                with open(video_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=self.chunk_size):
-                        if self.paused:
-                            return
+                total_size = response.headers.get('content-length', 0)
+
+                def on_progress(block_length):
+                    self.bytes_downloaded += block_length
+                    self.update_progress(total_size)
 
-                        if chunk:
-                            f.write(chunk)
-                            self.bytes_downloaded += len(chunk)
-                            self.update_progress(response.headers.get('content-length', 0))
+                with open(video_path, 'wb', buffering=0) as f:
+                    copy_response(response.raw, f, on_progress=on_progress,
+                                  should_stop=lambda: self.paused, block_size=self.chunk_size)
+                if self.paused:
+                    # Drop the connection instead of leaving the rest of the body unread.
+                    response.close()
+                    return
 
             self.progress_bar["value"] = 100
 
@@ -4,97 +4,243 @@ import os
 import tkinter as tk
 from tkinter import ttk
 from tkinter import filedialog
-import pytube
-import requests
+from bandwidth import BandwidthScheduler
+from job_journal import DONE, FAILED, PAUSED, RUNNING, JobJournal, is_expired
+from lazy_import import lazy_import
+from progress import ProgressTracker, TkProgressView
+
+# These pull in pytube, urllib3 and aiohttp; they load on first use, after the window is up.
+adaptive_mux = lazy_import("adaptive_mux")
+async_download = lazy_import("async_download")
+download_archive = lazy_import("download_archive")
+http_transport = lazy_import("http_transport")
+json_extract = lazy_import("json_extract")
+manifest_cache = lazy_import("manifest_cache")
+otf_download = lazy_import("otf_download")
+playlist_pipeline = lazy_import("playlist_pipeline")
+playlist_sync = lazy_import("playlist_sync")
+resolver = lazy_import("resolver")
+response_cache = lazy_import("response_cache")
+stream_size = lazy_import("stream_size")
+tracing = lazy_import("tracing")
+
+METRICS_INTERVAL_MS = 15000
 
 class DownloadManager:
     def __init__(self, progress_bar, quality_var, error_text_widget):
         self.video_url = None
         self.download_directory = None
         self.stream = None
-        self.bytes_downloaded = 0
+        self.progress = ProgressTracker()
         self.paused = False
-        self.chunk_size = 1024
+        self.connections = 4
+        self.resolve_workers = 8
+        self.download_workers = 2
+        # Jobs and their written ranges survive a crash or reboot.
+        self.journal = JobJournal()
+        # All transfers share one bandwidth cap; pausing parks them without disconnecting.
+        self.bandwidth = BandwidthScheduler()
+        self._archive = None
+        self._engine = None
+        self._lazy_lock = threading.Lock()
         self.progress_bar = progress_bar
         self.quality_var = quality_var
         self.error_text_widget = error_text_widget
 
+    @property
+    def archive(self):
+        # Videos already downloaded are skipped before they are resolved.
+        with self._lazy_lock:
+            if self._archive is None:
+                self._archive = download_archive.DownloadArchive()
+            return self._archive
+
+    @property
+    def engine(self):
+        # Every transfer of every video runs on one shared event loop,
+        # started (and aiohttp imported) by the first download.
+        with self._lazy_lock:
+            if self._engine is None:
+                manager = async_download.AsyncDownloadManager(connections=self.connections,
+                                                              state_store=self.journal,
+                                                              scheduler=self.bandwidth)
+                self._engine = async_download.SyncDownloadManager(manager)
+            return self._engine
 
     def ensure_directory_exists(self, directory):
         if not os.path.exists(directory):
             os.makedirs(directory)
 
     def download(self, url, is_playlist=False):
-        try:
-            if is_playlist:
-                playlist = pytube.Playlist(url)
-                playlist_name = re.sub(r'\W+', '-', playlist.title)
-                playlist_directory = os.path.join(self.download_directory, playlist_name)
-
-                self.ensure_directory_exists(playlist_directory)
-
-                for idx, video_url in enumerate(playlist.video_urls, start=1):
-                    youtube = pytube.YouTube(video_url)
-                    video_stream = youtube.streams.get_highest_resolution()
-
-                    response = requests.get(video_stream.url, stream=True)
-                    total_size = int(response.headers.get('content-length', 0))
-
-                    video_title_cleaned = re.sub(r'\W+', '-', youtube.title)
-                    video_filename = f"{idx:02d} - {video_title_cleaned}.mp4"
-                    video_path = os.path.join(playlist_directory, video_filename)
-
-                    with open(video_path, 'wb') as f:
-                        for chunk in response.iter_content(chunk_size=self.chunk_size):
-                            if self.paused:
-                                return
-
-                            if chunk:
-                                f.write(chunk)
-                                self.bytes_downloaded += len(chunk)
-                                self.update_progress(total_size)
-
-                self.progress_bar["value"] = 100
-            else:
-                youtube = pytube.YouTube(url)
-                video_stream = youtube.streams.get_highest_resolution()
-
-                response = requests.get(video_stream.url, stream=True)
-                total_size = int(response.headers.get('content-length', 0))
-
-                video_title_cleaned = re.sub(r'\W+', '-', youtube.title)
-                video_filename = f"{video_title_cleaned}.mp4"
-                video_path = os.path.join(self.download_directory, video_filename)
-
-                with open(video_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=self.chunk_size):
-                        if self.paused:
+        with tracing.span("download", kind="playlist" if is_playlist else "video"):
+            try:
+                if is_playlist:
+                    playlist = playlist_sync.PlaylistSync(url)
+                    playlist_name = re.sub(r'\W+', '-', playlist.title)
+                    playlist_directory = os.path.join(self.download_directory, playlist_name)
+
+                    self.ensure_directory_exists(playlist_directory)
+
+                    pipeline = playlist_pipeline.PlaylistPipeline(resolve_workers=self.resolve_workers,
+                                                                  download_workers=self.download_workers,
+                                                                  filename=self.playlist_filename,
+                                                                  download_stream=self.download_stream,
+                                                                  on_result=self.report_playlist_item,
+                                                                  should_stop=lambda: self.paused,
+                                                                  journal=self.journal,
+                                                                  archive=self.archive,
+                                                                  archive_format="highest")
+                    pipeline.run(playlist.video_urls(), playlist_directory)
+                else:
+                    archive_format = self.quality_var.get() if adaptive_mux.ffmpeg_available() else "highest"
+                    if self.archive.contains(url, archive_format):
+                        self.error_text_widget.insert(tk.END, f"Already downloaded: {url}\n")
+                        return
+
+                    youtube = resolver.YouTube(url)
+
+                    # Above 720p there are only adaptive tracks; mux them if ffmpeg is around.
+                    video_stream, audio_stream = adaptive_mux.select_adaptive(youtube.streams,
+                                                                               self.quality_var.get())
+                    adaptive = bool(video_stream and audio_stream and adaptive_mux.ffmpeg_available())
+                    # Archived under what is actually fetched: without a pair
+                    # of tracks that is the progressive stream.
+                    if not adaptive and archive_format != "highest":
+                        archive_format = "highest"
+                        if self.archive.contains(url, archive_format):
+                            self.error_text_widget.insert(tk.END, f"Already downloaded: {url}\n")
                             return
 
-                        if chunk:
-                            f.write(chunk)
-                            self.bytes_downloaded += len(chunk)
-                            self.update_progress(total_size)
-
-                self.progress_bar["value"] = 100
-                success_message = f"Download completed: {video_filename}\n"
-                self.error_text_widget.insert(tk.END, success_message)
-
+                    video_title_cleaned = re.sub(r'\W+', '-', youtube.title)
+                    extension = video_stream.subtype if adaptive else "mp4"
+                    video_filename = f"{video_title_cleaned}.{extension}"
+                    video_path = os.path.join(self.download_directory, video_filename)
+
+                    if adaptive:
+                        completed = self.download_adaptive_fresh(youtube, video_stream, audio_stream,
+                                                                 video_path)
+                    else:
+                        # A refused URL is resolved again and the transfer continues.
+                        download = lambda stream, path: youtube.download_fresh(
+                            stream, path, self.download_stream,
+                            on_refresh=lambda fresh, path: self.journal.update_url(path, fresh.url))
+                        completed = self.journal.run(url, youtube.streams.get_highest_resolution(),
+                                                     video_path, download)
+                    if not completed:
+                        return
+                    self.archive.add(url, archive_format)
+
+                    success_message = f"Download completed: {video_filename}\n"
+                    self.error_text_widget.insert(tk.END, success_message)
+
+            except Exception as e:
+                tracing.count("download_errors", kind="playlist" if is_playlist else "video")
+                error_message = f"Error during download: {str(e)}\n"
+                self.error_text_widget.insert(tk.END, error_message)
+
+    def playlist_filename(self, idx, video, video_stream):
+        video_title_cleaned = re.sub(r'\W+', '-', video.title)
+        return f"{idx:02d} - {video_title_cleaned}.mp4"
+
+    def report_playlist_item(self, result):
+        if result.skipped:
+            message = f"Already downloaded: {result.video_url}\n"
+        elif result.error:
+            message = f"Error downloading {result.video_url}: {result.error}\n"
+        elif result.completed:
+            message = f"Download completed: {os.path.basename(result.path)}\n"
+        else:
+            return
+        self.error_text_widget.insert(tk.END, message)
+
+    def download_stream(self, video_stream, video_path):
+        # Fetch the file as parallel byte ranges; returns False when paused.
+        total_size = stream_size.default_service.size_of(video_stream)
+        self.progress.set_total(video_path, total_size)
+        with tracing.span("transfer", kind="otf" if video_stream.is_otf else "range") as span:
+            meter = tracing.TransferMeter(tracing.default_tracer, "download")
+            try:
+                return self.engine.download_stream(video_stream, video_path,
+                                                   on_progress=lambda n: self.track(video_path, meter, n),
+                                                   should_stop=lambda: self.paused)
+            finally:
+                span.set("bytes", meter.transferred)
+                meter.finish()
+
+    def download_adaptive(self, video_stream, audio_stream, video_path):
+        # Both tracks stream into ffmpeg at once; returns False when paused.
+        total_size = sum(stream_size.default_service.size_of(stream)
+                         for stream in (video_stream, audio_stream))
+        self.progress.set_total(video_path, total_size)
+        with tracing.span("transfer", kind="adaptive") as span:
+            meter = tracing.TransferMeter(tracing.default_tracer, "download")
+            muxer = adaptive_mux.AdaptiveMuxer(on_progress=lambda n: self.track(video_path, meter, n),
+                                               should_stop=lambda: self.paused,
+                                               scheduler=self.bandwidth)
+            try:
+                return muxer.download(video_stream, audio_stream, video_path)
+            finally:
+                span.set("bytes", meter.transferred)
+                meter.finish()
+
+    def download_adaptive_fresh(self, youtube, video_stream, audio_stream, video_path):
+        try:
+            return self.download_adaptive(video_stream, audio_stream, video_path)
         except Exception as e:
-            error_message = f"Error during download: {str(e)}\n"
-            self.error_text_widget.insert(tk.END, error_message)
-
-    def update_progress(self, total_size):
-        total_size = int(total_size)  # Convert to integer
-        percent = (self.bytes_downloaded / total_size) * 100
-        self.progress_bar["value"] = percent
-        root.update_idletasks()
+            if not manifest_cache.is_forbidden(e):
+                raise
+        streams = youtube.refresh()
+        return self.download_adaptive(streams.get_by_itag(video_stream.itag),
+                                      streams.get_by_itag(audio_stream.itag), video_path)
+
+    def track(self, video_path, meter, byte_count):
+        self.progress.add(video_path, byte_count)
+        meter.add(byte_count)
+
+    def resume_interrupted(self):
+        # Pick up the jobs a killed or closed session left unfinished.
+        for job in self.journal.unfinished():
+            if self.paused:
+                return
+            try:
+                stream_url = job.stream_url
+                if is_expired(job):
+                    stream_url = resolver.YouTube(job.video_url).streams.get_by_itag(job.itag).url
+                    self.journal.update_url(job.path, stream_url)
+                self.journal.set_status(job.path, RUNNING)
+                completed = self.resume_job(job, stream_url)
+            except Exception as e:
+                self.journal.set_status(job.path, FAILED, str(e))
+                self.error_text_widget.insert(tk.END, f"Error resuming {job.path}: {str(e)}\n")
+                continue
+            self.journal.set_status(job.path, DONE if completed else PAUSED)
+            if completed:
+                self.error_text_widget.insert(tk.END, f"Download completed: {os.path.basename(job.path)}\n")
+
+    def resume_job(self, job, stream_url):
+        on_progress = lambda n: self.progress.add(job.path, n)
+        should_stop = lambda: self.paused
+        if job.is_otf:
+            # Sized from the header's segment count instead of probing every segment.
+            return self.engine.download_segments(
+                stream_url, job.path, on_progress, should_stop,
+                on_total=lambda size: self.progress.set_total(job.path, size))
+        total_size = stream_size.default_service.filesize(stream_url)
+        self.progress.set_total(job.path, total_size)
+        return self.engine.download(stream_url, job.path, total_size, on_progress, should_stop)
+
+    def start_resume(self):
+        self.paused = False
+        self.progress = ProgressTracker()
+        self.download_thread = threading.Thread(target=self.resume_interrupted)
+        self.download_thread.start()
+        self.show_loading_bar()
 
     def start_download(self, url, download_directory, is_playlist):
         self.video_url = url  # Store the video URL
         self.download_directory = download_directory
         self.paused = False
-        self.bytes_downloaded = 0
+        self.progress = ProgressTracker()
         self.download_thread = threading.Thread(target=self.download,
                                                 args=(self.video_url, is_playlist))
         self.download_thread.start()
@@ -117,26 +263,9 @@ class DownloadManager:
         loading_progress_bar.pack()
         loading_progress_bar.start()
 
-        self.update_labels(percentage_label, size_label, loading_window)
-
-        if not self.download_thread.is_alive():
-            loading_window.destroy()
-
-    def update_labels(self, percentage_label, size_label, loading_window):
-        if self.bytes_downloaded > 0 and self.stream:
-            total_size = self.stream.filesize
-            percent = (self.bytes_downloaded / total_size) * 100
-            downloaded_mb = self.bytes_downloaded / (1024 * 1024)
-            total_mb = total_size / (1024 * 1024)
-            remaining_mb = total_mb - downloaded_mb
-
-            percentage_label.config(text=f"{percent:.2f}%")
-            size_label.config(text=f"{downloaded_mb:.2f} MB / {total_mb:.2f} MB\nRemaining: {remaining_mb:.2f} MB")
-
-        if self.download_thread.is_alive():
-            root.after(500, self.update_labels, percentage_label, size_label, loading_window)
-        else:
-            loading_window.destroy()
+        # One Tk-side tick renders the progress for every running transfer.
+        view = TkProgressView(root, self.progress, self.progress_bar, percentage_label, size_label)
+        view.start(self.download_thread.is_alive, on_finished=loading_window.destroy)
 
 
 
@@ -151,16 +280,40 @@ def download():
     directory_entry.get(), is_playlist=is_playlist)
 
 
+def resume_interrupted():
+    download_manager.start_resume()
+
+
 def pause_resume():
-    if download_manager.paused:
-        download_manager.paused = False
+    if download_manager.bandwidth.paused:
+        download_manager.bandwidth.resume()
         pause_resume_button["text"] = "Pause"
     else:
-        download_manager.paused = True
+        download_manager.bandwidth.pause()
         pause_resume_button["text"] = "Resume"
 
 
 if __name__ == "__main__":
+    def install_patches():
+        # Runs once the window is up; this is what imports pytube and urllib3.
+        http_transport.install()
+        json_extract.install()
+        stream_size.install()
+        otf_download.install()
+        response_cache.install()
+        # Per-phase timings go to a JSON-lines trace and a Prometheus textfile.
+        metrics_directory = os.path.join(os.path.expanduser("~"), ".cache", "youtube_downloader")
+        metrics = tracing.PrometheusExporter(os.path.join(metrics_directory, "metrics.prom"))
+        trace = tracing.JsonLinesExporter(os.path.join(metrics_directory, "trace.jsonl"))
+        tracing.default_tracer.add_sink(trace)
+        tracing.default_tracer.add_sink(metrics)
+        tracing.install()
+        export_metrics(metrics)
+
+    def export_metrics(metrics):
+        metrics.write()
+        root.after(METRICS_INTERVAL_MS, export_metrics, metrics)
+
     def refresh():
         # Clear the error text widget
         error_text_widget.delete(1.0, tk.END)
@@ -175,6 +328,9 @@ if __name__ == "__main__":
         # Stop and join the download thread if it's still running
         if download_manager.download_thread.is_alive():
             download_manager.paused = True
+            # Parked transfers have to wake up to notice the stop.
+            download_manager.bandwidth.resume()
+            pause_resume_button["text"] = "Pause"
             download_manager.download_thread.join()
 
     root = tk.Tk()
@@ -208,6 +364,9 @@ if __name__ == "__main__":
     pause_resume_button = tk.Button(root, text="Pause", command=pause_resume)
     pause_resume_button.pack()
 
+    resume_interrupted_button = tk.Button(root, text="Resume Interrupted", command=resume_interrupted)
+    resume_interrupted_button.pack()
+
     progress_bar = ttk.Progressbar(root, orient="horizontal", length=300, mode="determinate")
     progress_bar.pack()
 
@@ -224,4 +383,10 @@ if __name__ == "__main__":
     error_text_widget.pack()
 
     download_manager = DownloadManager(progress_bar, quality_var, error_text_widget)
-    root.mainloop()
\ No newline at end of file
+    unfinished_jobs = download_manager.journal.unfinished()
+    if unfinished_jobs:
+        error_text_widget.insert(tk.END, f"{len(unfinished_jobs)} interrupted download(s), "
+                                         "press Resume Interrupted to continue\n")
+    root.after_idle(install_patches)
+    root.mainloop()
+    tracing.default_tracer.close()
\ No newline at end of file
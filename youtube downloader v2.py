@@ -1,6 +1,11 @@
 import os
 import re
-from pytube import Playlist, YouTube
+from pytube import YouTube
+import http_transport
+import otf_download
+from playlist_pipeline import PlaylistPipeline
+from playlist_sync import PlaylistSync
+import stream_size
 
 
 def download_youtube_video(video_url, download_directory, resolution):
@@ -35,33 +40,38 @@ def download_youtube_playlist(playlist_url, download_directory, resolution):
     resolution: The resolution of the videos to download.
     """
 
-    playlist = Playlist(playlist_url)
+    playlist = PlaylistSync(playlist_url)
     playlist_name = re.sub(r'\W+', '-', playlist.title)
     playlist_directory = os.path.join(download_directory, playlist_name)
 
     if not os.path.exists(playlist_directory):
         os.mkdir(playlist_directory)
 
-    for index, video_url in enumerate(playlist.video_urls, start=1):
-        youtube = YouTube(video_url)
-
+    def select_stream(streams):
         # Filter the streams based on the resolution.
-        video_streams = youtube.streams.filter(res=resolution, progressive=True)
+        video_streams = streams.filter(res=resolution, progressive=True)
 
         # If no streams at the specified resolution exist, get the highest resolution.
         if not video_streams:
-            video_stream = youtube.streams.get_highest_resolution()
-        else:
-            video_stream = video_streams.first()
+            return streams.get_highest_resolution()
+        return video_streams.first()
 
-        # Generate the filename.
-        video_filename = f"{index}. {video_stream.default_filename}"
+    def filename(index, video, video_stream):
+        return f"{index}. {video_stream.default_filename}"
 
-        # Download the video to the specified directory.
-        video_stream.download(playlist_directory, filename=video_filename)
+    # Resolve and download several videos at the same time.
+    pipeline = PlaylistPipeline(select_stream=select_stream, filename=filename)
+    for result in pipeline.run(playlist.video_urls(), playlist_directory):
+        if result.error:
+            print(f"An error occurred while downloading {result.video_url}: {result.error}")
 
 
 if __name__ == "__main__":
+    # Reuse keep-alive connections for every pytube request.
+    http_transport.install()
+    stream_size.install()
+    otf_download.install()
+
     option = input(
         "Do you want to download a single video or a playlist? Enter 'video' or 'playlist': ").strip().lower()
 